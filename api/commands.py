@@ -2,10 +2,13 @@ import base64
 import json
 import logging
 import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Optional
 
 import click
-from flask import current_app
+from flask import Flask, current_app
+from sqlalchemy import update
 from werkzeug.exceptions import NotFound
 
 from configs import dify_config
@@ -20,8 +23,7 @@ from libs.helper import email as email_validate
 from libs.password import hash_password, password_pattern, valid_password
 from libs.rsa import generate_key_pair
 from models.account import Tenant
-from models.dataset import Dataset, DatasetCollectionBinding, DocumentSegment
-from models.dataset import Document as DatasetDocument
+from models.dataset import Dataset, DatasetCollectionBinding, DatasetKeywordTable, Embedding
 from models.model import Account, App, AppAnnotationSetting, AppMode, Conversation, MessageAnnotation
 from models.provider import Provider, ProviderModel
 from services.account_service import RegisterService, TenantService
@@ -139,9 +141,11 @@ def reset_encrypt_key_pair():
 
 @click.command("vdb-migrate", help="migrate vector db.")
 @click.option("--scope", default="all", prompt=False, help="The scope of vector database to migrate, Default is All.")
-def vdb_migrate(scope: str):
+@click.option("--workers", default=4, type=click.IntRange(min=1), help="Number of datasets migrated in parallel.")
+@click.option("--batch-size", default=500, type=click.IntRange(min=1), help="Number of chunks written per upsert.")
+def vdb_migrate(scope: str, workers: int, batch_size: int):
     if scope in ["knowledge", "all"]:
-        migrate_knowledge_vector_database()
+        migrate_knowledge_vector_database(workers, batch_size)
     if scope in ["annotation", "all"]:
         migrate_annotation_vector_database()
 
@@ -250,192 +254,69 @@ def migrate_annotation_vector_database():
     )
 
 
-def migrate_knowledge_vector_database():
+def migrate_knowledge_vector_database(workers: int = 4, batch_size: int = 500):
     """
     Migrate vector database datas to target vector database .
     """
+    from core.rag.datasource.vdb.vector_migration import DatasetVectorMigration
+
     click.echo(click.style("Start migrate vector db.", fg="green"))
-    create_count = 0
-    skipped_count = 0
-    total_count = 0
     vector_type = dify_config.VECTOR_STORE
-    page = 1
-    while True:
-        try:
-            datasets = (
-                db.session.query(Dataset)
-                .filter(Dataset.indexing_technique == "high_quality")
-                .order_by(Dataset.created_at.desc())
-                .paginate(page=page, per_page=50)
-            )
-        except NotFound:
-            break
+    datasets = (
+        db.session.query(Dataset.id, Dataset.index_struct)
+        .filter(Dataset.indexing_technique == "high_quality")
+        .order_by(Dataset.created_at.desc())
+        .all()
+    )
+    dataset_ids = [
+        dataset.id
+        for dataset in datasets
+        if not dataset.index_struct or json.loads(dataset.index_struct)["type"] != vector_type
+    ]
+    skipped_count = len(datasets) - len(dataset_ids)
+    click.echo(f"Migrate {len(dataset_ids)} datasets with {workers} workers, skip {skipped_count} datasets.")
+
+    def migrate_dataset(flask_app: Flask, dataset_id: str):
+        with flask_app.app_context():
+            return DatasetVectorMigration(dataset_id, batch_size).run()
 
-        page += 1
-        for dataset in datasets:
-            total_count = total_count + 1
-            click.echo(
-                f"Processing the {total_count} dataset {dataset.id}. "
-                + f"{create_count} created, {skipped_count} skipped."
-            )
+    create_count = 0
+    failed_count = 0
+    total_chunks = 0
+    start_at = time.perf_counter()
+    flask_app = current_app._get_current_object()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(migrate_dataset, flask_app, dataset_id): dataset_id for dataset_id in dataset_ids}
+        for future in as_completed(futures):
+            dataset_id = futures[future]
             try:
-                click.echo("Create dataset vdb index: {}".format(dataset.id))
-                if dataset.index_struct_dict:
-                    if dataset.index_struct_dict["type"] == vector_type:
-                        skipped_count = skipped_count + 1
-                        continue
-                collection_name = ""
-                if vector_type == VectorType.WEAVIATE:
-                    dataset_id = dataset.id
-                    collection_name = Dataset.gen_collection_name_by_id(dataset_id)
-                    index_struct_dict = {"type": VectorType.WEAVIATE, "vector_store": {"class_prefix": collection_name}}
-                    dataset.index_struct = json.dumps(index_struct_dict)
-                elif vector_type == VectorType.QDRANT:
-                    if dataset.collection_binding_id:
-                        dataset_collection_binding = (
-                            db.session.query(DatasetCollectionBinding)
-                            .filter(DatasetCollectionBinding.id == dataset.collection_binding_id)
-                            .one_or_none()
-                        )
-                        if dataset_collection_binding:
-                            collection_name = dataset_collection_binding.collection_name
-                        else:
-                            raise ValueError("Dataset Collection Bindings is not exist!")
-                    else:
-                        dataset_id = dataset.id
-                        collection_name = Dataset.gen_collection_name_by_id(dataset_id)
-                    index_struct_dict = {"type": VectorType.QDRANT, "vector_store": {"class_prefix": collection_name}}
-                    dataset.index_struct = json.dumps(index_struct_dict)
-
-                elif vector_type == VectorType.MILVUS:
-                    dataset_id = dataset.id
-                    collection_name = Dataset.gen_collection_name_by_id(dataset_id)
-                    index_struct_dict = {"type": VectorType.MILVUS, "vector_store": {"class_prefix": collection_name}}
-                    dataset.index_struct = json.dumps(index_struct_dict)
-                elif vector_type == VectorType.RELYT:
-                    dataset_id = dataset.id
-                    collection_name = Dataset.gen_collection_name_by_id(dataset_id)
-                    index_struct_dict = {"type": "relyt", "vector_store": {"class_prefix": collection_name}}
-                    dataset.index_struct = json.dumps(index_struct_dict)
-                elif vector_type == VectorType.TENCENT:
-                    dataset_id = dataset.id
-                    collection_name = Dataset.gen_collection_name_by_id(dataset_id)
-                    index_struct_dict = {"type": VectorType.TENCENT, "vector_store": {"class_prefix": collection_name}}
-                    dataset.index_struct = json.dumps(index_struct_dict)
-                elif vector_type == VectorType.PGVECTOR:
-                    dataset_id = dataset.id
-                    collection_name = Dataset.gen_collection_name_by_id(dataset_id)
-                    index_struct_dict = {"type": VectorType.PGVECTOR, "vector_store": {"class_prefix": collection_name}}
-                    dataset.index_struct = json.dumps(index_struct_dict)
-                elif vector_type == VectorType.OPENSEARCH:
-                    dataset_id = dataset.id
-                    collection_name = Dataset.gen_collection_name_by_id(dataset_id)
-                    index_struct_dict = {
-                        "type": VectorType.OPENSEARCH,
-                        "vector_store": {"class_prefix": collection_name},
-                    }
-                    dataset.index_struct = json.dumps(index_struct_dict)
-                elif vector_type == VectorType.ANALYTICDB:
-                    dataset_id = dataset.id
-                    collection_name = Dataset.gen_collection_name_by_id(dataset_id)
-                    index_struct_dict = {
-                        "type": VectorType.ANALYTICDB,
-                        "vector_store": {"class_prefix": collection_name},
-                    }
-                    dataset.index_struct = json.dumps(index_struct_dict)
-                elif vector_type == VectorType.ELASTICSEARCH:
-                    dataset_id = dataset.id
-                    index_name = Dataset.gen_collection_name_by_id(dataset_id)
-                    index_struct_dict = {"type": "elasticsearch", "vector_store": {"class_prefix": index_name}}
-                    dataset.index_struct = json.dumps(index_struct_dict)
-                else:
-                    raise ValueError(f"Vector store {vector_type} is not supported.")
-
-                vector = Vector(dataset)
-                click.echo(f"Start to migrate dataset {dataset.id}.")
-
-                try:
-                    vector.delete()
-                    click.echo(
-                        click.style(
-                            f"Successfully delete vector index {collection_name} for dataset {dataset.id}.", fg="green"
-                        )
-                    )
-                except Exception as e:
-                    click.echo(
-                        click.style(
-                            f"Failed to delete vector index {collection_name} for dataset {dataset.id}.", fg="red"
-                        )
-                    )
-                    raise e
-
-                dataset_documents = (
-                    db.session.query(DatasetDocument)
-                    .filter(
-                        DatasetDocument.dataset_id == dataset.id,
-                        DatasetDocument.indexing_status == "completed",
-                        DatasetDocument.enabled == True,
-                        DatasetDocument.archived == False,
-                    )
-                    .all()
-                )
-
-                documents = []
-                segments_count = 0
-                for dataset_document in dataset_documents:
-                    segments = (
-                        db.session.query(DocumentSegment)
-                        .filter(
-                            DocumentSegment.document_id == dataset_document.id,
-                            DocumentSegment.status == "completed",
-                            DocumentSegment.enabled == True,
-                        )
-                        .all()
-                    )
-
-                    for segment in segments:
-                        document = Document(
-                            page_content=segment.content,
-                            metadata={
-                                "doc_id": segment.index_node_id,
-                                "doc_hash": segment.index_node_hash,
-                                "document_id": segment.document_id,
-                                "dataset_id": segment.dataset_id,
-                            },
-                        )
-
-                        documents.append(document)
-                        segments_count = segments_count + 1
-
-                if documents:
-                    try:
-                        click.echo(
-                            click.style(
-                                f"Start to created vector index with {len(documents)} documents of {segments_count} segments for dataset {dataset.id}.",
-                                fg="green",
-                            )
-                        )
-                        vector.create(documents)
-                        click.echo(
-                            click.style(f"Successfully created vector index for dataset {dataset.id}.", fg="green")
-                        )
-                    except Exception as e:
-                        click.echo(click.style(f"Failed to created vector index for dataset {dataset.id}.", fg="red"))
-                        raise e
-                db.session.add(dataset)
-                db.session.commit()
-                click.echo(f"Successfully migrated dataset {dataset.id}.")
-                create_count += 1
+                result = future.result()
             except Exception as e:
-                db.session.rollback()
+                failed_count += 1
                 click.echo(
-                    click.style("Create dataset index error: {} {}".format(e.__class__.__name__, str(e)), fg="red")
+                    click.style(
+                        "Migrate dataset {} error: {} {}".format(dataset_id, e.__class__.__name__, str(e)), fg="red"
+                    )
                 )
                 continue
 
+            create_count += 1
+            total_chunks += result.chunks
+            elapsed = time.perf_counter() - start_at
+            click.echo(
+                f"Successfully migrated dataset {dataset_id}: {result.chunks} chunks, {result.copied} copied, "
+                f"{result.embedded} embedded, {result.caught_up} written again after changing meanwhile, "
+                f"{result.deleted} deleted after their segments were removed meanwhile, "
+                f"{result.chunks / max(result.elapsed, 1e-6):.1f} chunks/s. "
+                f"{create_count + failed_count}/{len(dataset_ids)} datasets done, "
+                f"{total_chunks / max(elapsed, 1e-6):.1f} chunks/s overall."
+            )
+
     click.echo(
         click.style(
-            f"Congratulations! Create {create_count} dataset indexes, and skipped {skipped_count} datasets.", fg="green"
+            f"Congratulations! Create {create_count} dataset indexes, and skipped {skipped_count} datasets. "
+            f"{failed_count} datasets failed, run vdb-migrate again to resume them.",
+            fg="green",
         )
     )
 
@@ -557,6 +438,52 @@ def add_qdrant_doc_id_index(field: str):
     click.echo(click.style(f"Congratulations! Create {create_count} collection indexes.", fg="green"))
 
 
+@click.command("add-pgvector-indexes", help="Create the ANN and full text indexes of the pgvector collections.")
+@click.option(
+    "--rebuild-invalid",
+    is_flag=True,
+    default=False,
+    help="Drop and build again the indexes left invalid by a failed build, stop the workers first.",
+)
+def add_pgvector_indexes(rebuild_invalid: bool):
+    """
+    Create the indexes of every pgvector collection, whatever its size, the workers only create them
+    for collections growing past PGVECTOR_INDEX_MIN_ROWS.
+    """
+    click.echo(click.style("Start add pgvector indexes.", fg="green"))
+    if dify_config.VECTOR_STORE != VectorType.PGVECTOR:
+        click.echo(click.style("Sorry, only support pgvector vector store.", fg="red"))
+        return
+    from core.rag.datasource.vdb.pgvector.pgvector import PGVectorFactory
+
+    create_count = 0
+    page = 1
+    while True:
+        try:
+            datasets = (
+                db.session.query(Dataset)
+                .filter(Dataset.indexing_technique == "high_quality", Dataset.index_struct.isnot(None))
+                .order_by(Dataset.created_at.desc())
+                .paginate(page=page, per_page=50)
+            )
+        except NotFound:
+            break
+
+        page += 1
+        for dataset in datasets:
+            if dataset.index_struct_dict["type"] != VectorType.PGVECTOR:
+                continue
+            try:
+                vector = PGVectorFactory().init_vector(dataset, [], None)
+                vector.create_indexes(rebuild_invalid=rebuild_invalid)
+                create_count += 1
+                click.echo(f"Create indexes of dataset {dataset.id} successful.")
+            except Exception as e:
+                click.echo(click.style(f"Create indexes of dataset {dataset.id} failed, error: {e}", fg="red"))
+
+    click.echo(click.style(f"Congratulations! Create indexes of {create_count} collections.", fg="green"))
+
+
 @click.command("create-tenant", help="Create account and tenant.")
 @click.option("--email", prompt=True, help="The email address of the tenant account.")
 @click.option("--name", prompt=True, help="The workspace name of the tenant account.")
@@ -668,6 +595,120 @@ where sites.id is null limit 1000"""
     click.echo(click.style("Congratulations! Fix app related site missing issue successful!", fg="green"))
 
 
+@click.command("convert-embedding-cache", help="Rewrite cached embeddings in the compact binary format.")
+@click.option(
+    "--dtype",
+    default=None,
+    type=click.Choice(list(Embedding.COMPACT_DTYPES.keys())),
+    help="Vector dtype to store, Default is EMBEDDING_CACHE_DTYPE.",
+)
+@click.option("--batch-size", default=1000, prompt=False, help="Number of rows rewritten per transaction.")
+def convert_embedding_cache(dtype: Optional[str], batch_size: int):
+    """
+    Rewrite pickled rows of the embeddings table in the compact binary format.
+    """
+    dtype = dtype or dify_config.EMBEDDING_CACHE_DTYPE
+    click.echo(click.style(f"Start convert embedding cache to {dtype}.", fg="green"))
+
+    converted_count = 0
+    skipped_count = 0
+    saved_bytes = 0
+    last_id = None
+    while True:
+        query = db.session.query(Embedding.id, Embedding.embedding).order_by(Embedding.id)
+        if last_id is not None:
+            query = query.filter(Embedding.id > last_id)
+        rows = query.limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        updates = []
+        for row in rows:
+            if Embedding.is_compact_embedding(row.embedding):
+                skipped_count += 1
+                continue
+            try:
+                compact_embedding = Embedding.encode_embedding(Embedding.decode_embedding(row.embedding), dtype)
+            except Exception as e:
+                click.echo(click.style(f"Convert embedding {row.id} failed, error: {e}", fg="red"))
+                continue
+            saved_bytes += len(row.embedding) - len(compact_embedding)
+            updates.append({"id": row.id, "embedding": compact_embedding})
+
+        if updates:
+            db.session.execute(update(Embedding), updates)
+            db.session.commit()
+            converted_count += len(updates)
+        click.echo(f"Converted {converted_count} embeddings, skipped {skipped_count} compact embeddings.")
+
+    click.echo(
+        click.style(
+            f"Congratulations! Converted {converted_count} embeddings, saved {saved_bytes / 1024 / 1024:.2f} MB.",
+            fg="green",
+        )
+    )
+
+
+@click.command("migrate-keyword-store", help="Migrate dataset keyword tables to the inverted index keyword store.")
+def migrate_keyword_store():
+    """
+    Copy the postings of every legacy dataset keyword table into the jieba inverted index keyword store.
+    The legacy tables are kept until clean-legacy-keyword-tables runs.
+    """
+    from core.rag.datasource.keyword.jieba.jieba_inverted_index import JiebaInvertedIndex
+
+    click.echo(click.style("Start migrate keyword store.", fg="green"))
+    migrated_count = _for_each_legacy_keyword_table(
+        lambda dataset: JiebaInvertedIndex(dataset).migrate_keyword_table(), "Migrate"
+    )
+    click.echo(click.style(f"Congratulations! Migrated {migrated_count} dataset keyword tables.", fg="green"))
+
+
+@click.command(
+    "clean-legacy-keyword-tables",
+    help="Delete the legacy dataset keyword tables migrated to the inverted index keyword store.",
+)
+def clean_legacy_keyword_tables():
+    """
+    Delete the legacy keyword tables and files once the datasets no longer go back to the jieba keyword store,
+    tables not migrated yet are migrated first.
+    """
+    from core.rag.datasource.keyword.jieba.jieba_inverted_index import JiebaInvertedIndex
+
+    click.echo(click.style("Start clean legacy keyword tables.", fg="green"))
+    deleted_count = _for_each_legacy_keyword_table(
+        lambda dataset: JiebaInvertedIndex(dataset).delete_legacy_keyword_table(), "Clean"
+    )
+    click.echo(click.style(f"Congratulations! Deleted {deleted_count} dataset keyword tables.", fg="green"))
+
+
+def _for_each_legacy_keyword_table(handle, action: str) -> int:
+    handled_count = 0
+    last_dataset_id = None
+    while True:
+        query = db.session.query(DatasetKeywordTable.dataset_id)
+        if last_dataset_id:
+            query = query.filter(DatasetKeywordTable.dataset_id > last_dataset_id)
+        dataset_ids = [row.dataset_id for row in query.order_by(DatasetKeywordTable.dataset_id).limit(100).all()]
+        if not dataset_ids:
+            break
+        for dataset_id in dataset_ids:
+            dataset = db.session.query(Dataset).filter(Dataset.id == dataset_id).first()
+            try:
+                if not dataset:
+                    raise NotFound("Dataset not found.")
+                handle(dataset)
+                handled_count += 1
+                click.echo(f"{action} keyword table of dataset {dataset_id} successful.")
+            except Exception as e:
+                db.session.rollback()
+                click.echo(click.style(f"{action} keyword table of dataset {dataset_id} failed, error: {e}", fg="red"))
+        last_dataset_id = dataset_ids[-1]
+
+    return handled_count
+
+
 def register_commands(app):
     app.cli.add_command(reset_password)
     app.cli.add_command(reset_email)
@@ -675,6 +716,10 @@ def register_commands(app):
     app.cli.add_command(vdb_migrate)
     app.cli.add_command(convert_to_agent_apps)
     app.cli.add_command(add_qdrant_doc_id_index)
+    app.cli.add_command(add_pgvector_indexes)
     app.cli.add_command(create_tenant)
     app.cli.add_command(upgrade_db)
     app.cli.add_command(fix_app_site_missing)
+    app.cli.add_command(convert_embedding_cache)
+    app.cli.add_command(migrate_keyword_store)
+    app.cli.add_command(clean_legacy_keyword_tables)
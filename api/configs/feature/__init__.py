@@ -1,6 +1,15 @@
 from typing import Annotated, Optional
 
-from pydantic import AliasChoices, Field, HttpUrl, NegativeInt, NonNegativeInt, PositiveInt, computed_field
+from pydantic import (
+    AliasChoices,
+    Field,
+    HttpUrl,
+    NegativeInt,
+    NonNegativeFloat,
+    NonNegativeInt,
+    PositiveInt,
+    computed_field,
+)
 from pydantic_settings import BaseSettings
 
 from configs.feature.hosted_service import HostedServiceConfig
@@ -408,6 +417,23 @@ class ToolConfig(BaseSettings):
         default=3600,
     )
 
+    AGENT_PARALLEL_TOOL_CALLS_ENABLED: bool = Field(
+        description="whether function calling agents run the tool calls of one model turn concurrently",
+        default=False,
+    )
+
+    AGENT_PARALLEL_TOOL_CALLS_MAX_WORKERS: PositiveInt = Field(
+        description="max number of tool calls of one model turn running at the same time",
+        default=5,
+    )
+
+    AGENT_TOOL_CALL_TIMEOUT: NonNegativeFloat = Field(
+        description="timeout in seconds for each tool call run concurrently by an agent, a call that does not finish"
+        " in time is answered with an error and keeps running in the background without adding files to the answer."
+        " 0 means no timeout",
+        default=300,
+    )
+
 
 class MailConfig(BaseSettings):
     """
@@ -490,6 +516,31 @@ class RagEtlConfig(BaseSettings):
         default=None,
     )
 
+    EXTRACTED_TEXT_CACHE_ENABLED: bool = Field(
+        description="whether to cache the text extracted from uploaded files in the storage,"
+        " so every file is parsed once",
+        default=True,
+    )
+
+    EXTRACTED_TEXT_CACHE_MAX_SIZE: PositiveInt = Field(
+        description="max total size in bytes of the extracted text cache,"
+        " the least recently used entries are evicted above it",
+        default=2 * 1024 * 1024 * 1024,
+    )
+
+    PDF_EXTRACT_MAX_WORKERS: NonNegativeInt = Field(
+        description="max number of processes extracting the pages of one PDF file in parallel,"
+        " 0 extracts the pages in the calling process. It speeds up the extraction of large files,"
+        " all their pages are still held in memory before they are split",
+        default=0,
+    )
+
+    PDF_EXTRACT_PAGES_PER_TASK: PositiveInt = Field(
+        description="number of consecutive pages extracted by one task of the parallel PDF extraction,"
+        " smaller files are extracted in the calling process",
+        default=50,
+    )
+
 
 class DataSetConfig(BaseSettings):
     """
@@ -506,6 +557,60 @@ class DataSetConfig(BaseSettings):
         default=False,
     )
 
+    RETRIEVAL_MAX_WORKERS: PositiveInt = Field(
+        description="max number of threads per process for fanning out dataset retrieval and its search branches",
+        default=32,
+    )
+
+    RETRIEVAL_TIMEOUT: NonNegativeFloat = Field(
+        description="deadline in seconds for the retrieval branches of one request, slower branches are dropped"
+        " and the finished ones are returned. 0 means no deadline",
+        default=0,
+    )
+
+    EMBEDDING_CACHE_DTYPE: str = Field(
+        description="dtype of vectors written to the embedding cache table,"
+        " available values are `float32` and `float16`",
+        default="float32",
+    )
+
+    QUERY_EMBEDDING_LOCAL_CACHE_ENABLED: bool = Field(
+        description="whether to keep query embeddings in a per-process cache in front of Redis",
+        default=False,
+    )
+
+    QUERY_EMBEDDING_LOCAL_CACHE_CAPACITY: PositiveInt = Field(
+        description="max number of query embeddings in the per-process cache",
+        default=2000,
+    )
+
+    QUERY_EMBEDDING_LOCAL_CACHE_MAX_BYTES: PositiveInt = Field(
+        description="max total size in bytes of query embeddings in the per-process cache",
+        default=64 * 1024 * 1024,
+    )
+
+    QUERY_EMBEDDING_LOCAL_CACHE_TTL: PositiveInt = Field(
+        description="expiration time in seconds for query embeddings in the per-process cache",
+        default=300,
+    )
+
+    QUERY_EMBEDDING_TTL_REFRESH_BATCH_SIZE: PositiveInt = Field(
+        description="number of Redis TTL refreshes for locally cached query embeddings sent in one pipeline",
+        default=100,
+    )
+
+    DATASET_AVAILABLE_COUNT_CACHE_TTL: NonNegativeInt = Field(
+        description="expiration time in seconds for the cached available document and segment counts of a dataset,"
+        " 0 disables the cache",
+        default=300,
+    )
+
+    SEGMENT_HIT_COUNT_WRITE_BEHIND_ENABLED: bool = Field(
+        description="whether to accumulate segment hit counts in Redis and flush them to the database"
+        " periodically, requires the celery beat scheduler",
+        default=False,
+    )
+
 
 class WorkspaceConfig(BaseSettings):
     """
@@ -528,6 +633,38 @@ class IndexingConfig(BaseSettings):
         default=1000,
     )
 
+    INDEXING_EMBEDDING_MAX_IN_FLIGHT: PositiveInt = Field(
+        description="max number of embedding requests in flight per embedding provider in one process during indexing",
+        default=10,
+    )
+
+    INDEXING_EMBEDDING_RATE_LIMIT_MAX_RETRIES: NonNegativeInt = Field(
+        description="max number of retries with backoff of an embedding request that is rate limited during indexing",
+        default=5,
+    )
+
+    INDEXING_SPLIT_MAX_WORKERS: NonNegativeInt = Field(
+        description="max number of processes cleaning and splitting the documents of one indexing job in parallel,"
+        " 0 splits them in the calling process",
+        default=0,
+    )
+
+    INDEXING_SPLIT_MIN_DOCUMENTS: PositiveInt = Field(
+        description="min number of documents in an indexing job for splitting them in parallel",
+        default=16,
+    )
+
+    QA_GENERATION_MAX_CONCURRENCY_PER_TENANT: PositiveInt = Field(
+        description="max number of QA generation calls in flight per tenant in one process when indexing"
+        " documents in QA mode",
+        default=10,
+    )
+
+    QA_GENERATION_MAX_RETRIES: NonNegativeInt = Field(
+        description="max number of retries with backoff of a chunk whose QA generation failed",
+        default=2,
+    )
+
 
 class ImageFormatConfig(BaseSettings):
     MULTIMODAL_SEND_IMAGE_FORMAT: str = Field(
@@ -542,6 +679,11 @@ class CeleryBeatConfig(BaseSettings):
         default=1,
     )
 
+    SEGMENT_HIT_COUNT_FLUSH_INTERVAL: PositiveInt = Field(
+        description="interval in seconds between flushes of the pending segment hit counts",
+        default=60,
+    )
+
 
 class PositionConfig(BaseSettings):
     POSITION_PROVIDER_PINS: str = Field(
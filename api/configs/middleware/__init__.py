@@ -48,13 +48,36 @@ class VectorStoreConfig(BaseSettings):
         default=None,
     )
 
+    VECTOR_STORE_UPSERT_BATCH_SIZE: PositiveInt = Field(
+        description="number of documents written to the vector store per request by upsert,"
+        " and of ids checked per request for duplicates",
+        default=500,
+    )
+
+    VECTOR_CLIENT_IDLE_TIMEOUT: PositiveInt = Field(
+        description="seconds a pooled vector store client is kept after it was last used",
+        default=600,
+    )
+
+    VECTOR_CLIENT_HEALTH_CHECK_INTERVAL: NonNegativeInt = Field(
+        description="seconds between the health checks of a pooled vector store client, 0 to check on every use",
+        default=60,
+    )
+
 
 class KeywordStoreConfig(BaseSettings):
     KEYWORD_STORE: str = Field(
-        description="keyword store type",
+        description="keyword store type, default to `jieba`, available values are `jieba` and `jieba_inverted_index`.",
         default="jieba",
     )
 
+    KEYWORD_SEARCH_SCORE_METHOD: str = Field(
+        description="ranking of keyword search results, default to `keyword_count`,"
+        " available values are `keyword_count` and `bm25`. `bm25` also sets a normalized `keyword_score` on the results,"
+        " which weighted reranking of hybrid search uses as keyword score.",
+        default="keyword_count",
+    )
+
 
 class DatabaseConfig:
     DB_HOST: str = Field(
@@ -1,6 +1,6 @@
 from typing import Optional
 
-from pydantic import Field, PositiveInt
+from pydantic import Field, NonNegativeInt, PositiveInt
 from pydantic_settings import BaseSettings
 
 
@@ -33,3 +33,44 @@ class PGVectorConfig(BaseSettings):
         description="PGVector database",
         default=None,
     )
+
+    PGVECTOR_MAX_CONNECTION: PositiveInt = Field(
+        description="max number of connections of the PGVector connection pool shared by a process",
+        default=20,
+    )
+
+    PGVECTOR_INDEX_TYPE: str = Field(
+        description="ANN index of the pgvector collections, available values are `hnsw`, `ivfflat` and `none`",
+        default="hnsw",
+    )
+
+    PGVECTOR_INDEX_MIN_ROWS: NonNegativeInt = Field(
+        description="number of rows a collection reaches before its ANN and full text indexes are created,"
+        " in a task of the dataset queue, an exact scan is as fast below it",
+        default=10000,
+    )
+
+    PGVECTOR_HNSW_M: PositiveInt = Field(
+        description="max number of connections per layer of the HNSW index",
+        default=16,
+    )
+
+    PGVECTOR_HNSW_EF_CONSTRUCTION: PositiveInt = Field(
+        description="size of the candidate list when building the HNSW index",
+        default=64,
+    )
+
+    PGVECTOR_HNSW_EF_SEARCH: PositiveInt = Field(
+        description="default size of the candidate list when searching the HNSW index, higher is slower with better recall",
+        default=40,
+    )
+
+    PGVECTOR_IVFFLAT_LISTS: NonNegativeInt = Field(
+        description="number of lists of the IVFFlat index, 0 for rows / 1000 up to 1M rows and sqrt(rows) above",
+        default=0,
+    )
+
+    PGVECTOR_IVFFLAT_PROBES: PositiveInt = Field(
+        description="default number of lists searched in the IVFFlat index, higher is slower with better recall",
+        default=10,
+    )
@@ -23,6 +23,7 @@ from fields.conversation_fields import (
 from libs.helper import datetime_string
 from libs.login import login_required
 from models.model import AppMode, Conversation, EndUser, Message, MessageAnnotation
+from services.conversation_service import ConversationService
 
 
 class CompletionConversationApi(Resource):
@@ -91,6 +92,7 @@ class CompletionConversationApi(Resource):
         query = query.order_by(Conversation.created_at.desc())
 
         conversations = db.paginate(query, page=args["page"], per_page=args["limit"], error_out=False)
+        ConversationService.load_relations(conversations.items)
 
         return conversations
 
@@ -255,6 +257,7 @@ class ChatConversationApi(Resource):
                 query = query.order_by(Conversation.created_at.desc())
 
         conversations = db.paginate(query, page=args["page"], per_page=args["limit"], error_out=False)
+        ConversationService.load_relations(conversations.items)
 
         return conversations
 
@@ -106,6 +106,7 @@ class ChatMessageListApi(Resource):
                 has_more = True
 
         history_messages = list(reversed(history_messages))
+        MessageService.load_relations(history_messages)
 
         return InfiniteScrollPagination(data=history_messages, limit=args["limit"], has_more=has_more)
 
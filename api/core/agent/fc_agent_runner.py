@@ -1,9 +1,17 @@
+import contextvars
 import json
 import logging
+import threading
+import time
 from collections.abc import Generator
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from copy import deepcopy
-from typing import Any, Union
+from typing import Any, Optional, Union
 
+from flask import Flask, current_app
+
+from configs import dify_config
 from core.agent.base_agent_runner import BaseAgentRunner
 from core.app.apps.base_app_queue_manager import PublishFrom
 from core.app.entities.queue_entities import QueueAgentThoughtEvent, QueueMessageEndEvent, QueueMessageFileEvent
@@ -17,13 +25,30 @@ from core.model_runtime.entities.message_entities import (
     ToolPromptMessage,
     UserPromptMessage,
 )
+from core.ops.ops_trace_manager import TraceQueueManager
 from core.prompt.agent_history_prompt_transform import AgentHistoryPromptTransform
 from core.tools.entities.tool_entities import ToolInvokeMeta
+from core.tools.tool.tool import Tool
 from core.tools.tool_engine import ToolEngine
-from models.model import Message
+from extensions.ext_database import db
+from models.model import Message, MessageFile
 
 logger = logging.getLogger(__name__)
 
+# tool response, ids and variable names of the message files created by the tool, invoke meta
+ToolInvokeResult = tuple[str, list[tuple[str, str]], ToolInvokeMeta]
+
+
+class _PooledToolCall:
+    """
+    State shared by a tool call running in the pool and the thread waiting for its result
+    """
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.finished = False
+        self.timed_out = False
+
+
 class FunctionCallAgentRunner(BaseAgentRunner):
 
     def run(self, 
@@ -228,9 +253,10 @@ class FunctionCallAgentRunner(BaseAgentRunner):
 
             # call tools
             tool_responses = []
+            tool_invoke_results = self._invoke_tools(tool_instances, tool_calls, trace_manager)
             for tool_call_id, tool_call_name, tool_call_args in tool_calls:
-                tool_instance = tool_instances.get(tool_call_name)
-                if not tool_instance:
+                tool_invoke_result = next(tool_invoke_results)
+                if not tool_invoke_result:
                     tool_response = {
                         "tool_call_id": tool_call_id,
                         "tool_call_name": tool_call_name,
@@ -238,17 +264,7 @@ class FunctionCallAgentRunner(BaseAgentRunner):
                         "meta": ToolInvokeMeta.error_instance(f"there is not a tool named {tool_call_name}").to_dict()
                     }
                 else:
-                    # invoke tool
-                    tool_invoke_response, message_files, tool_invoke_meta = ToolEngine.agent_invoke(
-                        tool=tool_instance,
-                        tool_parameters=tool_call_args,
-                        user_id=self.user_id,
-                        tenant_id=self.tenant_id,
-                        message=self.message,
-                        invoke_from=self.application_generate_entity.invoke_from,
-                        agent_tool_callback=self.agent_callback,
-                        trace_manager=trace_manager,
-                    )
+                    tool_invoke_response, message_files, tool_invoke_meta = tool_invoke_result
                     # publish files
                     for message_file_id, save_as in message_files:
                         if save_as:
@@ -277,6 +293,7 @@ class FunctionCallAgentRunner(BaseAgentRunner):
                             name=tool_call_name,
                         )
                     ) 
+            tool_invoke_results.close()
 
             if len(tool_responses) > 0:
                 # save agent thought
@@ -376,6 +393,127 @@ class FunctionCallAgentRunner(BaseAgentRunner):
 
         return tool_calls
 
+    def _invoke_tools(self, tool_instances: dict[str, Tool],
+                      tool_calls: list[tuple[str, str, dict[str, Any]]],
+                      trace_manager: Optional[TraceQueueManager] = None
+                      ) -> Generator[Optional[ToolInvokeResult], None, None]:
+        """
+        Invoke the tool calls of a model turn, yield their results in the order of the calls,
+        None for a call of an unknown tool.
+
+        With parallel tool calls enabled, the calls of parallel safe tools start together on a pool bounded by
+        `AGENT_PARALLEL_TOOL_CALLS_MAX_WORKERS` and each of them is answered with an error when it does not finish
+        within `AGENT_TOOL_CALL_TIMEOUT` seconds. The other calls run one by one when their results are reached,
+        after the files of the calls before them are published.
+
+        Each call in the pool runs on its own fork of the tool instance, so calls of the same tool share no state.
+        A call that timed out keeps running in its thread until the tool returns: whatever the tool does on its own
+        side still happens and its tool files stay in the storage, but the message files it creates are deleted
+        and its result is dropped.
+        """
+        parallel_indexes = [
+            index for index, (_, tool_call_name, _) in enumerate(tool_calls)
+            if tool_call_name in tool_instances and tool_instances[tool_call_name].is_parallel_safe()
+        ]
+        if not dify_config.AGENT_PARALLEL_TOOL_CALLS_ENABLED or len(parallel_indexes) < 2:
+            parallel_indexes = []
+
+        futures: dict[int, Future] = {}
+        pooled_calls: dict[int, _PooledToolCall] = {}
+        executor = None
+        if parallel_indexes:
+            # worker threads use their own database sessions, they must not load the message from the session
+            # of this thread, which is committed and closed while they run
+            message = Message(id=self.message.id, conversation_id=self.message.conversation_id)
+            flask_app = current_app._get_current_object()
+            executor = ThreadPoolExecutor(
+                max_workers=min(len(parallel_indexes), dify_config.AGENT_PARALLEL_TOOL_CALLS_MAX_WORKERS),
+                thread_name_prefix='agent_tool_call'
+            )
+            for index in parallel_indexes:
+                _, tool_call_name, tool_call_args = tool_calls[index]
+                pooled_calls[index] = _PooledToolCall()
+                futures[index] = executor.submit(
+                    contextvars.copy_context().run, self._invoke_tool_in_app_context, flask_app,
+                    self._fork_tool(tool_instances[tool_call_name]), tool_call_args, message,
+                    pooled_calls[index], trace_manager
+                )
+        timeout = dify_config.AGENT_TOOL_CALL_TIMEOUT or None
+        deadline = time.monotonic() + timeout if timeout else None
+
+        try:
+            for index, (_, tool_call_name, tool_call_args) in enumerate(tool_calls):
+                if index in futures:
+                    yield self._wait_tool_call(futures[index], pooled_calls[index], tool_call_name, deadline)
+                elif tool_call_name in tool_instances:
+                    yield self._invoke_tool(tool_instances[tool_call_name], tool_call_args, self.message, trace_manager)
+                else:
+                    yield None
+        finally:
+            if executor:
+                # calls that timed out keep running in their threads, see _invoke_tool_in_app_context
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def _invoke_tool(self, tool_instance: Tool, tool_call_args: dict[str, Any], message: Message,
+                     trace_manager: Optional[TraceQueueManager] = None) -> ToolInvokeResult:
+        """
+        Invoke a tool call
+        """
+        return ToolEngine.agent_invoke(
+            tool=tool_instance,
+            tool_parameters=tool_call_args,
+            user_id=self.user_id,
+            tenant_id=self.tenant_id,
+            message=message,
+            invoke_from=self.application_generate_entity.invoke_from,
+            agent_tool_callback=self.agent_callback,
+            trace_manager=trace_manager,
+        )
+
+    def _fork_tool(self, tool_instance: Tool) -> Tool:
+        """
+        Fork a tool instance for a call running in the pool
+        """
+        tool = tool_instance.fork_tool_runtime(runtime=tool_instance.runtime.model_dump())
+        tool.load_variables(tool_instance.variables)
+        return tool
+
+    def _invoke_tool_in_app_context(self, flask_app: Flask, tool_instance: Tool, tool_call_args: dict[str, Any],
+                                    message: Message, pooled_call: _PooledToolCall,
+                                    trace_manager: Optional[TraceQueueManager] = None) -> ToolInvokeResult:
+        with flask_app.app_context():
+            result = self._invoke_tool(tool_instance, tool_call_args, message, trace_manager)
+            with pooled_call.lock:
+                pooled_call.finished = True
+                timed_out = pooled_call.timed_out
+            if timed_out and result[1]:
+                # the turn went on without this call, its files must not show up in the answer
+                db.session.query(MessageFile).filter(
+                    MessageFile.id.in_([message_file_id for message_file_id, _ in result[1]])
+                ).delete(synchronize_session=False)
+                db.session.commit()
+            return result
+
+    def _wait_tool_call(self, future: Future, pooled_call: _PooledToolCall, tool_call_name: str,
+                        deadline: Optional[float]) -> ToolInvokeResult:
+        """
+        Wait for the result of a tool call running in the pool
+        """
+        try:
+            return future.result(timeout=max(deadline - time.monotonic(), 0) if deadline else None)
+        except FutureTimeoutError:
+            with pooled_call.lock:
+                # a call that finished meanwhile keeps its files, its result follows right away
+                pooled_call.timed_out = not pooled_call.finished
+            if not pooled_call.timed_out:
+                return future.result()
+            future.cancel()
+            error = f'tool call did not finish within {dify_config.AGENT_TOOL_CALL_TIMEOUT} seconds'
+            logger.warning(f'Tool {tool_call_name} of message {self.message.id} {error}')
+            self.agent_callback.on_tool_error(TimeoutError(error))
+            error_response = f'tool invoke error: {error}'
+            return error_response, [], ToolInvokeMeta.error_instance(error_response)
+
     def _init_system_message(self, prompt_template: str, prompt_messages: list[PromptMessage] = None) -> list[PromptMessage]:
         """
         Initialize system message
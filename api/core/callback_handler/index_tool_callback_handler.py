@@ -3,8 +3,9 @@ from core.app.apps.base_app_queue_manager import AppQueueManager, PublishFrom
 from core.app.entities.app_invoke_entities import InvokeFrom
 from core.app.entities.queue_entities import QueueRetrieverResourcesEvent
 from core.rag.models.document import Document
+from core.rag.retrieval.segment_hit_counter import SegmentHitCounter
 from extensions.ext_database import db
-from models.dataset import DatasetQuery, DocumentSegment
+from models.dataset import DatasetQuery
 from models.model import DatasetRetrieverResource
 
 
@@ -41,22 +42,7 @@ class DatasetIndexToolCallbackHandler:
 
     def on_tool_end(self, documents: list[Document]) -> None:
         """Handle tool end."""
-        for document in documents:
-            query = db.session.query(DocumentSegment).filter(
-                DocumentSegment.index_node_id == document.metadata['doc_id']
-            )
-
-            # if 'dataset_id' in document.metadata:
-            if 'dataset_id' in document.metadata:
-                query = query.filter(DocumentSegment.dataset_id == document.metadata['dataset_id'])
-
-            # add hit count to document segment
-            query.update(
-                {DocumentSegment.hit_count: DocumentSegment.hit_count + 1},
-                synchronize_session=False
-            )
-
-            db.session.commit()
+        SegmentHitCounter.record_hits(documents)
 
     def return_retriever_resource_info(self, resource: list):
         """Handle return_retriever_resource_info."""
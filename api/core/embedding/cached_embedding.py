@@ -1,10 +1,16 @@
 import base64
 import logging
+import threading
+import time
 from typing import Optional, cast
 
 import numpy as np
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import IntegrityError
 
+from configs import dify_config
+from core.embedding.query_embedding_memo import get_query_embedding_memo
+from core.helper.lru_cache import LRUCache
 from core.model_manager import ModelInstance
 from core.model_runtime.entities.model_entities import ModelPropertyKey
 from core.model_runtime.model_providers.__base.text_embedding_model import TextEmbeddingModel
@@ -16,6 +22,11 @@ from models.dataset import Embedding
 
 logger = logging.getLogger(__name__)
 
+# number of hashes per cache lookup query and rows per cache insert statement
+EMBEDDING_CACHE_QUERY_BATCH_SIZE = 500
+# expiration time in seconds of query embeddings cached in redis
+QUERY_EMBEDDING_CACHE_TTL = 600
+
 
 class CacheEmbedding(Embeddings):
     def __init__(self, model_instance: ModelInstance, user: Optional[str] = None) -> None:
@@ -24,74 +35,132 @@ class CacheEmbedding(Embeddings):
 
     def embed_documents(self, texts: list[str]) -> list[list[float]]:
         """Embed search docs in batches of 10."""
+        if not texts:
+            return []
+
         # use doc embedding cache or store if not exists
-        text_embeddings = [None for _ in range(len(texts))]
-        embedding_queue_indices = []
-        for i, text in enumerate(texts):
-            hash = helper.generate_text_hash(text)
-            embedding = db.session.query(Embedding).filter_by(model_name=self._model_instance.model,
-                                                              hash=hash,
-                                                              provider_name=self._model_instance.provider).first()
-            if embedding:
-                text_embeddings[i] = embedding.get_embedding()
-            else:
-                embedding_queue_indices.append(i)
-        if embedding_queue_indices:
-            embedding_queue_texts = [texts[i] for i in embedding_queue_indices]
-            embedding_queue_embeddings = []
+        text_hashes = [helper.generate_text_hash(text) for text in texts]
+        cached_embeddings = self._get_cached_embeddings(set(text_hashes))
+
+        embedding_queue_hashes = []
+        embedding_queue_texts = []
+        queued_hashes = set()
+        for text, text_hash in zip(texts, text_hashes):
+            if text_hash not in cached_embeddings and text_hash not in queued_hashes:
+                queued_hashes.add(text_hash)
+                embedding_queue_hashes.append(text_hash)
+                embedding_queue_texts.append(text)
+
+        if embedding_queue_texts:
             try:
                 model_type_instance = cast(TextEmbeddingModel, self._model_instance.model_type_instance)
                 model_schema = model_type_instance.get_model_schema(self._model_instance.model,
                                                                     self._model_instance.credentials)
                 max_chunks = model_schema.model_properties[ModelPropertyKey.MAX_CHUNKS] \
                     if model_schema and ModelPropertyKey.MAX_CHUNKS in model_schema.model_properties else 1
+                new_embeddings = {}
+                # embeddings that cannot be normalized are returned as they are but never cached
+                invalid_embeddings = {}
                 for i in range(0, len(embedding_queue_texts), max_chunks):
                     batch_texts = embedding_queue_texts[i:i + max_chunks]
+                    batch_hashes = embedding_queue_hashes[i:i + max_chunks]
 
                     embedding_result = self._model_instance.invoke_text_embedding(
                         texts=batch_texts,
                         user=self._user
                     )
 
-                    for vector in embedding_result.embeddings:
-                        try:
-                            normalized_embedding = (vector / np.linalg.norm(vector)).tolist()
-                            embedding_queue_embeddings.append(normalized_embedding)
-                        except IntegrityError:
-                            db.session.rollback()
-                        except Exception as e:
-                            logging.exception('Failed transform embedding: ', e)
-                cache_embeddings = []
-                try:
-                    for i, embedding in zip(embedding_queue_indices, embedding_queue_embeddings):
-                        text_embeddings[i] = embedding
-                        hash = helper.generate_text_hash(texts[i])
-                        if hash not in cache_embeddings:
-                            embedding_cache = Embedding(model_name=self._model_instance.model,
-                                                        hash=hash,
-                                                        provider_name=self._model_instance.provider)
-                            embedding_cache.set_embedding(embedding)
-                            db.session.add(embedding_cache)
-                            cache_embeddings.append(hash)
-                    db.session.commit()
-                except IntegrityError:
-                    db.session.rollback()
-            except Exception as ex:
+                    vectors = np.asarray(embedding_result.embeddings, dtype=float)
+                    norms = np.linalg.norm(vectors, axis=1)
+                    valid = np.isfinite(norms) & (norms > 0)
+                    normalized_vectors = np.divide(vectors, norms[:, None], out=vectors.copy(), where=valid[:, None])
+                    for text_hash, vector, is_valid in zip(batch_hashes, normalized_vectors, valid):
+                        if is_valid:
+                            new_embeddings[text_hash] = vector
+                        else:
+                            logger.error(f'Failed to normalize embedding of text {text_hash}: '
+                                         f'its norm is zero or not finite')
+                            invalid_embeddings[text_hash] = vector
+            except Exception:
                 db.session.rollback()
-                logger.error('Failed to embed documents: ', ex)
-                raise ex
+                logger.exception('Failed to embed documents')
+                raise
+
+            self._store_embeddings(new_embeddings)
+            cached_embeddings.update(new_embeddings)
+            cached_embeddings.update(invalid_embeddings)
+
+        return np.vstack([cached_embeddings[text_hash] for text_hash in text_hashes]).tolist()
 
-        return text_embeddings
+    def _get_cached_embeddings(self, text_hashes: set[str]) -> dict[str, np.ndarray]:
+        """
+        Look up cached embeddings with one `IN (...)` query per chunk of hashes.
+        """
+        text_hashes = list(text_hashes)
+        cached_embeddings = {}
+        for i in range(0, len(text_hashes), EMBEDDING_CACHE_QUERY_BATCH_SIZE):
+            rows = db.session.query(Embedding.hash, Embedding.embedding).filter(
+                Embedding.model_name == self._model_instance.model,
+                Embedding.provider_name == self._model_instance.provider,
+                Embedding.hash.in_(text_hashes[i:i + EMBEDDING_CACHE_QUERY_BATCH_SIZE])
+            ).all()
+            for text_hash, embedding_bytes in rows:
+                cached_embeddings[text_hash] = Embedding.decode_embedding(embedding_bytes)
+
+        return cached_embeddings
+
+    def _store_embeddings(self, embeddings: dict[str, np.ndarray]) -> None:
+        """
+        Write embeddings back to the cache with multi-row inserts, skipping rows another worker already stored.
+        """
+        if not embeddings:
+            return
+
+        values = [
+            {
+                'model_name': self._model_instance.model,
+                'hash': text_hash,
+                'provider_name': self._model_instance.provider,
+                'embedding': Embedding.encode_embedding(vector),
+            }
+            for text_hash, vector in embeddings.items()
+        ]
+        try:
+            for i in range(0, len(values), EMBEDDING_CACHE_QUERY_BATCH_SIZE):
+                stmt = insert(Embedding).values(values[i:i + EMBEDDING_CACHE_QUERY_BATCH_SIZE])
+                db.session.execute(stmt.on_conflict_do_nothing(index_elements=['model_name', 'hash', 'provider_name']))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception('Failed to add embeddings to cache')
 
     def embed_query(self, text: str) -> list[float]:
         """Embed query text."""
         # use doc embedding cache or store if not exists
         hash = helper.generate_text_hash(text)
         embedding_cache_key = f'{self._model_instance.provider}_{self._model_instance.model}_{hash}'
+        # within a request the query is embedded once for all datasets and rerankers
+        memo = get_query_embedding_memo()
+        if memo is not None:
+            return memo.get_or_embed(embedding_cache_key, lambda: self._embed_query(text, embedding_cache_key))
+
+        return self._embed_query(text, embedding_cache_key)
+
+    def _embed_query(self, text: str, embedding_cache_key: str) -> list[float]:
+        local_cache_enabled = dify_config.QUERY_EMBEDDING_LOCAL_CACHE_ENABLED
+        if local_cache_enabled:
+            embedding_vector = query_embedding_cache.get(embedding_cache_key)
+            if embedding_vector is not None:
+                query_embedding_ttl_refresher.touch(embedding_cache_key)
+                return embedding_vector.tolist()
+
         embedding = redis_client.get(embedding_cache_key)
         if embedding:
-            redis_client.expire(embedding_cache_key, 600)
-            return list(np.frombuffer(base64.b64decode(embedding), dtype="float"))
+            redis_client.expire(embedding_cache_key, QUERY_EMBEDDING_CACHE_TTL)
+            embedding_vector = np.frombuffer(base64.b64decode(embedding), dtype="float")
+            if local_cache_enabled:
+                query_embedding_cache.put(embedding_cache_key, embedding_vector)
+            return embedding_vector.tolist()
         try:
             embedding_result = self._model_instance.invoke_text_embedding(
                 texts=[text],
@@ -111,7 +180,9 @@ class CacheEmbedding(Embeddings):
             encoded_vector = base64.b64encode(vector_bytes)
             # Transform to string
             encoded_str = encoded_vector.decode("utf-8")
-            redis_client.setex(embedding_cache_key, 600, encoded_str)
+            redis_client.setex(embedding_cache_key, QUERY_EMBEDDING_CACHE_TTL, encoded_str)
+            if local_cache_enabled:
+                query_embedding_cache.put(embedding_cache_key, embedding_vector)
 
         except IntegrityError:
             db.session.rollback()
@@ -119,3 +190,48 @@ class CacheEmbedding(Embeddings):
             logging.exception('Failed to add embedding to redis')
 
         return embedding_results
+
+
+class RedisTTLRefresher:
+    """
+    Collects keys whose Redis TTL should be extended and refreshes them in one pipeline per batch,
+    so hits served from the per-process cache keep the shared Redis entry alive without a round trip each.
+    """
+
+    def __init__(self, ttl: int, batch_size: int, interval: float = 60):
+        self._ttl = ttl
+        self._batch_size = batch_size
+        self._interval = interval
+        self._pending_keys: set[str] = set()
+        self._last_flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def touch(self, key: str) -> None:
+        with self._lock:
+            self._pending_keys.add(key)
+            now = time.monotonic()
+            if len(self._pending_keys) < self._batch_size and now - self._last_flushed_at < self._interval:
+                return
+            keys, self._pending_keys = self._pending_keys, set()
+            self._last_flushed_at = now
+
+        try:
+            pipeline = redis_client.pipeline(transaction=False)
+            for pending_key in keys:
+                pipeline.expire(pending_key, self._ttl)
+            pipeline.execute()
+        except Exception:
+            logger.exception('Failed to refresh query embedding ttl in redis')
+
+
+# per-process tier in front of the Redis query embedding cache, values are numpy vectors
+query_embedding_cache = LRUCache(
+    capacity=dify_config.QUERY_EMBEDDING_LOCAL_CACHE_CAPACITY,
+    max_bytes=dify_config.QUERY_EMBEDDING_LOCAL_CACHE_MAX_BYTES,
+    ttl=dify_config.QUERY_EMBEDDING_LOCAL_CACHE_TTL,
+    sizeof=lambda vector: vector.nbytes,
+)
+query_embedding_ttl_refresher = RedisTTLRefresher(
+    ttl=QUERY_EMBEDDING_CACHE_TTL,
+    batch_size=dify_config.QUERY_EMBEDDING_TTL_REFRESH_BATCH_SIZE,
+)
@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+from collections.abc import Callable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Optional, cast
+
+from flask import Flask
+
+from configs import dify_config
+from core.model_manager import ModelInstance
+from core.model_runtime.entities.model_entities import ModelPropertyKey
+from core.model_runtime.errors.invoke import InvokeRateLimitError
+from core.model_runtime.model_providers.__base.text_embedding_model import TextEmbeddingModel
+from core.rag.models.document import Document
+
+logger = logging.getLogger(__name__)
+
+# backoff in seconds after a provider rate limits us, doubled for every consecutive rate limit
+RATE_LIMIT_BACKOFF = 2
+RATE_LIMIT_MAX_BACKOFF = 60
+
+
+class ProviderThrottle:
+    """
+    Per-process limit of embedding batches in flight for one provider, shared by all indexing jobs.
+    After a rate limit error every caller waits for the cooldown before its next request.
+    """
+
+    def __init__(self, max_in_flight: int):
+        self._semaphore = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._cooldown_until = 0.0
+
+    def acquire(self) -> None:
+        self._semaphore.acquire()
+        with self._lock:
+            delay = self._cooldown_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def release(self) -> None:
+        self._semaphore.release()
+
+    def cool_down(self, seconds: float) -> None:
+        with self._lock:
+            self._cooldown_until = max(self._cooldown_until, time.monotonic() + seconds)
+
+
+_provider_throttles: dict[str, ProviderThrottle] = {}
+_provider_throttles_lock = threading.Lock()
+
+
+def get_provider_throttle(provider: str) -> ProviderThrottle:
+    with _provider_throttles_lock:
+        if provider not in _provider_throttles:
+            _provider_throttles[provider] = ProviderThrottle(dify_config.INDEXING_EMBEDDING_MAX_IN_FLIGHT)
+        return _provider_throttles[provider]
+
+
+class EmbeddingPipeline:
+    """
+    Embeds documents in batches sized for the embedding model and hands every embedded batch to a
+    writer while the next batches are being embedded.
+
+    Embedding runs in a thread pool bounded by the provider throttle, the writer runs in the calling
+    thread so vector store writes and status updates overlap with embedding.
+    """
+
+    def __init__(self, flask_app: Flask,
+                 model_instance: ModelInstance,
+                 embed: Callable[[list[Document]], list[list[float]]],
+                 write: Callable[[list[Document], list[list[float]]], None]):
+        self._flask_app = flask_app
+        self._model_instance = model_instance
+        self._embed = embed
+        self._write = write
+        self._throttle = get_provider_throttle(model_instance.provider)
+        self._max_in_flight = dify_config.INDEXING_EMBEDDING_MAX_IN_FLIGHT
+
+    def run(self, documents: list[Document]) -> None:
+        batches = self.split_batches(documents)
+        with ThreadPoolExecutor(max_workers=self._max_in_flight, thread_name_prefix='embedding_pipeline') as executor:
+            pending: set[Future] = set()
+            try:
+                for batch in batches:
+                    # keep a bounded number of embedded batches waiting for the writer
+                    while len(pending) >= 2 * self._max_in_flight:
+                        pending = self._write_completed(pending)
+                    pending.add(executor.submit(self._embed_batch, batch))
+                while pending:
+                    pending = self._write_completed(pending)
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+
+    def split_batches(self, documents: list[Document]) -> Iterator[list[Document]]:
+        """
+        Split documents into batches of at most `max_chunks` texts, each batch is one embedding request.
+        Batches are also cut when their length in characters, an upper bound of their tokens,
+        exceeds `max_chunks * context_size`.
+        """
+        max_chunks, context_size = self._get_batch_limits()
+        max_characters = max_chunks * context_size if context_size else None
+        batch = []
+        batch_characters = 0
+        for document in documents:
+            characters = len(document.page_content)
+            if batch and (len(batch) >= max_chunks
+                          or (max_characters and batch_characters + characters > max_characters)):
+                yield batch
+                batch = []
+                batch_characters = 0
+            batch.append(document)
+            batch_characters += characters
+        if batch:
+            yield batch
+
+    def _write_completed(self, pending: set[Future]) -> set[Future]:
+        done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            batch, embeddings = future.result()
+            self._write(batch, embeddings)
+        return not_done
+
+    def _embed_batch(self, batch: list[Document]) -> tuple[list[Document], list[list[float]]]:
+        with self._flask_app.app_context():
+            retries = 0
+            while True:
+                self._throttle.acquire()
+                try:
+                    return batch, self._embed(batch)
+                except InvokeRateLimitError:
+                    if retries >= dify_config.INDEXING_EMBEDDING_RATE_LIMIT_MAX_RETRIES:
+                        raise
+                    backoff = min(RATE_LIMIT_BACKOFF * 2 ** retries, RATE_LIMIT_MAX_BACKOFF)
+                    logger.warning(f'Embedding provider {self._model_instance.provider} is rate limited, '
+                                   f'backing off for {backoff} seconds')
+                    self._throttle.cool_down(backoff)
+                    retries += 1
+                finally:
+                    self._throttle.release()
+
+    def _get_batch_limits(self) -> tuple[int, Optional[int]]:
+        model_type_instance = cast(TextEmbeddingModel, self._model_instance.model_type_instance)
+        model_schema = model_type_instance.get_model_schema(self._model_instance.model,
+                                                            self._model_instance.credentials)
+        if not model_schema:
+            return 1, None
+        max_chunks = model_schema.model_properties.get(ModelPropertyKey.MAX_CHUNKS) or 1
+        context_size = model_schema.model_properties.get(ModelPropertyKey.CONTEXT_SIZE)
+        return max_chunks, context_size
@@ -0,0 +1,66 @@
+import threading
+from collections.abc import Callable, Generator
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+
+class QueryEmbeddingMemo:
+    """
+    Query vectors embedded while serving one request, keyed by embedding provider, model and query.
+
+    Concurrent lookups of the same key wait for the first caller instead of embedding the query again.
+    """
+
+    def __init__(self):
+        self._vectors: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def get_or_embed(self, key: str, embed: Callable[[], list[float]]) -> list[float]:
+        with self._lock:
+            future = self._vectors.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._vectors[key] = future
+
+        if owner:
+            try:
+                future.set_result(embed())
+            except Exception as e:
+                # do not memoize failures, the next caller tries again
+                with self._lock:
+                    self._vectors.pop(key, None)
+                future.set_exception(e)
+
+        return list(future.result())
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+
+_query_embedding_memo: ContextVar[Optional[QueryEmbeddingMemo]] = ContextVar('query_embedding_memo', default=None)
+
+
+def get_query_embedding_memo() -> Optional[QueryEmbeddingMemo]:
+    return _query_embedding_memo.get()
+
+
+@contextmanager
+def query_embedding_scope() -> Generator[QueryEmbeddingMemo, None, None]:
+    """
+    Share query vectors between all embedding calls made inside the scope.
+    Nested scopes reuse the outer memo, tasks started through `copy_context` see the memo of their parent.
+    """
+    memo = _query_embedding_memo.get()
+    if memo is not None:
+        yield memo
+        return
+
+    memo = QueryEmbeddingMemo()
+    token = _query_embedding_memo.set(memo)
+    try:
+        yield memo
+    finally:
+        _query_embedding_memo.reset(token)
@@ -0,0 +1,53 @@
+from typing import Optional
+
+from core.model_manager import ModelInstance
+from core.model_runtime.model_providers.__base.tokenizers.gpt2_tokenzier import GPT2Tokenizer
+from core.rag.models.document import Document
+from libs import helper
+
+
+class EmbeddingTokenCounter:
+    """
+    Counts embedding tokens of texts for one indexing job.
+
+    Counts are memoized by text hash, so a text measured while splitting is not tokenized again by the segment
+    store or the indexing stage. Counts stay in the counter, they are never written into document metadata,
+    which is persisted with the vectors.
+    Without an embedding model texts are measured with the GPT-2 tokenizer.
+    """
+
+    def __init__(self, model_instance: Optional[ModelInstance]):
+        self._model_instance = model_instance
+        self._counts: dict[str, int] = {}
+
+    @property
+    def model_instance(self) -> Optional[ModelInstance]:
+        return self._model_instance
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+
+        text_hash = helper.generate_text_hash(text)
+        tokens = self._counts.get(text_hash)
+        if tokens is None:
+            if self._model_instance:
+                tokens = self._model_instance.get_text_embedding_num_tokens(texts=[text])
+            else:
+                tokens = GPT2Tokenizer.get_num_tokens(text)
+            self._counts[text_hash] = tokens
+        return tokens
+
+    def set_count(self, text: str, tokens: int) -> None:
+        """
+        Memoize a count measured elsewhere, e.g. in a split worker or by an earlier run of the job.
+        """
+        if text:
+            self._counts[helper.generate_text_hash(text)] = tokens
+
+    def count_documents(self, documents: list[Document]) -> int:
+        """
+        Count the tokens of the documents.
+        :return: total tokens of the documents
+        """
+        return sum(self.count(document.page_content) for document in documents)
@@ -1,22 +1,80 @@
+import sys
+import threading
+import time
 from collections import OrderedDict
-from typing import Any
+from collections.abc import Callable
+from typing import Any, Optional
 
 
 class LRUCache:
-    def __init__(self, capacity: int):
-        self.cache = OrderedDict()
+    """
+    Thread-safe LRU cache bounded by number of entries and, optionally, by total size in bytes.
+    Entries expire after `ttl` seconds when a ttl is given.
+    """
+
+    def __init__(self, capacity: int,
+                 max_bytes: Optional[int] = None,
+                 ttl: Optional[float] = None,
+                 sizeof: Callable[[Any], int] = sys.getsizeof):
+        # key -> (value, size, expire_at)
+        self.cache: OrderedDict[Any, tuple[Any, int, Optional[float]]] = OrderedDict()
         self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._sizeof = sizeof
+        self._lock = threading.Lock()
 
     def get(self, key: Any) -> Any:
-        if key not in self.cache:
-            return None
-        else:
+        with self._lock:
+            entry = self.cache.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expire_at = entry
+            if expire_at is not None and expire_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
             self.cache.move_to_end(key)  # move the key to the end of the OrderedDict
-            return self.cache[key]
+            self.hits += 1
+            return value
 
     def put(self, key: Any, value: Any) -> None:
-        if key in self.cache:
-            self.cache.move_to_end(key)
-        self.cache[key] = value
-        if len(self.cache) > self.capacity:
-            self.cache.popitem(last=False)  # pop the first item
+        size = self._sizeof(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        expire_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self.cache:
+                self._remove(key)
+            self.cache[key] = (value, size, expire_at)
+            self.current_bytes += size
+            while len(self.cache) > self.capacity or (
+                self.max_bytes is not None and self.current_bytes > self.max_bytes
+            ):
+                _, (_, evicted_size, _) = self.cache.popitem(last=False)  # pop the first item
+                self.current_bytes -= evicted_size
+
+    def clear(self) -> None:
+        with self._lock:
+            self.cache.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                'size': len(self.cache),
+                'bytes': self.current_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    def _remove(self, key: Any) -> None:
+        _, size, _ = self.cache.pop(key)
+        self.current_bytes -= size
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import logging
+from typing import Optional
+
+from core.rag.extractor.extracted_text_cache import ExtractedTextCache
+from core.rag.models.document import Document
+from extensions.ext_storage import storage
+from models.dataset import Document as DatasetDocument
+from models.dataset import DocumentSegment
+
+logger = logging.getLogger(__name__)
+
+
+class IndexingCheckpoint:
+    """
+    Stage checkpoints of the indexing of one document, kept in storage until the document is indexed.
+
+    - extracted: the text extracted from the data source, reused instead of parsing the file again. When
+      the text of an uploaded file is in the extracted text cache, the checkpoint only references the
+      cache entry, and an evicted entry means the file is parsed again
+    - split: the number of segments the split stage stored, once they are all in the database the
+      segments are the split checkpoint and their `completed` status records which chunks are
+      already in the vector store
+
+    Checkpoints carry a fingerprint of the data source and the process rule, a checkpoint of
+    another source or rule is ignored.
+    """
+
+    STORAGE_PREFIX = 'indexing_checkpoints'
+
+    def __init__(self, dataset_document: DatasetDocument):
+        self._dataset_document = dataset_document
+        self._fingerprint = self._get_fingerprint(dataset_document)
+
+    def load_extracted(self) -> Optional[list[Document]]:
+        checkpoint = self._load('extracted')
+        if checkpoint is None:
+            return None
+        if 'extracted_text_cache' in checkpoint:
+            return ExtractedTextCache.from_file_key(checkpoint['extracted_text_cache']).get()
+        return [Document(page_content=text_doc['page_content'], metadata=text_doc['metadata'])
+                for text_doc in checkpoint['documents']]
+
+    def save_extracted(self, text_docs: list[Document],
+                       extracted_text_cache: Optional[ExtractedTextCache] = None) -> None:
+        """
+        :param text_docs: the extracted documents
+        :param extracted_text_cache: the cache entry the documents were read from or stored in
+        """
+        if extracted_text_cache and extracted_text_cache.exists():
+            self._save('extracted', {'extracted_text_cache': extracted_text_cache.file_key})
+            return
+
+        self._save('extracted', {
+            'documents': [{'page_content': text_doc.page_content, 'metadata': text_doc.metadata}
+                          for text_doc in text_docs]
+        })
+
+    def save_split(self, segment_count: int) -> None:
+        self._save('split', {'segment_count': segment_count})
+
+    def is_split(self) -> bool:
+        """
+        Whether all segments of the split stage are stored, then indexing resumes from the segments
+        that are not completed yet.
+        """
+        checkpoint = self._load('split')
+        if checkpoint is None:
+            return False
+        segment_count = DocumentSegment.query.filter_by(
+            dataset_id=self._dataset_document.dataset_id,
+            document_id=self._dataset_document.id
+        ).count()
+        return segment_count > 0 and segment_count == checkpoint['segment_count']
+
+    def clear(self) -> None:
+        self.delete(self._dataset_document.dataset_id, self._dataset_document.id)
+
+    @classmethod
+    def delete(cls, dataset_id: str, document_id: str) -> None:
+        for stage in ['extracted', 'split']:
+            file_key = cls._get_file_key(dataset_id, document_id, stage)
+            try:
+                if storage.exists(file_key):
+                    storage.delete(file_key)
+            except Exception:
+                logger.exception(f'Failed to delete indexing checkpoint {file_key}')
+
+    def _load(self, stage: str) -> Optional[dict]:
+        file_key = self._get_file_key(self._dataset_document.dataset_id, self._dataset_document.id, stage)
+        try:
+            if not storage.exists(file_key):
+                return None
+            checkpoint = json.loads(storage.load_once(file_key).decode('utf-8'))
+        except Exception:
+            logger.exception(f'Failed to load indexing checkpoint {file_key}')
+            return None
+        if checkpoint.get('fingerprint') != self._fingerprint:
+            return None
+        return checkpoint
+
+    def _save(self, stage: str, checkpoint: dict) -> None:
+        # a checkpoint is an optimization, indexing goes on when it cannot be saved
+        file_key = self._get_file_key(self._dataset_document.dataset_id, self._dataset_document.id, stage)
+        try:
+            checkpoint['fingerprint'] = self._fingerprint
+            storage.save(file_key, json.dumps(checkpoint).encode('utf-8'))
+        except Exception:
+            logger.exception(f'Failed to save indexing checkpoint {file_key}')
+
+    @classmethod
+    def _get_file_key(cls, dataset_id: str, document_id: str, stage: str) -> str:
+        return f'{cls.STORAGE_PREFIX}/{dataset_id}/{document_id}/{stage}.json'
+
+    @staticmethod
+    def _get_fingerprint(dataset_document: DatasetDocument) -> str:
+        source = json.dumps([
+            dataset_document.data_source_type,
+            dataset_document.data_source_info,
+            dataset_document.dataset_process_rule_id,
+            dataset_document.doc_form,
+        ])
+        return hashlib.sha256(source.encode('utf-8')).hexdigest()
@@ -1,5 +1,5 @@
-import concurrent.futures
 import datetime
+import functools
 import json
 import logging
 import re
@@ -8,20 +8,27 @@ import time
 import uuid
 from typing import Optional, cast
 
-from flask import Flask, current_app
+from flask import current_app
 from flask_login import current_user
 from sqlalchemy.orm.exc import ObjectDeletedError
 
 from configs import dify_config
+from core.embedding.embedding_pipeline import EmbeddingPipeline
+from core.embedding.token_counter import EmbeddingTokenCounter
 from core.errors.error import ProviderTokenNotInitError
+from core.indexing_checkpoint import IndexingCheckpoint
 from core.llm_generator.llm_generator import LLMGenerator
 from core.model_manager import ModelInstance, ModelManager
 from core.model_runtime.entities.model_entities import ModelType
 from core.rag.datasource.keyword.keyword_factory import Keyword
+from core.rag.datasource.vdb.vector_factory import Vector
 from core.rag.docstore.dataset_docstore import DatasetDocumentStore
 from core.rag.extractor.entity.extract_setting import ExtractSetting
+from core.rag.extractor.extract_processor import ExtractProcessor
+from core.rag.extractor.extracted_text_cache import ExtractedTextCache
 from core.rag.index_processor.index_processor_base import BaseIndexProcessor
 from core.rag.index_processor.index_processor_factory import IndexProcessorFactory
+from core.rag.index_processor.qa_generation_pool import QAGenerationPool
 from core.rag.models.document import Document
 from core.rag.splitter.fixed_text_splitter import (
     EnhanceRecursiveCharacterTextSplitter,
@@ -66,17 +73,18 @@ class IndexingRunner:
                 text_docs = self._extract(index_processor, dataset_document, processing_rule.to_dict())
 
                 # transform
-                documents = self._transform(index_processor, dataset, text_docs, dataset_document.doc_language,
-                                            processing_rule.to_dict())
+                documents, token_counter = self._transform(index_processor, dataset, text_docs,
+                                                           dataset_document.doc_language, processing_rule.to_dict())
                 # save segment
-                self._load_segments(dataset, dataset_document, documents)
+                self._load_segments(dataset, dataset_document, documents, token_counter)
 
                 # load
                 self._load(
                     index_processor=index_processor,
                     dataset=dataset,
                     dataset_document=dataset_document,
-                    documents=documents
+                    documents=documents,
+                    token_counter=token_counter
                 )
             except DocumentIsPausedException:
                 raise DocumentIsPausedException('Document paused, document id: {}'.format(dataset_document.id))
@@ -125,17 +133,18 @@ class IndexingRunner:
             text_docs = self._extract(index_processor, dataset_document, processing_rule.to_dict())
 
             # transform
-            documents = self._transform(index_processor, dataset, text_docs, dataset_document.doc_language,
-                                        processing_rule.to_dict())
+            documents, token_counter = self._transform(index_processor, dataset, text_docs,
+                                                       dataset_document.doc_language, processing_rule.to_dict())
             # save segment
-            self._load_segments(dataset, dataset_document, documents)
+            self._load_segments(dataset, dataset_document, documents, token_counter)
 
             # load
             self._load(
                 index_processor=index_processor,
                 dataset=dataset,
                 dataset_document=dataset_document,
-                documents=documents
+                documents=documents,
+                token_counter=token_counter
             )
         except DocumentIsPausedException:
             raise DocumentIsPausedException('Document paused, document id: {}'.format(dataset_document.id))
@@ -169,6 +178,8 @@ class IndexingRunner:
             ).all()
 
             documents = []
+            # the segments keep the token counts of their chunks, they are not tokenized again
+            token_counter = EmbeddingTokenCounter(self._get_embedding_model_instance(dataset))
             if document_segments:
                 for document_segment in document_segments:
                     # transform segment to node
@@ -182,6 +193,8 @@ class IndexingRunner:
                                 "dataset_id": document_segment.dataset_id,
                             }
                         )
+                        if document_segment.tokens is not None:
+                            token_counter.set_count(document_segment.content, document_segment.tokens)
 
                         documents.append(document)
 
@@ -197,7 +210,9 @@ class IndexingRunner:
                 index_processor=index_processor,
                 dataset=dataset,
                 dataset_document=dataset_document,
-                documents=documents
+                documents=documents,
+                token_counter=token_counter,
+                resumed=True
             )
         except DocumentIsPausedException:
             raise DocumentIsPausedException('Document paused, document id: {}'.format(dataset_document.id))
@@ -306,8 +321,41 @@ class IndexingRunner:
         if dataset_document.data_source_type not in ["upload_file", "notion_import", "website_crawl"]:
             return []
 
+        # a document that was extracted before it failed or paused is not parsed again
+        checkpoint = IndexingCheckpoint(dataset_document)
+        text_docs = checkpoint.load_extracted()
+        if text_docs is None:
+            text_docs, extracted_text_cache = self._extract_text_docs(index_processor, dataset_document,
+                                                                      process_rule)
+            checkpoint.save_extracted(text_docs, extracted_text_cache)
+
+        # update document status to splitting
+        self._update_document_index_status(
+            document_id=dataset_document.id,
+            after_indexing_status="splitting",
+            extra_update_params={
+                DatasetDocument.word_count: sum(len(text_doc.page_content) for text_doc in text_docs),
+                DatasetDocument.parsing_completed_at: datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+            }
+        )
+
+        # replace doc id to document model id
+        text_docs = cast(list[Document], text_docs)
+        for text_doc in text_docs:
+            text_doc.metadata['document_id'] = dataset_document.id
+            text_doc.metadata['dataset_id'] = dataset_document.dataset_id
+
+        return text_docs
+
+    @staticmethod
+    def _extract_text_docs(index_processor: BaseIndexProcessor, dataset_document: DatasetDocument,
+                           process_rule: dict) -> tuple[list[Document], Optional[ExtractedTextCache]]:
+        """
+        :return: the extracted documents and the extracted text cache entry of an uploaded file
+        """
         data_source_info = dataset_document.data_source_info_dict
         text_docs = []
+        extracted_text_cache = None
         if dataset_document.data_source_type == 'upload_file':
             if not data_source_info or 'upload_file_id' not in data_source_info:
                 raise ValueError("no upload file found")
@@ -323,6 +371,9 @@ class IndexingRunner:
                     document_model=dataset_document.doc_form
                 )
                 text_docs = index_processor.extract(extract_setting, process_rule_mode=process_rule['mode'])
+                extracted_text_cache = ExtractProcessor.get_extracted_text_cache(
+                    extract_setting, is_automatic=process_rule['mode'] == 'automatic'
+                )
         elif dataset_document.data_source_type == 'notion_import':
             if (not data_source_info or 'notion_workspace_id' not in data_source_info
                     or 'notion_page_id' not in data_source_info):
@@ -356,23 +407,8 @@ class IndexingRunner:
                 document_model=dataset_document.doc_form
             )
             text_docs = index_processor.extract(extract_setting, process_rule_mode=process_rule['mode'])
-        # update document status to splitting
-        self._update_document_index_status(
-            document_id=dataset_document.id,
-            after_indexing_status="splitting",
-            extra_update_params={
-                DatasetDocument.word_count: sum(len(text_doc.page_content) for text_doc in text_docs),
-                DatasetDocument.parsing_completed_at: datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
-            }
-        )
 
-        # replace doc id to document model id
-        text_docs = cast(list[Document], text_docs)
-        for text_doc in text_docs:
-            text_doc.metadata['document_id'] = dataset_document.id
-            text_doc.metadata['dataset_id'] = dataset_document.dataset_id
-
-        return text_docs
+        return text_docs, extracted_text_cache
 
     @staticmethod
     def filter_string(text):
@@ -507,44 +543,31 @@ class IndexingRunner:
             all_documents.extend(split_documents)
         # processing qa document
         if document_form == 'qa_model':
-            for i in range(0, len(all_documents), 10):
-                threads = []
-                sub_documents = all_documents[i:i + 10]
-                for doc in sub_documents:
-                    document_format_thread = threading.Thread(target=self.format_qa_document, kwargs={
-                        'flask_app': current_app._get_current_object(),
-                        'tenant_id': tenant_id, 'document_node': doc, 'all_qa_documents': all_qa_documents,
-                        'document_language': document_language})
-                    threads.append(document_format_thread)
-                    document_format_thread.start()
-                for thread in threads:
-                    thread.join()
+            generate = functools.partial(self._generate_qa_documents, tenant_id=tenant_id,
+                                         document_language=document_language)
+            qa_generation_pool = QAGenerationPool(flask_app=current_app._get_current_object(),
+                                                  tenant_id=tenant_id,
+                                                  generate=generate)
+            for qa_documents in qa_generation_pool.run(all_documents):
+                all_qa_documents.extend(qa_documents)
             return all_qa_documents
         return all_documents
 
-    def format_qa_document(self, flask_app: Flask, tenant_id: str, document_node, all_qa_documents, document_language):
-        format_documents = []
-        if document_node.page_content is None or not document_node.page_content.strip():
-            return
-        with flask_app.app_context():
-            try:
-                # qa model document
-                response = LLMGenerator.generate_qa_document(tenant_id, document_node.page_content, document_language)
-                document_qa_list = self.format_split_text(response)
-                qa_documents = []
-                for result in document_qa_list:
-                    qa_document = Document(page_content=result['question'], metadata=document_node.metadata.model_copy())
-                    doc_id = str(uuid.uuid4())
-                    hash = helper.generate_text_hash(result['question'])
-                    qa_document.metadata['answer'] = result['answer']
-                    qa_document.metadata['doc_id'] = doc_id
-                    qa_document.metadata['doc_hash'] = hash
-                    qa_documents.append(qa_document)
-                format_documents.extend(qa_documents)
-            except Exception as e:
-                logging.exception(e)
-
-            all_qa_documents.extend(format_documents)
+    def _generate_qa_documents(self, document_node: Document, tenant_id: str,
+                               document_language: str) -> list[Document]:
+        # qa model document
+        response = LLMGenerator.generate_qa_document(tenant_id, document_node.page_content, document_language)
+        document_qa_list = self.format_split_text(response)
+        qa_documents = []
+        for result in document_qa_list:
+            qa_document = Document(page_content=result['question'], metadata=document_node.metadata.copy())
+            doc_id = str(uuid.uuid4())
+            hash = helper.generate_text_hash(result['question'])
+            qa_document.metadata['answer'] = result['answer']
+            qa_document.metadata['doc_id'] = doc_id
+            qa_document.metadata['doc_hash'] = hash
+            qa_documents.append(qa_document)
+        return qa_documents
 
     def _split_to_documents_for_estimate(self, text_docs: list[Document], splitter: TextSplitter,
                                          processing_rule: DatasetProcessRule) -> list[Document]:
@@ -619,25 +642,28 @@ class IndexingRunner:
             for q, a in matches if q and a
         ]
 
+    def _get_embedding_model_instance(self, dataset: Dataset) -> Optional[ModelInstance]:
+        if dataset.indexing_technique != 'high_quality':
+            return None
+        return self.model_manager.get_model_instance(
+            tenant_id=dataset.tenant_id,
+            provider=dataset.embedding_model_provider,
+            model_type=ModelType.TEXT_EMBEDDING,
+            model=dataset.embedding_model
+        )
+
     def _load(self, index_processor: BaseIndexProcessor, dataset: Dataset,
-              dataset_document: DatasetDocument, documents: list[Document]) -> None:
+              dataset_document: DatasetDocument, documents: list[Document],
+              token_counter: Optional[EmbeddingTokenCounter] = None, resumed: bool = False) -> None:
         """
         insert index and update document/segment status to completed
+        :param resumed: whether the chunks are segments of an earlier run, some may be in the vector store
         """
 
-        embedding_model_instance = None
-        if dataset.indexing_technique == 'high_quality':
-            embedding_model_instance = self.model_manager.get_model_instance(
-                tenant_id=dataset.tenant_id,
-                provider=dataset.embedding_model_provider,
-                model_type=ModelType.TEXT_EMBEDDING,
-                model=dataset.embedding_model
-            )
+        embedding_model_instance = self._get_embedding_model_instance(dataset)
 
-        # chunk nodes by chunk size
         indexing_start_at = time.perf_counter()
         tokens = 0
-        chunk_size = 10
 
         # create keyword index
         create_keyword_thread = threading.Thread(target=self._process_keyword_index,
@@ -645,16 +671,24 @@ class IndexingRunner:
                                                        dataset.id, dataset_document.id, documents))
         create_keyword_thread.start()
         if dataset.indexing_technique == 'high_quality':
-            with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                futures = []
-                for i in range(0, len(documents), chunk_size):
-                    chunk_documents = documents[i:i + chunk_size]
-                    futures.append(executor.submit(self._process_chunk, current_app._get_current_object(), index_processor,
-                                                   chunk_documents, dataset,
-                                                   dataset_document, embedding_model_instance))
-
-                for future in futures:
-                    tokens += future.result()
+            # the vector index of both index processors is a plain vector store write, so batches are
+            # embedded ahead while earlier batches are written to the vector store
+            vector = Vector(dataset)
+            if not token_counter:
+                token_counter = EmbeddingTokenCounter(embedding_model_instance)
+
+            def write(chunk_documents: list[Document], embeddings: list[list[float]]) -> None:
+                nonlocal tokens
+                tokens += self._write_embedded_chunk(vector, chunk_documents, embeddings, dataset,
+                                                     dataset_document, token_counter, resumed)
+
+            embedding_pipeline = EmbeddingPipeline(
+                flask_app=current_app._get_current_object(),
+                model_instance=embedding_model_instance,
+                embed=vector.embed_documents,
+                write=write
+            )
+            embedding_pipeline.run(documents)
 
         create_keyword_thread.join()
         indexing_end_at = time.perf_counter()
@@ -670,6 +704,8 @@ class IndexingRunner:
                 DatasetDocument.error: None,
             }
         )
+        Dataset.invalidate_available_counts(dataset.id)
+        IndexingCheckpoint(dataset_document).clear()
 
     @staticmethod
     def _process_keyword_index(flask_app, dataset_id, document_id, documents):
@@ -694,39 +730,37 @@ class IndexingRunner:
 
                 db.session.commit()
 
-    def _process_chunk(self, flask_app, index_processor, chunk_documents, dataset, dataset_document,
-                       embedding_model_instance):
-        with flask_app.app_context():
-            # check document is paused
-            self._check_document_paused_status(dataset_document.id)
-
-            tokens = 0
-            if embedding_model_instance:
-                tokens += sum(
-                    embedding_model_instance.get_text_embedding_num_tokens(
-                        [document.page_content]
-                    )
-                    for document in chunk_documents
-                )
+    def _write_embedded_chunk(self, vector: Vector, chunk_documents: list[Document],
+                              embeddings: list[list[float]], dataset: Dataset, dataset_document: DatasetDocument,
+                              token_counter: EmbeddingTokenCounter, resumed: bool) -> int:
+        # check document is paused
+        self._check_document_paused_status(dataset_document.id)
 
-            # load index
-            index_processor.load(dataset, chunk_documents, with_keywords=False)
-
-            document_ids = [document.metadata['doc_id'] for document in chunk_documents]
-            db.session.query(DocumentSegment).filter(
-                DocumentSegment.document_id == dataset_document.id,
-                DocumentSegment.dataset_id == dataset.id,
-                DocumentSegment.index_node_id.in_(document_ids),
-                DocumentSegment.status == "indexing"
-            ).update({
-                DocumentSegment.status: "completed",
-                DocumentSegment.enabled: True,
-                DocumentSegment.completed_at: datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
-            })
+        tokens = token_counter.count_documents(chunk_documents)
 
-            db.session.commit()
+        # load index
+        # a resumed indexing writes again the chunks written before its segments were marked completed,
+        # chunks of a new split have new doc ids and skip the lookup of the stored ones
+        if resumed:
+            vector.upsert(chunk_documents, embeddings)
+        else:
+            vector.create_with_embeddings(chunk_documents, embeddings)
+
+        document_ids = [document.metadata['doc_id'] for document in chunk_documents]
+        db.session.query(DocumentSegment).filter(
+            DocumentSegment.document_id == dataset_document.id,
+            DocumentSegment.dataset_id == dataset.id,
+            DocumentSegment.index_node_id.in_(document_ids),
+            DocumentSegment.status == "indexing"
+        ).update({
+            DocumentSegment.status: "completed",
+            DocumentSegment.enabled: True,
+            DocumentSegment.completed_at: datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        })
 
-            return tokens
+        db.session.commit()
+
+        return tokens
 
     @staticmethod
     def _check_document_paused_status(document_id: str):
@@ -766,30 +800,13 @@ class IndexingRunner:
         DocumentSegment.query.filter_by(document_id=dataset_document_id).update(update_params)
         db.session.commit()
 
-    @staticmethod
-    def batch_add_segments(segments: list[DocumentSegment], dataset: Dataset):
+    def _transform(self, index_processor: BaseIndexProcessor, dataset: Dataset,
+                   text_docs: list[Document], doc_language: str,
+                   process_rule: dict) -> tuple[list[Document], EmbeddingTokenCounter]:
         """
-        Batch add segments index processing
+        Clean and split the documents into chunks.
+        :return: the chunks and the token counter that memoized their counts while splitting
         """
-        documents = []
-        for segment in segments:
-            document = Document(
-                page_content=segment.content,
-                metadata={
-                    "doc_id": segment.index_node_id,
-                    "doc_hash": segment.index_node_hash,
-                    "document_id": segment.document_id,
-                    "dataset_id": segment.dataset_id,
-                }
-            )
-            documents.append(document)
-        # save vector index
-        index_type = dataset.doc_form
-        index_processor = IndexProcessorFactory(index_type).init_index_processor()
-        index_processor.load(dataset, documents)
-
-    def _transform(self, index_processor: BaseIndexProcessor, dataset: Dataset,
-                   text_docs: list[Document], doc_language: str, process_rule: dict) -> list[Document]:
         # get embedding model instance
         embedding_model_instance = None
         if dataset.indexing_technique == 'high_quality':
@@ -806,13 +823,15 @@ class IndexingRunner:
                     model_type=ModelType.TEXT_EMBEDDING,
                 )
 
+        token_counter = EmbeddingTokenCounter(embedding_model_instance)
         documents = index_processor.transform(text_docs, embedding_model_instance=embedding_model_instance,
                                               process_rule=process_rule, tenant_id=dataset.tenant_id,
-                                              doc_language=doc_language)
+                                              doc_language=doc_language, token_counter=token_counter)
 
-        return documents
+        return documents, token_counter
 
-    def _load_segments(self, dataset, dataset_document, documents):
+    def _load_segments(self, dataset, dataset_document, documents,
+                       token_counter: Optional[EmbeddingTokenCounter] = None):
         # save node to document segment
         doc_store = DatasetDocumentStore(
             dataset=dataset,
@@ -821,7 +840,7 @@ class IndexingRunner:
         )
 
         # add document segments
-        doc_store.add_documents(documents)
+        doc_store.add_documents(documents, token_counter=token_counter)
 
         # update document status to indexing
         cur_time = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
@@ -842,7 +861,9 @@ class IndexingRunner:
                 DocumentSegment.indexing_at: datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
             }
         )
-        pass
+
+        # from here on a failed or paused document resumes indexing from its stored segments
+        IndexingCheckpoint(dataset_document).save_split(len(documents))
 
 
 class DocumentIsPausedException(Exception):
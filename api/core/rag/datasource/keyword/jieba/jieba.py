@@ -1,3 +1,4 @@
+import heapq
 import json
 from collections import defaultdict
 from typing import Any, Optional
@@ -7,6 +8,7 @@ from pydantic import BaseModel
 from configs import dify_config
 from core.rag.datasource.keyword.jieba.jieba_keyword_table_handler import JiebaKeywordTableHandler
 from core.rag.datasource.keyword.keyword_base import BaseKeyword
+from core.rag.datasource.keyword.keyword_scorer import KeywordScoreMethod, bm25_keyword_weights
 from core.rag.models.document import Document
 from extensions.ext_database import db
 from extensions.ext_redis import redis_client
@@ -78,28 +80,13 @@ class Jieba(BaseKeyword):
 
         k = kwargs.get('top_k', 4)
 
-        sorted_chunk_indices = self._retrieve_ids_by_query(keyword_table, query, k)
-
-        documents = []
-        for chunk_index in sorted_chunk_indices:
-            segment = db.session.query(DocumentSegment).filter(
-                DocumentSegment.dataset_id == self.dataset.id,
-                DocumentSegment.index_node_id == chunk_index
-            ).first()
-
-            if segment:
-
-                documents.append(Document(
-                    page_content=segment.content,
-                    metadata={
-                        "doc_id": chunk_index,
-                        "doc_hash": segment.index_node_hash,
-                        "document_id": segment.document_id,
-                        "dataset_id": segment.dataset_id,
-                    }
-                ))
+        if dify_config.KEYWORD_SEARCH_SCORE_METHOD == KeywordScoreMethod.BM25.value:
+            chunk_scores = self._retrieve_ids_by_bm25(keyword_table, query, k)
+        else:
+            chunk_scores = [(chunk_index, None) for chunk_index in
+                            self._retrieve_ids_by_query(keyword_table, query, k)]
 
-        return documents
+        return self._get_documents_by_chunk_indices(chunk_scores)
 
     def delete(self) -> None:
         lock_name = 'keyword_indexing_lock_{}'.format(self.dataset.id)
@@ -191,7 +178,7 @@ class Jieba(BaseKeyword):
 
         # go through text chunks in order of most matching keywords
         chunk_indices_count: dict[str, int] = defaultdict(int)
-        keywords = [keyword for keyword in keywords if keyword in set(keyword_table.keys())]
+        keywords = [keyword for keyword in keywords if keyword in keyword_table]
         for keyword in keywords:
             for node_id in keyword_table[keyword]:
                 chunk_indices_count[node_id] += 1
@@ -204,6 +191,24 @@ class Jieba(BaseKeyword):
 
         return sorted_chunk_indices[: k]
 
+    def _retrieve_ids_by_bm25(self, keyword_table: dict, query: str, k: int = 4) -> list[tuple[str, float]]:
+        keyword_table_handler = JiebaKeywordTableHandler()
+        keywords = keyword_table_handler.extract_keywords(query)
+
+        # document frequencies are the sizes of the keyword postings
+        document_frequencies = {keyword: len(keyword_table[keyword]) for keyword in keywords if keyword in keyword_table}
+        if not document_frequencies:
+            return []
+        document_count = max(self.dataset.available_segment_count or 0, *document_frequencies.values())
+        keyword_weights = bm25_keyword_weights(keywords, document_frequencies, document_count)
+
+        chunk_scores: dict[str, float] = defaultdict(float)
+        for keyword, weight in keyword_weights.items():
+            for node_id in keyword_table[keyword]:
+                chunk_scores[node_id] += weight
+
+        return heapq.nlargest(k, chunk_scores.items(), key=lambda x: x[1])
+
     def _update_segment_keywords(self, dataset_id: str, node_id: str, keywords: list[str]):
         document_segment = db.session.query(DocumentSegment).filter(
             DocumentSegment.dataset_id == dataset_id,
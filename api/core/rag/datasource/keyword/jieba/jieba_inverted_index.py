@@ -0,0 +1,244 @@
+import logging
+from collections.abc import Iterable
+from typing import Any, Optional
+
+from sqlalchemy import case, func
+from sqlalchemy.dialects.postgresql import insert
+
+from configs import dify_config
+from core.rag.datasource.keyword.jieba.jieba import KeywordTableConfig
+from core.rag.datasource.keyword.jieba.jieba_keyword_table_handler import JiebaKeywordTableHandler
+from core.rag.datasource.keyword.keyword_base import BaseKeyword
+from core.rag.datasource.keyword.keyword_scorer import KeywordScoreMethod, bm25_keyword_weights
+from core.rag.models.document import Document
+from extensions.ext_database import db
+from extensions.ext_redis import redis_client
+from extensions.ext_storage import storage
+from models.dataset import Dataset, DatasetKeywordPosting, DatasetKeywordTable, DocumentSegment
+
+logger = logging.getLogger(__name__)
+
+# number of rows per posting insert and ids per IN (...) query
+POSTING_BATCH_SIZE = 1000
+MAX_KEYWORD_LENGTH = 255
+
+# datasets whose legacy keyword table has already been checked in this process
+_migrated_dataset_ids: set[str] = set()
+
+
+class JiebaInvertedIndex(BaseKeyword):
+    """
+    Jieba keyword store that keeps one posting row per (dataset, keyword, segment) instead of
+    a whole-table JSON blob, so every write only touches the postings of the segments it changes.
+    """
+
+    def __init__(self, dataset: Dataset):
+        super().__init__(dataset)
+        self._config = KeywordTableConfig()
+
+    def create(self, texts: list[Document], **kwargs) -> BaseKeyword:
+        self.add_texts(texts, **kwargs)
+
+        return self
+
+    def add_texts(self, texts: list[Document], **kwargs):
+        self.migrate_keyword_table()
+        keyword_table_handler = JiebaKeywordTableHandler()
+        keywords_list = kwargs.get('keywords_list')
+        node_keywords = {}
+        for i, text in enumerate(texts):
+            keywords = keywords_list[i] if keywords_list else None
+            if not keywords:
+                keywords = keyword_table_handler.extract_keywords(text.page_content,
+                                                                  self._config.max_keywords_per_chunk)
+            node_keywords[text.metadata['doc_id']] = list(keywords)
+
+        self._update_segments_keywords(node_keywords)
+        self._add_postings(node_keywords)
+
+    def text_exists(self, id: str) -> bool:
+        self.migrate_keyword_table()
+        posting = db.session.query(DatasetKeywordPosting.id).filter(
+            DatasetKeywordPosting.dataset_id == self.dataset.id,
+            DatasetKeywordPosting.index_node_id == id
+        ).first()
+        return posting is not None
+
+    def delete_by_ids(self, ids: list[str]) -> None:
+        self.migrate_keyword_table()
+        for i in range(0, len(ids), POSTING_BATCH_SIZE):
+            db.session.query(DatasetKeywordPosting).filter(
+                DatasetKeywordPosting.dataset_id == self.dataset.id,
+                DatasetKeywordPosting.index_node_id.in_(ids[i:i + POSTING_BATCH_SIZE])
+            ).delete(synchronize_session=False)
+        db.session.commit()
+
+    def search(
+            self, query: str,
+            **kwargs: Any
+    ) -> list[Document]:
+        self.migrate_keyword_table()
+        k = kwargs.get('top_k', 4)
+
+        keyword_table_handler = JiebaKeywordTableHandler()
+        keywords = keyword_table_handler.extract_keywords(query)
+        if not keywords:
+            return []
+
+        if dify_config.KEYWORD_SEARCH_SCORE_METHOD == KeywordScoreMethod.BM25.value:
+            chunk_scores = self._retrieve_ids_by_bm25(keywords, k)
+        else:
+            chunk_scores = self._retrieve_ids_by_keyword_count(keywords, k)
+
+        return self._get_documents_by_chunk_indices(chunk_scores)
+
+    def _retrieve_ids_by_keyword_count(self, keywords: set[str], k: int) -> list[tuple[str, Optional[float]]]:
+        # go through text chunks in order of most matching keywords
+        score = func.count(DatasetKeywordPosting.id)
+        rows = db.session.query(DatasetKeywordPosting.index_node_id, score).filter(
+            DatasetKeywordPosting.dataset_id == self.dataset.id,
+            DatasetKeywordPosting.keyword.in_(list(keywords))
+        ).group_by(DatasetKeywordPosting.index_node_id).order_by(
+            score.desc(), DatasetKeywordPosting.index_node_id
+        ).limit(k).all()
+
+        return [(row.index_node_id, None) for row in rows]
+
+    def _retrieve_ids_by_bm25(self, keywords: set[str], k: int) -> list[tuple[str, float]]:
+        # document frequencies are the sizes of the keyword postings
+        rows = db.session.query(DatasetKeywordPosting.keyword, func.count(DatasetKeywordPosting.id)).filter(
+            DatasetKeywordPosting.dataset_id == self.dataset.id,
+            DatasetKeywordPosting.keyword.in_(list(keywords))
+        ).group_by(DatasetKeywordPosting.keyword).all()
+        document_frequencies = dict(rows)
+        if not document_frequencies:
+            return []
+        document_count = max(self.dataset.available_segment_count or 0, *document_frequencies.values())
+        keyword_weights = bm25_keyword_weights(keywords, document_frequencies, document_count)
+
+        score = func.sum(case(keyword_weights, value=DatasetKeywordPosting.keyword, else_=0.0))
+        rows = db.session.query(DatasetKeywordPosting.index_node_id, score).filter(
+            DatasetKeywordPosting.dataset_id == self.dataset.id,
+            DatasetKeywordPosting.keyword.in_(list(keyword_weights.keys()))
+        ).group_by(DatasetKeywordPosting.index_node_id).order_by(
+            score.desc(), DatasetKeywordPosting.index_node_id
+        ).limit(k).all()
+
+        return [(node_id, float(node_score)) for node_id, node_score in rows]
+
+    def delete(self) -> None:
+        db.session.query(DatasetKeywordPosting).filter(
+            DatasetKeywordPosting.dataset_id == self.dataset.id
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        self._delete_legacy_keyword_table()
+
+    def create_segment_keywords(self, node_id: str, keywords: list[str]):
+        self.migrate_keyword_table()
+        self._update_segments_keywords({node_id: keywords})
+        self._add_postings({node_id: keywords})
+
+    def multi_create_segment_keywords(self, pre_segment_data_list: list):
+        self.migrate_keyword_table()
+        keyword_table_handler = JiebaKeywordTableHandler()
+        node_keywords = {}
+        for pre_segment_data in pre_segment_data_list:
+            segment = pre_segment_data['segment']
+            if pre_segment_data['keywords']:
+                segment.keywords = pre_segment_data['keywords']
+            else:
+                keywords = keyword_table_handler.extract_keywords(segment.content,
+                                                                  self._config.max_keywords_per_chunk)
+                segment.keywords = list(keywords)
+            node_keywords[segment.index_node_id] = segment.keywords
+        self._add_postings(node_keywords)
+
+    def update_segment_keywords_index(self, node_id: str, keywords: list[str]):
+        self.migrate_keyword_table()
+        self._add_postings({node_id: keywords})
+
+    def migrate_keyword_table(self) -> None:
+        """
+        Copy the postings of a dataset out of the legacy whole-table keyword store, a dataset with postings
+        is migrated already. The legacy table is kept, so the dataset can go back to the jieba keyword store,
+        until `delete_legacy_keyword_table` removes it.
+        """
+        if self.dataset.id in _migrated_dataset_ids:
+            return
+
+        if self.dataset.dataset_keyword_table and not self._has_postings():
+            lock_name = 'keyword_indexing_lock_{}'.format(self.dataset.id)
+            with redis_client.lock(lock_name, timeout=600):
+                # another worker may have migrated the dataset while we were waiting for the lock
+                dataset_keyword_table = self.dataset.dataset_keyword_table
+                if dataset_keyword_table and not self._has_postings():
+                    keyword_table_dict = dataset_keyword_table.keyword_table_dict
+                    if keyword_table_dict:
+                        keyword_table = keyword_table_dict['__data__']['table']
+                        self._insert_postings(
+                            (keyword, node_id) for keyword, node_ids in keyword_table.items() for node_id in node_ids
+                        )
+
+        _migrated_dataset_ids.add(self.dataset.id)
+
+    def delete_legacy_keyword_table(self) -> None:
+        """
+        Remove the legacy keyword table of a dataset after copying its postings. Keywords written since the
+        migration only exist as postings, the jieba keyword store can no longer serve the dataset afterwards.
+        """
+        self.migrate_keyword_table()
+        self._delete_legacy_keyword_table()
+
+    def _has_postings(self) -> bool:
+        posting = db.session.query(DatasetKeywordPosting.id).filter(
+            DatasetKeywordPosting.dataset_id == self.dataset.id
+        ).first()
+        return posting is not None
+
+    def _add_postings(self, node_keywords: dict[str, list[str]]) -> None:
+        self._insert_postings(
+            (keyword, node_id) for node_id, keywords in node_keywords.items() for keyword in keywords
+        )
+
+    def _insert_postings(self, postings: Iterable[tuple[str, str]]) -> None:
+        values = []
+        long_keywords = set()
+        for keyword, node_id in postings:
+            if not keyword:
+                continue
+            if len(keyword) > MAX_KEYWORD_LENGTH:
+                long_keywords.add(keyword)
+                continue
+            values.append({'dataset_id': self.dataset.id, 'keyword': keyword, 'index_node_id': node_id})
+        if long_keywords:
+            logger.warning(f'Skipped {len(long_keywords)} keywords of dataset {self.dataset.id} longer than '
+                           f'{MAX_KEYWORD_LENGTH} characters')
+
+        for i in range(0, len(values), POSTING_BATCH_SIZE):
+            stmt = insert(DatasetKeywordPosting).values(values[i:i + POSTING_BATCH_SIZE])
+            db.session.execute(stmt.on_conflict_do_nothing(
+                index_elements=['dataset_id', 'keyword', 'index_node_id']
+            ))
+        db.session.commit()
+
+    def _update_segments_keywords(self, node_keywords: dict[str, list[str]]) -> None:
+        node_ids = list(node_keywords.keys())
+        for i in range(0, len(node_ids), POSTING_BATCH_SIZE):
+            segments = db.session.query(DocumentSegment).filter(
+                DocumentSegment.dataset_id == self.dataset.id,
+                DocumentSegment.index_node_id.in_(node_ids[i:i + POSTING_BATCH_SIZE])
+            ).all()
+            for segment in segments:
+                segment.keywords = node_keywords[segment.index_node_id]
+        db.session.commit()
+
+    def _delete_legacy_keyword_table(self) -> None:
+        dataset_keyword_table = db.session.query(DatasetKeywordTable).filter(
+            DatasetKeywordTable.dataset_id == self.dataset.id
+        ).first()
+        if dataset_keyword_table:
+            db.session.delete(dataset_keyword_table)
+            db.session.commit()
+            if dataset_keyword_table.data_source_type != 'database':
+                file_key = 'keyword_files/' + self.dataset.tenant_id + '/' + self.dataset.id + '.txt'
+                storage.delete(file_key)
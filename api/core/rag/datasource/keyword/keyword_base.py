@@ -1,10 +1,11 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from typing import Any
+from typing import Any, Optional
 
 from core.rag.models.document import Document
-from models.dataset import Dataset
+from extensions.ext_database import db
+from models.dataset import Dataset, DocumentSegment
 
 
 class BaseKeyword(ABC):
@@ -48,3 +49,36 @@ class BaseKeyword(ABC):
 
     def _get_uuids(self, texts: list[Document]) -> list[str]:
         return [text.metadata['doc_id'] for text in texts]
+
+    def _get_documents_by_chunk_indices(self, chunk_scores: list[tuple[str, Optional[float]]]) -> list[Document]:
+        """
+        Fetch the segments of the ranked chunks with one query and build documents in rank order.
+        """
+        if not chunk_scores:
+            return []
+
+        segments = db.session.query(DocumentSegment).filter(
+            DocumentSegment.dataset_id == self.dataset.id,
+            DocumentSegment.index_node_id.in_([chunk_index for chunk_index, _ in chunk_scores])
+        ).all()
+        segment_map = {segment.index_node_id: segment for segment in segments}
+
+        documents = []
+        for chunk_index, score in chunk_scores:
+            segment = segment_map.get(chunk_index)
+            if segment:
+                metadata = {
+                    "doc_id": chunk_index,
+                    "doc_hash": segment.index_node_hash,
+                    "document_id": segment.document_id,
+                    "dataset_id": segment.dataset_id,
+                }
+                if score is not None:
+                    # kept apart from 'score', which rerankers read as a vector similarity
+                    metadata['keyword_score'] = score
+                documents.append(Document(
+                    page_content=segment.content,
+                    metadata=metadata
+                ))
+
+        return documents
@@ -2,6 +2,7 @@ from typing import Any
 
 from configs import dify_config
 from core.rag.datasource.keyword.jieba.jieba import Jieba
+from core.rag.datasource.keyword.jieba.jieba_inverted_index import JiebaInvertedIndex
 from core.rag.datasource.keyword.keyword_base import BaseKeyword
 from core.rag.models.document import Document
 from models.dataset import Dataset
@@ -23,6 +24,10 @@ class Keyword:
             return Jieba(
                 dataset=self._dataset
             )
+        elif keyword_type == "jieba_inverted_index":
+            return JiebaInvertedIndex(
+                dataset=self._dataset
+            )
         else:
             raise ValueError(f"Keyword store {keyword_type} is not supported.")
 
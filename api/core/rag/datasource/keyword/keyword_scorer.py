@@ -0,0 +1,36 @@
+import math
+from enum import Enum
+
+
+class KeywordScoreMethod(Enum):
+    KEYWORD_COUNT = 'keyword_count'
+    BM25 = 'bm25'
+
+
+def bm25_idf(document_count: int, document_frequency: int) -> float:
+    """
+    BM25 inverse document frequency of a keyword, always positive.
+    :param document_count: number of indexed segments
+    :param document_frequency: number of indexed segments containing the keyword
+    """
+    document_frequency = min(document_frequency, document_count)
+    return math.log((document_count - document_frequency + 0.5) / (document_frequency + 0.5) + 1)
+
+
+def bm25_keyword_weights(query_keywords: set[str], document_frequencies: dict[str, int],
+                         document_count: int) -> dict[str, float]:
+    """
+    Weight of each query keyword, normalized so that a segment matching every indexed query keyword scores 1.
+
+    Keyword postings only record whether a segment contains a keyword, so term frequencies are binary
+    and every segment holds at most `max_keywords_per_chunk` keywords. With those inputs the BM25
+    length normalisation is constant and a segment's score is the sum of the weights of its matched keywords.
+    """
+    idfs = {
+        keyword: bm25_idf(document_count, document_frequencies[keyword])
+        for keyword in query_keywords if document_frequencies.get(keyword)
+    }
+    max_score = sum(idfs.values())
+    if not max_score:
+        return {}
+    return {keyword: idf / max_score for keyword, idf in idfs.items()}
@@ -4,13 +4,14 @@ from typing import Any, Optional
 from urllib.parse import urlparse
 
 import requests
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, helpers
 from flask import current_app
 from pydantic import BaseModel, model_validator
 
 from core.rag.datasource.entity.embedding import Embeddings
 from core.rag.datasource.vdb.field import Field
 from core.rag.datasource.vdb.vector_base import BaseVector
+from core.rag.datasource.vdb.vector_client_registry import vector_client_registry
 from core.rag.datasource.vdb.vector_factory import AbstractVectorFactory
 from core.rag.datasource.vdb.vector_type import VectorType
 from core.rag.models.document import Document
@@ -42,7 +43,12 @@ class ElasticSearchConfig(BaseModel):
 class ElasticSearchVector(BaseVector):
     def __init__(self, index_name: str, config: ElasticSearchConfig, attributes: list):
         super().__init__(index_name.lower())
-        self._client = self._init_client(config)
+        self._client = vector_client_registry.get(
+            key=(VectorType.ELASTICSEARCH, config.model_dump_json()),
+            create=lambda: self._init_client(config),
+            close=lambda client: client.close(),
+            health_check=lambda client: client.info()
+        )
         self._version = self._get_version()
         self._check_version()
         self._attributes = attributes
@@ -93,6 +99,40 @@ class ElasticSearchVector(BaseVector):
     def text_exists(self, id: str) -> bool:
         return self._client.exists(index=self._collection_name, id=id).__bool__()
 
+    def ids_exist(self, ids: list[str]) -> set[str]:
+        if not ids or not self._client.indices.exists(index=self._collection_name):
+            return set()
+        response = self._client.mget(index=self._collection_name, ids=ids, source=False)
+        return {doc['_id'] for doc in response['docs'] if doc.get('found')}
+
+    def get_embeddings_by_ids(self, ids: list[str]) -> dict[str, list[float]]:
+        if not ids or not self._client.indices.exists(index=self._collection_name):
+            return {}
+        response = self._client.mget(index=self._collection_name, ids=ids, source=[Field.VECTOR.value])
+        return {
+            doc['_id']: doc['_source'][Field.VECTOR.value]
+            for doc in response['docs']
+            if doc.get('found') and doc['_source'].get(Field.VECTOR.value)
+        }
+
+    def _upsert_batch(self, documents: list[Document], embeddings: list[list[float]], **kwargs) -> None:
+        self.create_collection(embeddings, [d.metadata for d in documents])
+        # documents are indexed with their doc_id as _id, a bulk index replaces the stored ones
+        actions = [
+            {
+                '_index': self._collection_name,
+                '_id': document.metadata['doc_id'],
+                '_source': {
+                    Field.CONTENT_KEY.value: document.page_content,
+                    Field.VECTOR.value: embeddings[i] if embeddings[i] else None,
+                    Field.METADATA_KEY.value: document.metadata if document.metadata else {}
+                }
+            }
+            for i, document in enumerate(documents)
+        ]
+        helpers.bulk(self._client, actions)
+        self._client.indices.refresh(index=self._collection_name)
+
     def delete_by_ids(self, ids: list[str]) -> None:
         for id in ids:
             self._client.delete(index=self._collection_name, id=id)
@@ -10,6 +10,7 @@ from configs import dify_config
 from core.rag.datasource.entity.embedding import Embeddings
 from core.rag.datasource.vdb.field import Field
 from core.rag.datasource.vdb.vector_base import BaseVector
+from core.rag.datasource.vdb.vector_client_registry import vector_client_registry
 from core.rag.datasource.vdb.vector_factory import AbstractVectorFactory
 from core.rag.datasource.vdb.vector_type import VectorType
 from core.rag.models.document import Document
@@ -52,7 +53,12 @@ class MilvusVector(BaseVector):
     def __init__(self, collection_name: str, config: MilvusConfig):
         super().__init__(collection_name)
         self._client_config = config
-        self._client = self._init_client(config)
+        self._client = vector_client_registry.get(
+            key=(VectorType.MILVUS, config.model_dump_json()),
+            create=lambda: self._init_client(config),
+            close=lambda client: client.close(),
+            health_check=lambda client: client.list_collections()
+        )
         self._consistency_level = 'Session'
         self._fields = []
 
@@ -136,6 +142,26 @@ class MilvusVector(BaseVector):
 
         return len(result) > 0
 
+    def ids_exist(self, ids: list[str]) -> set[str]:
+        if not ids or not self._client.has_collection(self._collection_name):
+            return set()
+
+        result = self._client.query(collection_name=self._collection_name,
+                                    filter=f'metadata["doc_id"] in {ids}',
+                                    output_fields=[Field.METADATA_KEY.value])
+
+        return {item[Field.METADATA_KEY.value]['doc_id'] for item in result}
+
+    def get_embeddings_by_ids(self, ids: list[str]) -> dict[str, list[float]]:
+        if not ids or not self._client.has_collection(self._collection_name):
+            return {}
+
+        result = self._client.query(collection_name=self._collection_name,
+                                    filter=f'metadata["doc_id"] in {ids}',
+                                    output_fields=[Field.METADATA_KEY.value, Field.VECTOR.value])
+
+        return {item[Field.METADATA_KEY.value]['doc_id']: list(item[Field.VECTOR.value]) for item in result}
+
     def search_by_vector(self, query_vector: list[float], **kwargs: Any) -> list[Document]:
 
         # Set search parameters.
@@ -12,6 +12,7 @@ from configs import dify_config
 from core.rag.datasource.entity.embedding import Embeddings
 from core.rag.datasource.vdb.field import Field
 from core.rag.datasource.vdb.vector_base import BaseVector
+from core.rag.datasource.vdb.vector_client_registry import vector_client_registry
 from core.rag.datasource.vdb.vector_factory import AbstractVectorFactory
 from core.rag.datasource.vdb.vector_type import VectorType
 from core.rag.models.document import Document
@@ -60,7 +61,12 @@ class OpenSearchVector(BaseVector):
     def __init__(self, collection_name: str, config: OpenSearchConfig):
         super().__init__(collection_name)
         self._client_config = config
-        self._client = OpenSearch(**config.to_opensearch_params())
+        self._client = vector_client_registry.get(
+            key=(VectorType.OPENSEARCH, config.model_dump_json()),
+            create=lambda: OpenSearch(**config.to_opensearch_params()),
+            close=lambda client: client.close(),
+            health_check=lambda client: client.info()
+        )
 
     def get_type(self) -> str:
         return VectorType.OPENSEARCH
@@ -141,6 +147,21 @@ class OpenSearchVector(BaseVector):
         except:
             return False
 
+    def ids_exist(self, ids: list[str]) -> set[str]:
+        index_name = self._collection_name.lower()
+        if not ids or not self._client.indices.exists(index=index_name):
+            return set()
+
+        # documents are indexed under a random _id, look them up by the doc_id of their metadata
+        doc_id_field = f"{Field.METADATA_KEY.value}.doc_id"
+        query = {
+            "size": len(ids),
+            "_source": [doc_id_field],
+            "query": {"terms": {doc_id_field: ids}},
+        }
+        response = self._client.search(index=index_name, body=query)
+        return {hit['_source'][Field.METADATA_KEY.value]['doc_id'] for hit in response['hits']['hits']}
+
     def search_by_vector(self, query_vector: list[float], **kwargs: Any) -> list[Document]:
         # Make sure query_vector is a list
         if not isinstance(query_vector, list):
@@ -15,6 +15,7 @@ from pydantic import BaseModel, model_validator
 from configs import dify_config
 from core.rag.datasource.entity.embedding import Embeddings
 from core.rag.datasource.vdb.vector_base import BaseVector
+from core.rag.datasource.vdb.vector_client_registry import vector_client_registry
 from core.rag.datasource.vdb.vector_factory import AbstractVectorFactory
 from core.rag.datasource.vdb.vector_type import VectorType
 from core.rag.models.document import Document
@@ -104,6 +105,20 @@ class OracleVector(BaseVector):
                 outconverter=self.numpy_converter_out,
             )
     def _create_connection_pool(self, config: OracleVectorConfig):
+        return vector_client_registry.get(
+            key=(VectorType.ORACLE, config.model_dump_json()),
+            create=lambda: self._connect(config),
+            close=lambda pool: pool.close(force=True),
+            health_check=self._check_connection_pool
+        )
+
+    @staticmethod
+    def _check_connection_pool(pool):
+        with pool.acquire() as conn:
+            conn.ping()
+
+    @staticmethod
+    def _connect(config: OracleVectorConfig):
         return oracledb.create_pool(user=config.user, password=config.password, dsn="{}:{}/{}".format(config.host, config.port, config.database), min=1, max=50, increment=1)
 
 
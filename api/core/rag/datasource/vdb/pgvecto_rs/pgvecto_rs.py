@@ -15,6 +15,7 @@ from configs import dify_config
 from core.rag.datasource.entity.embedding import Embeddings
 from core.rag.datasource.vdb.pgvecto_rs.collection import CollectionORM
 from core.rag.datasource.vdb.vector_base import BaseVector
+from core.rag.datasource.vdb.vector_client_registry import vector_client_registry
 from core.rag.datasource.vdb.vector_factory import AbstractVectorFactory
 from core.rag.datasource.vdb.vector_type import VectorType
 from core.rag.models.document import Document
@@ -52,7 +53,12 @@ class PGVectoRS(BaseVector):
         super().__init__(collection_name)
         self._client_config = config
         self._url = f"postgresql+psycopg2://{config.user}:{config.password}@{config.host}:{config.port}/{config.database}"
-        self._client = create_engine(self._url)
+        # connections are checked out of the pool with a ping, the engine needs no health check
+        self._client = vector_client_registry.get(
+            key=(VectorType.PGVECTO_RS, self._url),
+            create=lambda: create_engine(self._url, pool_pre_ping=True),
+            close=lambda engine: engine.dispose()
+        )
         with Session(self._client) as session:
             session.execute(text("CREATE EXTENSION IF NOT EXISTS vectors"))
             session.commit()
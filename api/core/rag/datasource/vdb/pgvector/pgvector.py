@@ -1,4 +1,8 @@
+import hashlib
 import json
+import logging
+import math
+import threading
 import uuid
 from contextlib import contextmanager
 from typing import Any
@@ -6,15 +10,20 @@ from typing import Any
 import psycopg2.extras
 import psycopg2.pool
 from pydantic import BaseModel, model_validator
+from redis.exceptions import LockNotOwnedError
 
 from configs import dify_config
 from core.rag.datasource.entity.embedding import Embeddings
 from core.rag.datasource.vdb.vector_base import BaseVector
+from core.rag.datasource.vdb.vector_client_registry import vector_client_registry
 from core.rag.datasource.vdb.vector_factory import AbstractVectorFactory
 from core.rag.datasource.vdb.vector_type import VectorType
 from core.rag.models.document import Document
 from extensions.ext_redis import redis_client
 from models.dataset import Dataset
+from tasks.create_pgvector_indexes_task import create_pgvector_indexes_task
+
+logger = logging.getLogger(__name__)
 
 
 class PGVectorConfig(BaseModel):
@@ -23,6 +32,14 @@ class PGVectorConfig(BaseModel):
     user: str
     password: str
     database: str
+    max_connection: int = 20
+    index_type: str = "hnsw"
+    index_min_rows: int = 10000
+    hnsw_m: int = 16
+    hnsw_ef_construction: int = 64
+    hnsw_ef_search: int = 40
+    ivfflat_lists: int = 0
+    ivfflat_probes: int = 10
 
     @model_validator(mode='before')
     def validate_config(cls, values: dict) -> dict:
@@ -36,22 +53,62 @@ class PGVectorConfig(BaseModel):
             raise ValueError("config PGVECTOR_PASSWORD is required")
         if not values["database"]:
             raise ValueError("config PGVECTOR_DATABASE is required")
+        if values.get("index_type", "hnsw") not in ("hnsw", "ivfflat", "none"):
+            raise ValueError("config PGVECTOR_INDEX_TYPE must be one of hnsw, ivfflat and none")
         return values
 
 
+# generated columns need an immutable expression, so the text search configuration is explicit
+TEXT_SEARCH_CONFIG = "english"
+TEXT_SEARCH_EXPRESSION = f"to_tsvector('{TEXT_SEARCH_CONFIG}', text)"
+
 SQL_CREATE_TABLE = """
 CREATE TABLE IF NOT EXISTS {table_name} (
     id UUID PRIMARY KEY,
     text TEXT NOT NULL,
     meta JSONB NOT NULL,
-    embedding vector({dimension}) NOT NULL
+    embedding vector({dimension}) NOT NULL,
+    text_tsv tsvector GENERATED ALWAYS AS (""" + TEXT_SEARCH_EXPRESSION + """) STORED
 ) using heap;
 """
 
+# pgvector indexes vectors of up to 2000 dimensions
+MAX_INDEX_DIMENSION = 2000
+
+# tables known to have the generated text_tsv column, collections created before it was added
+# search the full text index built on the expression instead
+_text_search_column_tables: dict[str, bool] = {}
+
+
+class BlockingConnectionPool(psycopg2.pool.ThreadedConnectionPool):
+    """
+    Thread-safe pool whose getconn waits for a connection to be put back once all `maxconn` connections
+    are in use, instead of raising PoolError like ThreadedConnectionPool.
+    """
+
+    def __init__(self, minconn: int, maxconn: int, *args, **kwargs):
+        self._semaphore = threading.BoundedSemaphore(maxconn)
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def getconn(self, key=None):
+        self._semaphore.acquire()
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._semaphore.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self._semaphore.release()
+
 
 class PGVector(BaseVector):
     def __init__(self, collection_name: str, config: PGVectorConfig):
         super().__init__(collection_name)
+        self._config = config
         self.pool = self._create_connection_pool(config)
         self.table_name = f"embedding_{collection_name}"
 
@@ -59,19 +116,40 @@ class PGVector(BaseVector):
         return VectorType.PGVECTOR
 
     def _create_connection_pool(self, config: PGVectorConfig):
-        return psycopg2.pool.SimpleConnectionPool(
-            1,
-            5,
-            host=config.host,
-            port=config.port,
-            user=config.user,
-            password=config.password,
-            database=config.database,
+        # the pool is shared by the threads of the process, so it must be the thread-safe one,
+        # threads wait for a connection when all of them are in use
+        return vector_client_registry.get(
+            key=(VectorType.PGVECTOR, config.model_dump_json()),
+            create=lambda: BlockingConnectionPool(
+                1,
+                config.max_connection,
+                host=config.host,
+                port=config.port,
+                user=config.user,
+                password=config.password,
+                database=config.database,
+            ),
+            close=lambda pool: pool.closeall(),
+            health_check=self._check_connection_pool,
         )
 
+    @staticmethod
+    def _check_connection_pool(pool: BlockingConnectionPool):
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+        finally:
+            pool.putconn(conn)
+
     @contextmanager
     def _get_cursor(self):
         conn = self.pool.getconn()
+        if conn.closed:
+            # the server closed the connection while it was idle in the pool
+            self.pool.putconn(conn, close=True)
+            conn = self.pool.getconn()
         cur = conn.cursor()
         try:
             yield cur
@@ -80,6 +158,18 @@ class PGVector(BaseVector):
             conn.commit()
             self.pool.putconn(conn)
 
+    @contextmanager
+    def _get_autocommit_cursor(self):
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+        conn = self.pool.getconn()
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                yield cur
+        finally:
+            conn.autocommit = False
+            self.pool.putconn(conn)
+
     def create(self, texts: list[Document], embeddings: list[list[float]], **kwargs):
         dimension = len(embeddings[0])
         self._create_collection(dimension)
@@ -103,6 +193,7 @@ class PGVector(BaseVector):
             psycopg2.extras.execute_values(
                 cur, f"INSERT INTO {self.table_name} (id, text, meta, embedding) VALUES %s", values
             )
+        self._create_indexes_if_needed()
         return pks
 
     def text_exists(self, id: str) -> bool:
@@ -110,6 +201,38 @@ class PGVector(BaseVector):
             cur.execute(f"SELECT id FROM {self.table_name} WHERE id = %s", (id,))
             return cur.fetchone() is not None
 
+    def ids_exist(self, ids: list[str]) -> set[str]:
+        if not ids:
+            return set()
+        with self._get_cursor() as cur:
+            cur.execute(f"SELECT id::text FROM {self.table_name} WHERE id = ANY(%s::uuid[])", (ids,))
+            return {record[0] for record in cur}
+
+    def get_embeddings_by_ids(self, ids: list[str]) -> dict[str, list[float]]:
+        if not ids:
+            return {}
+        with self._get_cursor() as cur:
+            cur.execute(
+                f"SELECT id::text, embedding::text FROM {self.table_name} WHERE id = ANY(%s::uuid[])", (ids,)
+            )
+            return {record[0]: json.loads(record[1]) for record in cur}
+
+    def _upsert_batch(self, documents: list[Document], embeddings: list[list[float]], **kwargs) -> None:
+        self._create_collection(len(embeddings[0]))
+        values = [
+            (doc.metadata["doc_id"], doc.page_content, json.dumps(doc.metadata), embeddings[i])
+            for i, doc in enumerate(documents)
+        ]
+        with self._get_cursor() as cur:
+            psycopg2.extras.execute_values(
+                cur,
+                f"INSERT INTO {self.table_name} (id, text, meta, embedding) VALUES %s "
+                "ON CONFLICT (id) DO UPDATE SET text = EXCLUDED.text, meta = EXCLUDED.meta, "
+                "embedding = EXCLUDED.embedding",
+                values,
+            )
+        self._create_indexes_if_needed()
+
     def get_by_ids(self, ids: list[str]) -> list[Document]:
         with self._get_cursor() as cur:
             cur.execute(f"SELECT meta, text FROM {self.table_name} WHERE id IN %s", (tuple(ids),))
@@ -132,11 +255,20 @@ class PGVector(BaseVector):
 
         :param query_vector: The input vector to search for similar items.
         :param top_k: The number of nearest neighbors to return, default is 5.
+        :param ef_search: Size of the candidate list of the HNSW index, default is PGVECTOR_HNSW_EF_SEARCH.
+        :param probes: Number of lists searched in the IVFFlat index, default is PGVECTOR_IVFFLAT_PROBES.
         :return: List of Documents that are nearest to the query vector.
         """
         top_k = kwargs.get("top_k", 5)
 
         with self._get_cursor() as cur:
+            # the settings only last until the end of the transaction of the search
+            if self._config.index_type == "hnsw":
+                # the index returns at most ef_search neighbors
+                ef_search = max(kwargs.get("ef_search") or self._config.hnsw_ef_search, top_k)
+                cur.execute("SET LOCAL hnsw.ef_search = %s", (ef_search,))
+            elif self._config.index_type == "ivfflat":
+                cur.execute("SET LOCAL ivfflat.probes = %s", (kwargs.get("probes") or self._config.ivfflat_probes,))
             cur.execute(
                 f"SELECT meta, text, embedding <=> %s AS distance FROM {self.table_name} ORDER BY distance LIMIT {top_k}",
                 (json.dumps(query_vector),),
@@ -153,12 +285,14 @@ class PGVector(BaseVector):
 
     def search_by_full_text(self, query: str, **kwargs: Any) -> list[Document]:
         top_k = kwargs.get("top_k", 5)
+        # the stored tsvector, or the expression of the full text index of older collections
+        tsvector = "text_tsv" if self._has_text_search_column() else TEXT_SEARCH_EXPRESSION
 
         with self._get_cursor() as cur:
             cur.execute(
-                f"""SELECT meta, text, ts_rank(to_tsvector(coalesce(text, '')), to_tsquery(%s)) AS score
+                f"""SELECT meta, text, ts_rank({tsvector}, to_tsquery('{TEXT_SEARCH_CONFIG}', %s)) AS score
                 FROM {self.table_name}
-                WHERE to_tsvector(text) @@ plainto_tsquery(%s)
+                WHERE {tsvector} @@ plainto_tsquery('{TEXT_SEARCH_CONFIG}', %s)
                 ORDER BY score DESC
                 LIMIT {top_k}""",
                 # f"'{query}'" is required in order to account for whitespace in query
@@ -177,6 +311,8 @@ class PGVector(BaseVector):
     def delete(self) -> None:
         with self._get_cursor() as cur:
             cur.execute(f"DROP TABLE IF EXISTS {self.table_name}")
+        _text_search_column_tables.pop(self.table_name, None)
+        redis_client.delete(f"vector_index_{self._collection_name}")
 
     def _create_collection(self, dimension: int):
         cache_key = f"vector_indexing_{self._collection_name}"
@@ -189,9 +325,130 @@ class PGVector(BaseVector):
             with self._get_cursor() as cur:
                 cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
                 cur.execute(SQL_CREATE_TABLE.format(table_name=self.table_name, dimension=dimension))
-                # TODO: create index https://github.com/pgvector/pgvector?tab=readme-ov-file#indexing
+            _text_search_column_tables.pop(self.table_name, None)
             redis_client.set(collection_exist_cache_key, 1, ex=3600)
 
+    def _create_indexes_if_needed(self):
+        """
+        Queue the build of the indexes once the collection has PGVECTOR_INDEX_MIN_ROWS rows, the writes
+        of the indexing do not wait for it.
+        """
+        index_exist_cache_key = f"vector_index_{self._collection_name}"
+        if redis_client.get(index_exist_cache_key):
+            return
+
+        min_rows = self._config.index_min_rows
+        with self._get_cursor() as cur:
+            # counting stops at the threshold, a large collection is not scanned
+            cur.execute(f"SELECT count(*) FROM (SELECT 1 FROM {self.table_name} LIMIT %s) AS head", (min_rows,))
+            if cur.fetchone()[0] < min_rows:
+                return
+
+        # one build is queued at a time, the following batches of the indexing do not queue another
+        if redis_client.set(f"{index_exist_cache_key}_queued", 1, nx=True, ex=7200):
+            create_pgvector_indexes_task.delay(self._collection_name)
+
+    def build_indexes(self) -> bool:
+        """
+        Create the indexes by one worker at a time, run by create_pgvector_indexes_task.
+        :return: whether the indexes were created
+        """
+        index_exist_cache_key = f"vector_index_{self._collection_name}"
+        lock = redis_client.lock(f"{index_exist_cache_key}_lock", timeout=7200)
+        # another worker is building the indexes
+        if not lock.acquire(blocking=False):
+            return False
+        try:
+            self.create_indexes()
+            redis_client.set(index_exist_cache_key, 1, ex=3600)
+            return True
+        except Exception:
+            logger.exception(f"Failed to create the indexes of {self.table_name}")
+            return False
+        finally:
+            try:
+                lock.release()
+            except LockNotOwnedError:
+                # the build outlasted the lock, another worker may have started one meanwhile
+                logger.warning(f"Lock of the index build of {self.table_name} expired before the build ended")
+            redis_client.delete(f"{index_exist_cache_key}_queued")
+
+    def create_indexes(self, rebuild_invalid: bool = False) -> None:
+        """
+        Create the ANN index of the embeddings and the full text index, concurrently so writes to the
+        collection go on while they are built.
+        :param rebuild_invalid: drop and build again the indexes left invalid by a failed build,
+            only safe when no other build of the collection is running
+        """
+        with self._get_autocommit_cursor() as cur:
+            if self._config.index_type in ("hnsw", "ivfflat"):
+                index_name = self._index_name(self._config.index_type)
+                self._drop_invalid_index(cur, index_name, rebuild_invalid)
+                cur.execute(
+                    "SELECT atttypmod FROM pg_attribute WHERE attrelid = to_regclass(%s) AND attname = 'embedding'",
+                    (self.table_name,),
+                )
+                record = cur.fetchone()
+                if record is None:
+                    return
+                dimension = record[0]
+                if dimension > MAX_INDEX_DIMENSION:
+                    logger.warning(
+                        f"Embeddings of {self.table_name} have {dimension} dimensions, "
+                        f"more than pgvector indexes, searches scan the whole collection"
+                    )
+                elif self._config.index_type == "hnsw":
+                    cur.execute(
+                        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {self.table_name} "
+                        f"USING hnsw (embedding vector_cosine_ops) "
+                        f"WITH (m = {self._config.hnsw_m}, ef_construction = {self._config.hnsw_ef_construction})"
+                    )
+                else:
+                    lists = self._config.ivfflat_lists
+                    if not lists:
+                        cur.execute(f"SELECT count(*) FROM {self.table_name}")
+                        rows = cur.fetchone()[0]
+                        lists = max(1, rows // 1000 if rows <= 1000000 else int(math.sqrt(rows)))
+                    cur.execute(
+                        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {self.table_name} "
+                        f"USING ivfflat (embedding vector_cosine_ops) WITH (lists = {lists})"
+                    )
+
+            index_name = self._index_name("text")
+            self._drop_invalid_index(cur, index_name, rebuild_invalid)
+            tsvector = "text_tsv" if self._has_text_search_column() else TEXT_SEARCH_EXPRESSION
+            cur.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {self.table_name} USING gin ({tsvector})"
+            )
+
+    def _drop_invalid_index(self, cur, index_name: str, rebuild_invalid: bool):
+        cur.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (index_name,))
+        record = cur.fetchone()
+        if record and not record[0]:
+            if not rebuild_invalid:
+                logger.warning(f"Index {index_name} of {self.table_name} is invalid, run add-pgvector-indexes")
+                return
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")
+
+    def _index_name(self, kind: str) -> str:
+        # table names are up to the 63 characters of an identifier, index names are derived from a digest
+        return f"{kind}_idx_{hashlib.md5(self.table_name.encode()).hexdigest()}"
+
+    def _has_text_search_column(self) -> bool:
+        if self.table_name not in _text_search_column_tables:
+            with self._get_cursor() as cur:
+                cur.execute(
+                    "SELECT EXISTS (SELECT 1 FROM pg_attribute WHERE attrelid = relid AND attname = 'text_tsv' "
+                    "AND NOT attisdropped) FROM to_regclass(%s) AS relid WHERE relid IS NOT NULL",
+                    (self.table_name,),
+                )
+                record = cur.fetchone()
+            # a collection not created yet is looked up again
+            if record is None:
+                return False
+            _text_search_column_tables[self.table_name] = record[0]
+        return _text_search_column_tables[self.table_name]
+
 
 class PGVectorFactory(AbstractVectorFactory):
     def init_vector(self, dataset: Dataset, attributes: list, embeddings: Embeddings) -> PGVector:
@@ -204,13 +461,22 @@ class PGVectorFactory(AbstractVectorFactory):
             dataset.index_struct = json.dumps(
                 self.gen_index_struct_dict(VectorType.PGVECTOR, collection_name))
 
-        return PGVector(
-            collection_name=collection_name,
-            config=PGVectorConfig(
-                host=dify_config.PGVECTOR_HOST,
-                port=dify_config.PGVECTOR_PORT,
-                user=dify_config.PGVECTOR_USER,
-                password=dify_config.PGVECTOR_PASSWORD,
-                database=dify_config.PGVECTOR_DATABASE,
-            ),
+        return PGVector(collection_name=collection_name, config=self.get_config())
+
+    @staticmethod
+    def get_config() -> PGVectorConfig:
+        return PGVectorConfig(
+            host=dify_config.PGVECTOR_HOST,
+            port=dify_config.PGVECTOR_PORT,
+            user=dify_config.PGVECTOR_USER,
+            password=dify_config.PGVECTOR_PASSWORD,
+            database=dify_config.PGVECTOR_DATABASE,
+            max_connection=dify_config.PGVECTOR_MAX_CONNECTION,
+            index_type=dify_config.PGVECTOR_INDEX_TYPE,
+            index_min_rows=dify_config.PGVECTOR_INDEX_MIN_ROWS,
+            hnsw_m=dify_config.PGVECTOR_HNSW_M,
+            hnsw_ef_construction=dify_config.PGVECTOR_HNSW_EF_CONSTRUCTION,
+            hnsw_ef_search=dify_config.PGVECTOR_HNSW_EF_SEARCH,
+            ivfflat_lists=dify_config.PGVECTOR_IVFFLAT_LISTS,
+            ivfflat_probes=dify_config.PGVECTOR_IVFFLAT_PROBES,
         )
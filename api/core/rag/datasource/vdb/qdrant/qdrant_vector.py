@@ -23,6 +23,7 @@ from configs import dify_config
 from core.rag.datasource.entity.embedding import Embeddings
 from core.rag.datasource.vdb.field import Field
 from core.rag.datasource.vdb.vector_base import BaseVector
+from core.rag.datasource.vdb.vector_client_registry import vector_client_registry
 from core.rag.datasource.vdb.vector_factory import AbstractVectorFactory
 from core.rag.datasource.vdb.vector_type import VectorType
 from core.rag.models.document import Document
@@ -72,7 +73,12 @@ class QdrantVector(BaseVector):
     def __init__(self, collection_name: str, group_id: str, config: QdrantConfig, distance_func: str = 'Cosine'):
         super().__init__(collection_name)
         self._client_config = config
-        self._client = qdrant_client.QdrantClient(**self._client_config.to_qdrant_params())
+        self._client = vector_client_registry.get(
+            key=(VectorType.QDRANT, config.model_dump_json()),
+            create=lambda: qdrant_client.QdrantClient(**config.to_qdrant_params()),
+            close=lambda client: client.close(),
+            health_check=lambda client: client.get_collections()
+        )
         self._distance_func = distance_func.upper()
         self._group_id = group_id
 
@@ -331,6 +337,38 @@ class QdrantVector(BaseVector):
 
         return len(response) > 0
 
+    def ids_exist(self, ids: list[str]) -> set[str]:
+        if not ids or not self._collection_exists():
+            return set()
+        response = self._client.retrieve(
+            collection_name=self._collection_name,
+            ids=ids,
+            with_payload=False,
+            with_vectors=False
+        )
+
+        return {str(point.id) for point in response}
+
+    def get_embeddings_by_ids(self, ids: list[str]) -> dict[str, list[float]]:
+        if not ids or not self._collection_exists():
+            return {}
+        response = self._client.retrieve(
+            collection_name=self._collection_name,
+            ids=ids,
+            with_payload=False,
+            with_vectors=True
+        )
+
+        return {str(point.id): list(point.vector) for point in response}
+
+    def _collection_exists(self) -> bool:
+        collections_response = self._client.get_collections()
+        return any(collection.name == self._collection_name for collection in collections_response.collections)
+
+    def _upsert_batch(self, documents: list[Document], embeddings: list[list[float]], **kwargs) -> None:
+        # points are written with their doc_id as id, qdrant replaces the stored points
+        self.create(documents, embeddings, **kwargs)
+
     def search_by_vector(self, query_vector: list[float], **kwargs: Any) -> list[Document]:
         from qdrant_client.http import models
         filter = models.Filter(
@@ -11,6 +11,7 @@ from sqlalchemy.orm import Session, declarative_base
 from configs import dify_config
 from core.rag.datasource.entity.embedding import Embeddings
 from core.rag.datasource.vdb.vector_base import BaseVector
+from core.rag.datasource.vdb.vector_client_registry import vector_client_registry
 from core.rag.datasource.vdb.vector_factory import AbstractVectorFactory
 from core.rag.datasource.vdb.vector_type import VectorType
 from core.rag.models.document import Document
@@ -70,7 +71,12 @@ class TiDBVector(BaseVector):
         self._url = (f"mysql+pymysql://{config.user}:{config.password}@{config.host}:{config.port}/{config.database}?"
                      f"ssl_verify_cert=true&ssl_verify_identity=true&program_name={config.program_name}")
         self._distance_func = distance_func.lower()
-        self._engine = create_engine(self._url)
+        # connections are checked out of the pool with a ping, the engine needs no health check
+        self._engine = vector_client_registry.get(
+            key=(VectorType.TIDB_VECTOR, self._url),
+            create=lambda: create_engine(self._url, pool_pre_ping=True),
+            close=lambda engine: engine.dispose()
+        )
         self._orm_base = declarative_base()
         self._dimension = 1536
 
@@ -1,10 +1,14 @@
 from __future__ import annotations
 
+import logging
 from abc import ABC, abstractmethod
 from typing import Any
 
+from configs import dify_config
 from core.rag.models.document import Document
 
+logger = logging.getLogger(__name__)
+
 
 class BaseVector(ABC):
 
@@ -56,14 +60,47 @@ class BaseVector(ABC):
     def delete(self) -> None:
         raise NotImplementedError
 
-    def _filter_duplicate_texts(self, texts: list[Document]) -> list[Document]:
-        for text in texts[:]:
-            doc_id = text.metadata['doc_id']
-            exists_duplicate_node = self.text_exists(doc_id)
-            if exists_duplicate_node:
-                texts.remove(text)
+    def upsert(self, documents: list[Document], embeddings: list[list[float]], **kwargs) -> None:
+        """
+        Write documents, replacing the stored documents with the same doc_id, so writing a batch twice
+        stores it once. Documents are written in batches of `VECTOR_STORE_UPSERT_BATCH_SIZE`,
+        the collection is created when it does not exist. Every batch costs a lookup of the stored ids,
+        documents that cannot be stored yet are written with create.
+        """
+        batch_size = dify_config.VECTOR_STORE_UPSERT_BATCH_SIZE
+        for i in range(0, len(documents), batch_size):
+            self._upsert_batch(documents[i:i + batch_size], embeddings[i:i + batch_size], **kwargs)
+
+    def _upsert_batch(self, documents: list[Document], embeddings: list[list[float]], **kwargs) -> None:
+        # stores without a native upsert delete the stored copies before writing the batch again
+        try:
+            existing_ids = self.ids_exist(self._get_uuids(documents))
+        except Exception:
+            # the collection is created by the first write of a dataset, before it nothing is stored
+            logger.warning(f'Failed to look up stored ids in collection {self._collection_name}, '
+                           'writing the batch as new documents', exc_info=True)
+            existing_ids = set()
+        if existing_ids:
+            self.delete_by_ids(list(existing_ids))
+        self.create(documents, embeddings, **kwargs)
+
+    def ids_exist(self, ids: list[str]) -> set[str]:
+        """
+        Return the doc ids of the given ids that are stored, stores with a bulk lookup override it
+        to check all of them in one round trip.
+        """
+        return {id for id in ids if self.text_exists(id)}
+
+    def get_embeddings_by_ids(self, ids: list[str]) -> dict[str, list[float]]:
+        """
+        Return the stored vectors of the given doc ids, stores that cannot return their vectors return none
+        and the documents are embedded again.
+        """
+        return {}
 
-        return texts
+    def _filter_duplicate_texts(self, texts: list[Document]) -> list[Document]:
+        existing_ids = self.ids_exist(self._get_uuids(texts))
+        return [text for text in texts if text.metadata['doc_id'] not in existing_ids]
 
     def _get_uuids(self, texts: list[Document]) -> list[str]:
         return [text.metadata['doc_id'] for text in texts]
@@ -0,0 +1,124 @@
+import logging
+import os
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from configs import dify_config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _RegistryEntry:
+    client: Any
+    close: Optional[Callable[[Any], None]]
+    last_used_at: float
+    last_checked_at: float
+
+
+class VectorClientRegistry:
+    """
+    Process-wide registry of the clients and connection pools of the vector stores.
+
+    Adapters are created for every retrieval, annotation query and indexing batch, the registry lets
+    them share one thread-safe client per vector type and config instead of connecting again each time.
+
+    - a client that has not been checked for `VECTOR_CLIENT_HEALTH_CHECK_INTERVAL` seconds is checked
+      before it is handed out, a client failing its check is dropped from the registry and created again
+    - a client not handed out for `VECTOR_CLIENT_IDLE_TIMEOUT` seconds is dropped from the registry
+    - adapters may still hold a dropped client, it is closed by the garbage collector once they are gone
+    - a forked child, like a Celery prefork worker, starts with an empty registry, the clients of the
+      parent share its sockets and are kept alive but never used or closed in the child
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: dict[tuple, _RegistryEntry] = {}
+        self._inherited_clients: list[Any] = []
+
+    def get(self, key: tuple,
+            create: Callable[[], Any],
+            close: Optional[Callable[[Any], None]] = None,
+            health_check: Optional[Callable[[Any], None]] = None) -> Any:
+        """
+        Get the client of a key, creating it when there is none.
+        :param key: vector type and the config the client is created from
+        :param create: creates the client
+        :param close: closes a client that is not shared, created by a thread that lost the race to
+            register it or removed by `clear`
+        :param health_check: raises when the client can no longer be used
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._entries.get(key)
+            if entry:
+                entry.last_used_at = now
+                check_due = now - entry.last_checked_at >= dify_config.VECTOR_CLIENT_HEALTH_CHECK_INTERVAL
+                if check_due:
+                    entry.last_checked_at = now
+
+        if entry:
+            if not check_due or not health_check:
+                return entry.client
+            try:
+                health_check(entry.client)
+                return entry.client
+            except Exception:
+                logger.warning(f'Vector client of {key[0]} failed its health check, reconnecting', exc_info=True)
+                self._discard(key, entry)
+
+        # connect outside the lock, a slow vector store does not block the clients of the others
+        client = create()
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                self._entries[key] = _RegistryEntry(client=client, close=close, last_used_at=now, last_checked_at=now)
+                return client
+
+        # another thread registered a client of the same key first
+        self._close(key, client, close)
+        return entry.client
+
+    def clear(self) -> None:
+        """Close every client of the registry."""
+        with self._lock:
+            entries = list(self._entries.items())
+            self._entries.clear()
+        for key, entry in entries:
+            self._close(key, entry.client, entry.close)
+
+    def _evict_idle(self, now: float) -> None:
+        idle_keys = [key for key, entry in self._entries.items()
+                     if now - entry.last_used_at >= dify_config.VECTOR_CLIENT_IDLE_TIMEOUT]
+        for key in idle_keys:
+            del self._entries[key]
+
+    def _discard(self, key: tuple, entry: _RegistryEntry) -> None:
+        with self._lock:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+
+    @staticmethod
+    def _close(key: tuple, client: Any, close: Optional[Callable[[Any], None]]) -> None:
+        if not close:
+            return
+        try:
+            close(client)
+        except Exception:
+            logger.warning(f'Failed to close vector client of {key[0]}', exc_info=True)
+
+    def _after_fork_in_child(self) -> None:
+        # the lock may have been held by another thread of the parent while forking
+        self._lock = threading.Lock()
+        # closing the clients of the parent, even by garbage collection, would end its connections
+        self._inherited_clients.extend(entry.client for entry in self._entries.values())
+        self._entries = {}
+
+
+vector_client_registry = VectorClientRegistry()
+
+os.register_at_fork(after_in_child=vector_client_registry._after_fork_in_child)
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Any
+from typing import Any, Optional
 
 from configs import dify_config
 from core.embedding.cached_embedding import CacheEmbedding
@@ -97,12 +97,21 @@ class Vector:
 
     def create(self, texts: list = None, **kwargs):
         if texts:
-            embeddings = self._embeddings.embed_documents([document.page_content for document in texts])
-            self._vector_processor.create(
-                texts=texts,
-                embeddings=embeddings,
-                **kwargs
-            )
+            embeddings = self.embed_documents(texts)
+            self.create_with_embeddings(texts, embeddings, **kwargs)
+
+    def embed_documents(self, documents: list[Document]) -> list[list[float]]:
+        return self._embeddings.embed_documents([document.page_content for document in documents])
+
+    def create_with_embeddings(self, texts: list[Document], embeddings: list[list[float]], **kwargs):
+        """
+        Write documents embedded beforehand by the embedding model of the dataset.
+        """
+        self._vector_processor.create(
+            texts=texts,
+            embeddings=embeddings,
+            **kwargs
+        )
 
     def add_texts(self, documents: list[Document], **kwargs):
         if kwargs.get('duplicate_check', False):
@@ -115,9 +124,27 @@ class Vector:
             **kwargs
         )
 
+    def upsert(self, documents: list[Document], embeddings: Optional[list[list[float]]] = None, **kwargs):
+        """
+        Write documents, replacing the stored documents with the same doc_id.
+        Documents are embedded by the embedding model of the dataset when no embeddings are given.
+        """
+        if not documents:
+            return
+        if embeddings is None:
+            embeddings = self.embed_documents(documents)
+        self._vector_processor.upsert(documents, embeddings, **kwargs)
+
     def text_exists(self, id: str) -> bool:
         return self._vector_processor.text_exists(id)
 
+    def ids_exist(self, ids: list[str]) -> set[str]:
+        batch_size = dify_config.VECTOR_STORE_UPSERT_BATCH_SIZE
+        existing_ids = set()
+        for i in range(0, len(ids), batch_size):
+            existing_ids.update(self._vector_processor.ids_exist(ids[i:i + batch_size]))
+        return existing_ids
+
     def delete_by_ids(self, ids: list[str]) -> None:
         self._vector_processor.delete_by_ids(ids)
 
@@ -129,8 +156,20 @@ class Vector:
             **kwargs: Any
     ) -> list[Document]:
         query_vector = self._embeddings.embed_query(query)
+        return self.search_by_query_vector(query_vector, **kwargs)
+
+    def search_by_query_vector(
+            self, query_vector: list[float],
+            **kwargs: Any
+    ) -> list[Document]:
+        """
+        Search with a query vector embedded beforehand by the embedding model of the dataset.
+        """
         return self._vector_processor.search_by_vector(query_vector, **kwargs)
 
+    def embed_query(self, query: str) -> list[float]:
+        return self._embeddings.embed_query(query)
+
     def search_by_full_text(
             self, query: str,
             **kwargs: Any
@@ -157,13 +196,8 @@ class Vector:
         return CacheEmbedding(embedding_model)
 
     def _filter_duplicate_texts(self, texts: list[Document]) -> list[Document]:
-        for text in texts[:]:
-            doc_id = text.metadata['doc_id']
-            exists_duplicate_node = self.text_exists(doc_id)
-            if exists_duplicate_node:
-                texts.remove(text)
-
-        return texts
+        existing_ids = self.ids_exist([text.metadata['doc_id'] for text in texts])
+        return [text for text in texts if text.metadata['doc_id'] not in existing_ids]
 
     def __getattr__(self, name):
         if self._vector_processor is not None:
@@ -0,0 +1,242 @@
+import datetime
+import logging
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import or_
+
+from core.rag.datasource.vdb.vector_factory import Vector
+from core.rag.models.document import Document
+from extensions.ext_database import db
+from extensions.ext_redis import redis_client
+from models.dataset import Dataset, DocumentSegment
+from models.dataset import Document as DatasetDocument
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class VectorMigrationResult:
+    chunks: int = 0
+    # chunks whose vector was copied from the old vector store
+    copied: int = 0
+    # chunks embedded again, through the embedding cache first
+    embedded: int = 0
+    # chunks created or changed while the migration ran, written again before the switch
+    caught_up: int = 0
+    # chunks deleted from the new vector store as their segments were deleted or disabled meanwhile
+    deleted: int = 0
+    elapsed: float = 0.0
+
+
+class DatasetVectorMigration:
+    """
+    Moves the chunks of a dataset to the configured vector store.
+
+    The vectors of the chunks are copied from the vector store the dataset is indexed in, chunks it cannot
+    return are embedded again through the embedding cache. Chunks are written to the new vector store by
+    batched upserts in the order of their segment ids, the last written segment id is kept in redis so a
+    migration that stopped resumes after it. The dataset is switched to the new vector store once all of
+    its chunks are written, the old one keeps serving it until then.
+
+    The dataset keeps being indexed meanwhile, and segment ids are random, so segments created or changed
+    after the migration started may sort below the cursor. Before the switch they are scanned again by
+    their timestamps, until a round finds none or after `MAX_CATCH_UP_ROUNDS` rounds. Deletes and disables
+    still go to the old vector store only, so the ids of the written chunks are kept in redis as well and the
+    chunks whose segments are no longer indexed are deleted from the new vector store right before the switch.
+    """
+
+    PROGRESS_KEY = 'vdb_migrate:progress'
+    STARTED_AT_KEY = 'vdb_migrate:started_at'
+    WRITTEN_IDS_KEY = 'vdb_migrate:written_ids:{}'
+    MAX_CATCH_UP_ROUNDS = 3
+    # segment timestamps have a precision of one second and come from the clock of the database
+    CATCH_UP_MARGIN = datetime.timedelta(minutes=1)
+
+    def __init__(self, dataset_id: str, batch_size: int):
+        self._dataset_id = dataset_id
+        self._batch_size = batch_size
+        self._written_ids_key = self.WRITTEN_IDS_KEY.format(dataset_id)
+
+    def run(self) -> VectorMigrationResult:
+        start_at = time.perf_counter()
+        result = VectorMigrationResult()
+
+        dataset = db.session.query(Dataset).filter(Dataset.id == self._dataset_id).first()
+        if not dataset:
+            raise ValueError('Dataset not found')
+        # the index struct of the new vector store is only saved once the migration is done
+        db.session.expunge(dataset)
+
+        source = self._init_source(dataset)
+        dataset.index_struct = None
+        target = Vector(dataset)
+
+        last_segment_id = redis_client.hget(self.PROGRESS_KEY, self._dataset_id)
+        started_at = self._get_started_at()
+        if last_segment_id is None or started_at is None:
+            target.delete()
+            redis_client.delete(self._written_ids_key)
+            started_at = self._now()
+            redis_client.hset(self.STARTED_AT_KEY, self._dataset_id, started_at.isoformat())
+            redis_client.hset(self.PROGRESS_KEY, self._dataset_id, '')
+            last_segment_id = None
+        else:
+            last_segment_id = last_segment_id.decode()
+            logger.info(f'Resume migration of dataset {self._dataset_id} after segment {last_segment_id}')
+
+        for segments in self._iter_segments(last_segment_id or None):
+            self._write_segments(source, target, segments, result)
+            redis_client.hset(self.PROGRESS_KEY, self._dataset_id, segments[-1].id)
+
+        # segments indexed meanwhile went to the old vector store only
+        changed_since = started_at - self.CATCH_UP_MARGIN
+        for _ in range(self.MAX_CATCH_UP_ROUNDS):
+            scanned_at = self._now()
+            caught_up = 0
+            for segments in self._iter_segments(None, changed_since=changed_since):
+                self._write_segments(source, target, segments, result)
+                caught_up += len(segments)
+            if not caught_up:
+                break
+            result.caught_up += caught_up
+            changed_since = scanned_at - self.CATCH_UP_MARGIN
+
+        # segments deleted or disabled meanwhile were removed from the old vector store only
+        result.deleted = self._delete_stale_chunks(target)
+
+        db.session.query(Dataset).filter(Dataset.id == self._dataset_id).update({
+            Dataset.index_struct: dataset.index_struct
+        })
+        db.session.commit()
+        redis_client.hdel(self.PROGRESS_KEY, self._dataset_id)
+        redis_client.hdel(self.STARTED_AT_KEY, self._dataset_id)
+        redis_client.delete(self._written_ids_key)
+
+        result.elapsed = time.perf_counter() - start_at
+        return result
+
+    def _write_segments(self, source: Optional[Vector], target: Vector, segments: list[DocumentSegment],
+                        result: VectorMigrationResult) -> None:
+        documents = [
+            Document(
+                page_content=segment.content,
+                metadata={
+                    'doc_id': segment.index_node_id,
+                    'doc_hash': segment.index_node_hash,
+                    'document_id': segment.document_id,
+                    'dataset_id': segment.dataset_id,
+                }
+            )
+            for segment in segments
+        ]
+        copied = self._copy(source, target, documents)
+        redis_client.sadd(self._written_ids_key, *[segment.index_node_id for segment in segments])
+
+        result.chunks += len(documents)
+        result.copied += copied
+        result.embedded += len(documents) - copied
+
+    def _get_started_at(self) -> Optional[datetime.datetime]:
+        started_at = redis_client.hget(self.STARTED_AT_KEY, self._dataset_id)
+        if started_at is None:
+            return None
+        return datetime.datetime.fromisoformat(started_at.decode())
+
+    @staticmethod
+    def _now() -> datetime.datetime:
+        return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+    def _init_source(self, dataset: Dataset) -> Optional[Vector]:
+        if not dataset.index_struct_dict:
+            return None
+        try:
+            return Vector(dataset)
+        except Exception:
+            logger.warning(f'Failed to connect the vector store of dataset {self._dataset_id}, '
+                           f'its chunks are embedded again', exc_info=True)
+            return None
+
+    def _iter_segments(self, last_segment_id: Optional[str],
+                       changed_since: Optional[datetime.datetime] = None) -> Iterator[list[DocumentSegment]]:
+        """
+        Iterate the indexed segments of the dataset in batches, in the order of their ids.
+        :param last_segment_id: segment id the iteration starts after
+        :param changed_since: only segments created, updated or completed since then
+        """
+        while True:
+            query = self._indexed_segments_query(DocumentSegment)
+            if changed_since:
+                query = query.filter(or_(
+                    DocumentSegment.created_at >= changed_since,
+                    DocumentSegment.updated_at >= changed_since,
+                    DocumentSegment.completed_at >= changed_since,
+                ))
+            if last_segment_id:
+                query = query.filter(DocumentSegment.id > last_segment_id)
+            segments = query.order_by(DocumentSegment.id).limit(self._batch_size).all()
+            if not segments:
+                return
+            yield segments
+            last_segment_id = segments[-1].id
+            # segments of written batches are not kept in the session
+            db.session.expunge_all()
+
+    def _indexed_segments_query(self, *entities):
+        return db.session.query(*entities).join(
+            DatasetDocument, DatasetDocument.id == DocumentSegment.document_id
+        ).filter(
+            DocumentSegment.dataset_id == self._dataset_id,
+            DocumentSegment.status == 'completed',
+            DocumentSegment.enabled == True,
+            DatasetDocument.indexing_status == 'completed',
+            DatasetDocument.enabled == True,
+            DatasetDocument.archived == False,
+        )
+
+    def _delete_stale_chunks(self, target: Vector) -> int:
+        """
+        Delete the written chunks whose segments are deleted, disabled, archived or being indexed again.
+        :return: number of deleted chunks
+        """
+        deleted = 0
+        written_ids = [index_node_id.decode() for index_node_id in
+                       redis_client.sscan_iter(self._written_ids_key, count=self._batch_size)]
+        for i in range(0, len(written_ids), self._batch_size):
+            index_node_ids = written_ids[i:i + self._batch_size]
+            indexed_ids = self._get_indexed_ids(index_node_ids)
+            stale_ids = [index_node_id for index_node_id in index_node_ids if index_node_id not in indexed_ids]
+            if stale_ids:
+                target.delete_by_ids(stale_ids)
+                deleted += len(stale_ids)
+        return deleted
+
+    def _get_indexed_ids(self, index_node_ids: list[str]) -> set[str]:
+        rows = self._indexed_segments_query(DocumentSegment.index_node_id).filter(
+            DocumentSegment.index_node_id.in_(index_node_ids)
+        ).all()
+        return {row.index_node_id for row in rows}
+
+    def _copy(self, source: Optional[Vector], target: Vector, documents: list[Document]) -> int:
+        """
+        Write the documents to the target vector store.
+        :return: number of documents whose vector was copied from the source vector store
+        """
+        doc_ids = [document.metadata['doc_id'] for document in documents]
+        vectors = {}
+        if source:
+            try:
+                vectors = source.get_embeddings_by_ids(doc_ids)
+            except Exception:
+                logger.warning(f'Failed to read the vectors of dataset {self._dataset_id}, '
+                               f'the batch is embedded again', exc_info=True)
+
+        missing = [document for document in documents if document.metadata['doc_id'] not in vectors]
+        if missing:
+            embeddings = target.embed_documents(missing)
+            vectors.update(zip([document.metadata['doc_id'] for document in missing], embeddings))
+
+        target.upsert(documents, [vectors[doc_id] for doc_id in doc_ids])
+        return len(documents) - len(missing)
@@ -169,6 +169,44 @@ class WeaviateVector(BaseVector):
 
         return True
 
+    def ids_exist(self, ids: list[str]) -> set[str]:
+        collection_name = self._collection_name
+        schema = self._default_schema(self._collection_name)
+
+        # check whether the index already exists
+        if not ids or not self._client.schema.contains(schema):
+            return set()
+        result = self._client.query.get(collection_name, ["doc_id"]).with_where({
+            "operator": "Or",
+            "operands": [{"path": ["doc_id"], "operator": "Equal", "valueText": id} for id in ids],
+        }).with_limit(len(ids)).do()
+
+        if "errors" in result:
+            raise ValueError(f"Error during query: {result['errors']}")
+
+        return {entry["doc_id"] for entry in result["data"]["Get"][collection_name]}
+
+    def get_embeddings_by_ids(self, ids: list[str]) -> dict[str, list[float]]:
+        collection_name = self._collection_name
+        schema = self._default_schema(self._collection_name)
+
+        # check whether the index already exists
+        if not ids or not self._client.schema.contains(schema):
+            return {}
+        result = self._client.query.get(collection_name, ["doc_id"]).with_additional(["vector"]).with_where({
+            "operator": "Or",
+            "operands": [{"path": ["doc_id"], "operator": "Equal", "valueText": id} for id in ids],
+        }).with_limit(len(ids)).do()
+
+        if "errors" in result:
+            raise ValueError(f"Error during query: {result['errors']}")
+
+        return {entry["doc_id"]: entry["_additional"]["vector"] for entry in result["data"]["Get"][collection_name]}
+
+    def _upsert_batch(self, documents: list[Document], embeddings: list[list[float]], **kwargs) -> None:
+        # objects are written with their doc_id as uuid, a batch replaces the stored objects
+        self.create(documents, embeddings, **kwargs)
+
     def delete_by_ids(self, ids: list[str]) -> None:
         # check whether the index already exists
         schema = self._default_schema(self._collection_name)
@@ -1,14 +1,19 @@
+import uuid
 from collections.abc import Sequence
 from typing import Any, Optional
 
 from sqlalchemy import func
 
+from core.embedding.token_counter import EmbeddingTokenCounter
 from core.model_manager import ModelManager
 from core.model_runtime.entities.model_entities import ModelType
 from core.rag.models.document import Document
 from extensions.ext_database import db
 from models.dataset import Dataset, DocumentSegment
 
+# number of segments per lookup query and per insert/update batch
+SEGMENT_BATCH_SIZE = 1000
+
 
 class DatasetDocumentStore:
     def __init__(
@@ -61,16 +66,30 @@ class DatasetDocumentStore:
         return output
 
     def add_documents(
-            self, docs: Sequence[Document], allow_update: bool = True
+            self, docs: Sequence[Document], allow_update: bool = True,
+            segment_attributes: Optional[dict[str, Any]] = None,
+            token_counter: Optional[EmbeddingTokenCounter] = None
     ) -> None:
+        """
+        Insert or update the segments of documents in batches, one commit per batch.
+        :param docs: documents, `doc_id` and `doc_hash` metadata are required
+        :param allow_update: whether documents that already have a segment are allowed
+        :param segment_attributes: extra column values of new segments
+        :param token_counter: token counter of the indexing job, chunks it has measured are not tokenized again
+        """
+        for doc in docs:
+            if not isinstance(doc, Document):
+                raise ValueError("doc must be a Document")
+
         max_position = db.session.query(func.max(DocumentSegment.position)).filter(
             DocumentSegment.document_id == self._document_id
         ).scalar()
 
         if max_position is None:
             max_position = 0
-        embedding_model = None
-        if self._dataset.indexing_technique == 'high_quality':
+        if self._dataset.indexing_technique != 'high_quality':
+            token_counter = None
+        elif not token_counter:
             model_manager = ModelManager()
             embedding_model = model_manager.get_model_instance(
                 tenant_id=self._dataset.tenant_id,
@@ -78,56 +97,63 @@ class DatasetDocumentStore:
                 model_type=ModelType.TEXT_EMBEDDING,
                 model=self._dataset.embedding_model
             )
+            token_counter = EmbeddingTokenCounter(embedding_model)
+
+        segment_ids = self._get_segment_ids([doc.metadata['doc_id'] for doc in docs])
+        # NOTE: doc could already exist in the store, but we overwrite it
+        if not allow_update and segment_ids:
+            raise ValueError(
+                f"doc_id {next(iter(segment_ids))} already exists. "
+                "Set allow_update to True to overwrite."
+            )
 
-        for doc in docs:
-            if not isinstance(doc, Document):
-                raise ValueError("doc must be a Document")
-
-            segment_document = self.get_document_segment(doc_id=doc.metadata['doc_id'])
-
-            # NOTE: doc could already exist in the store, but we overwrite it
-            if not allow_update and segment_document:
-                raise ValueError(
-                    f"doc_id {doc.metadata['doc_id']} already exists. "
-                    "Set allow_update to True to overwrite."
-                )
-
-            # calc embedding use tokens
-            if embedding_model:
-                tokens = embedding_model.get_text_embedding_num_tokens(
-                    texts=[doc.page_content]
-                )
-            else:
-                tokens = 0
-
-            if not segment_document:
-                max_position += 1
-
-                segment_document = DocumentSegment(
-                    tenant_id=self._dataset.tenant_id,
-                    dataset_id=self._dataset.id,
-                    document_id=self._document_id,
-                    index_node_id=doc.metadata['doc_id'],
-                    index_node_hash=doc.metadata['doc_hash'],
-                    position=max_position,
-                    content=doc.page_content,
-                    word_count=len(doc.page_content),
-                    tokens=tokens,
-                    enabled=False,
-                    created_by=self._user_id,
-                )
-                if doc.metadata.get('answer'):
-                    segment_document.answer = doc.metadata.pop('answer', '')
-
-                db.session.add(segment_document)
-            else:
-                segment_document.content = doc.page_content
+        for i in range(0, len(docs), SEGMENT_BATCH_SIZE):
+            new_segments = []
+            updated_segments = []
+            for doc in docs[i:i + SEGMENT_BATCH_SIZE]:
+                # calc embedding use tokens, chunks measured by the indexing runner are not tokenized again
+                if token_counter:
+                    tokens = token_counter.count(doc.page_content)
+                else:
+                    tokens = 0
+
+                segment_id = segment_ids.get(doc.metadata['doc_id'])
+                if not segment_id:
+                    max_position += 1
+                    segment_id = str(uuid.uuid4())
+                    segment_ids[doc.metadata['doc_id']] = segment_id
+                    segment = {
+                        'id': segment_id,
+                        'tenant_id': self._dataset.tenant_id,
+                        'dataset_id': self._dataset.id,
+                        'document_id': self._document_id,
+                        'index_node_id': doc.metadata['doc_id'],
+                        'index_node_hash': doc.metadata['doc_hash'],
+                        'position': max_position,
+                        'content': doc.page_content,
+                        'word_count': len(doc.page_content),
+                        'tokens': tokens,
+                        'enabled': False,
+                        'created_by': self._user_id,
+                        **(segment_attributes or {}),
+                    }
+                    new_segments.append(segment)
+                else:
+                    segment = {
+                        'id': segment_id,
+                        'content': doc.page_content,
+                        'index_node_hash': doc.metadata['doc_hash'],
+                        'word_count': len(doc.page_content),
+                        'tokens': tokens,
+                    }
+                    updated_segments.append(segment)
                 if doc.metadata.get('answer'):
-                    segment_document.answer = doc.metadata.pop('answer', '')
-                segment_document.index_node_hash = doc.metadata['doc_hash']
-                segment_document.word_count = len(doc.page_content)
-                segment_document.tokens = tokens
+                    segment['answer'] = doc.metadata.pop('answer', '')
 
+            if new_segments:
+                db.session.bulk_insert_mappings(DocumentSegment, new_segments)
+            if updated_segments:
+                db.session.bulk_update_mappings(DocumentSegment, updated_segments)
             db.session.commit()
 
     def document_exists(self, doc_id: str) -> bool:
@@ -187,6 +213,16 @@ class DatasetDocumentStore:
 
         return document_segment.index_node_hash
 
+    def _get_segment_ids(self, doc_ids: list[str]) -> dict[str, str]:
+        segment_ids = {}
+        for i in range(0, len(doc_ids), SEGMENT_BATCH_SIZE):
+            rows = db.session.query(DocumentSegment.index_node_id, DocumentSegment.id).filter(
+                DocumentSegment.dataset_id == self._dataset.id,
+                DocumentSegment.index_node_id.in_(doc_ids[i:i + SEGMENT_BATCH_SIZE])
+            ).all()
+            segment_ids.update(rows)
+        return segment_ids
+
     def get_document_segment(self, doc_id: str) -> DocumentSegment:
         document_segment = db.session.query(DocumentSegment).filter(
             DocumentSegment.dataset_id == self._dataset.id,
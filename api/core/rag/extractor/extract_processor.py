@@ -1,7 +1,7 @@
 import re
 import tempfile
 from pathlib import Path
-from typing import Union
+from typing import Optional, Union
 from urllib.parse import unquote
 
 from configs import dify_config
@@ -10,6 +10,7 @@ from core.rag.extractor.csv_extractor import CSVExtractor
 from core.rag.extractor.entity.datasource_type import DatasourceType
 from core.rag.extractor.entity.extract_setting import ExtractSetting
 from core.rag.extractor.excel_extractor import ExcelExtractor
+from core.rag.extractor.extracted_text_cache import ExtractedTextCache
 from core.rag.extractor.firecrawl.firecrawl_web_extractor import FirecrawlWebExtractor
 from core.rag.extractor.html_extractor import HtmlExtractor
 from core.rag.extractor.markdown_extractor import MarkdownExtractor
@@ -85,9 +86,18 @@ class ExtractProcessor:
     def extract(cls, extract_setting: ExtractSetting, is_automatic: bool = False,
                 file_path: str = None) -> list[Document]:
         if extract_setting.datasource_type == DatasourceType.FILE.value:
+            upload_file: UploadFile = extract_setting.upload_file
+            extracted_text_cache = None
+            if not file_path:
+                # the same file is extracted for the estimate, the preview and every indexing, parse it once
+                extracted_text_cache = cls.get_extracted_text_cache(extract_setting, is_automatic)
+            if extracted_text_cache:
+                documents = extracted_text_cache.get()
+                if documents is not None:
+                    return documents
+
             with tempfile.TemporaryDirectory() as temp_dir:
                 if not file_path:
-                    upload_file: UploadFile = extract_setting.upload_file
                     suffix = Path(upload_file.key).suffix
                     file_path = f"{temp_dir}/{next(tempfile._get_candidate_names())}{suffix}"
                     storage.download(upload_file.key, file_path)
@@ -144,7 +154,11 @@ class ExtractProcessor:
                     else:
                         # txt
                         extractor = TextExtractor(file_path, autodetect_encoding=True)
-                return extractor.extract()
+                # lazy extractors read the file, it is removed with the temporary directory
+                documents = list(extractor.extract())
+                if extracted_text_cache:
+                    extracted_text_cache.set(documents)
+                return documents
         elif extract_setting.datasource_type == DatasourceType.NOTION.value:
             extractor = NotionExtractor(
                 notion_workspace_id=extract_setting.notion_info.notion_workspace_id,
@@ -168,3 +182,26 @@ class ExtractProcessor:
                 raise ValueError(f"Unsupported website provider: {extract_setting.website_info.provider}")
         else:
             raise ValueError(f"Unsupported datasource type: {extract_setting.datasource_type}")
+
+    @classmethod
+    def get_extracted_text_cache(cls, extract_setting: ExtractSetting,
+                                 is_automatic: bool = False) -> Optional[ExtractedTextCache]:
+        """
+        Cache entry of the text extracted from the uploaded file of an extract setting.
+        """
+        upload_file: UploadFile = extract_setting.upload_file
+        if extract_setting.datasource_type != DatasourceType.FILE.value or not upload_file:
+            return None
+        return ExtractedTextCache(
+            upload_file,
+            extractor=cls._get_extractor_name(Path(upload_file.key).suffix.lower(), is_automatic)
+        )
+
+    @staticmethod
+    def _get_extractor_name(file_extension: str, is_automatic: bool) -> str:
+        """
+        Name of the extractor chosen for a file, the extractor is picked by the ETL type, the file extension
+        and the process rule mode.
+        """
+        return '{}-{}{}'.format(dify_config.ETL_TYPE.lower(), file_extension.lstrip('.') or 'txt',
+                                '-automatic' if is_automatic else '')
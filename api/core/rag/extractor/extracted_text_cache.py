@@ -0,0 +1,183 @@
+import json
+import logging
+import time
+from typing import Optional
+
+from configs import dify_config
+from core.rag.models.document import Document
+from extensions.ext_redis import redis_client
+from extensions.ext_storage import storage
+from models.model import UploadFile
+
+logger = logging.getLogger(__name__)
+
+# bump when the output of the extractors changes, entries of older versions are no longer read
+# and age out through eviction
+EXTRACTED_TEXT_CACHE_VERSION = 1
+
+# number of least recently used entries fetched per eviction round
+EVICTION_BATCH_SIZE = 100
+
+
+class ExtractedTextCache:
+    """
+    Content-addressed cache of the documents extracted from uploaded files, kept in the storage.
+
+    Entries are keyed by tenant, the hash of the file content, the extractor and the cache version,
+    so the indexing estimate, the preview and every indexing of the same file share one parse.
+    Redis tracks the size and last access of every entry, the least recently used entries are evicted
+    when the total size exceeds `EXTRACTED_TEXT_CACHE_MAX_SIZE`. Hits, misses, stores and evictions
+    are counted in the `extracted_text_cache:stats` hash.
+    """
+
+    STORAGE_PREFIX = 'extracted_text_cache'
+    ENTRIES_KEY = 'extracted_text_cache:entries'
+    SIZES_KEY = 'extracted_text_cache:sizes'
+    STATS_KEY = 'extracted_text_cache:stats'
+    EVICT_LOCK_KEY = 'extracted_text_cache:evict_lock'
+
+    def __init__(self, upload_file: UploadFile, extractor: str):
+        self._file_key = None
+        if dify_config.EXTRACTED_TEXT_CACHE_ENABLED and upload_file.hash:
+            self._file_key = '{}/{}/{}/{}-v{}.json'.format(
+                self.STORAGE_PREFIX, upload_file.tenant_id, upload_file.hash, extractor, EXTRACTED_TEXT_CACHE_VERSION
+            )
+
+    @classmethod
+    def from_file_key(cls, file_key: str) -> 'ExtractedTextCache':
+        """
+        Entry referenced by its file key, e.g. by an indexing checkpoint.
+        """
+        extracted_text_cache = cls.__new__(cls)
+        extracted_text_cache._file_key = file_key
+        return extracted_text_cache
+
+    @property
+    def file_key(self) -> Optional[str]:
+        return self._file_key
+
+    def exists(self) -> bool:
+        if not self._file_key:
+            return False
+        try:
+            return storage.exists(self._file_key)
+        except Exception:
+            logger.exception(f'Failed to check extracted text cache {self._file_key}')
+            return False
+
+    def get(self) -> Optional[list[Document]]:
+        if not self._file_key:
+            return None
+
+        try:
+            if not storage.exists(self._file_key):
+                self._incr_stat('misses')
+                return None
+            entry = json.loads(storage.load_once(self._file_key).decode('utf-8'))
+        except Exception:
+            logger.exception(f'Failed to load extracted text cache {self._file_key}')
+            return None
+
+        self._incr_stat('hits')
+        self._touch()
+        return [Document(page_content=document['page_content'], metadata=document['metadata'])
+                for document in entry['documents']]
+
+    def set(self, documents: list[Document]) -> None:
+        if not self._file_key:
+            return
+
+        try:
+            data = json.dumps({
+                'documents': [{'page_content': document.page_content, 'metadata': document.metadata}
+                              for document in documents]
+            }).encode('utf-8')
+        except (TypeError, ValueError):
+            logger.warning(f'Extracted documents of {self._file_key} are not serializable, skip caching')
+            return
+
+        size = len(data)
+        if size > dify_config.EXTRACTED_TEXT_CACHE_MAX_SIZE:
+            return
+
+        try:
+            storage.save(self._file_key, data)
+            previous_size = int(redis_client.hget(self.SIZES_KEY, self._file_key) or 0)
+            redis_client.hset(self.SIZES_KEY, self._file_key, size)
+            redis_client.zadd(self.ENTRIES_KEY, {self._file_key: time.time()})
+            redis_client.hincrby(self.STATS_KEY, 'size', size - previous_size)
+            redis_client.hincrby(self.STATS_KEY, 'stores', 1)
+        except Exception:
+            logger.exception(f'Failed to save extracted text cache {self._file_key}')
+            return
+
+        self.evict()
+
+    @classmethod
+    def evict(cls) -> int:
+        """
+        Evict the least recently used entries until the cache fits in its max size.
+        :return: number of evicted entries
+        """
+        max_size = dify_config.EXTRACTED_TEXT_CACHE_MAX_SIZE
+        try:
+            if int(redis_client.hget(cls.STATS_KEY, 'size') or 0) <= max_size:
+                return 0
+            lock = redis_client.lock(cls.EVICT_LOCK_KEY, timeout=300)
+            # another worker is already evicting
+            if not lock.acquire(blocking=False):
+                return 0
+        except Exception:
+            logger.exception('Failed to check the size of the extracted text cache')
+            return 0
+
+        evicted = 0
+        try:
+            total_size = int(redis_client.hget(cls.STATS_KEY, 'size') or 0)
+            while total_size > max_size:
+                file_keys = redis_client.zrange(cls.ENTRIES_KEY, 0, EVICTION_BATCH_SIZE - 1)
+                if not file_keys:
+                    break
+                for file_key in file_keys:
+                    file_key = file_key.decode() if isinstance(file_key, bytes) else file_key
+                    size = int(redis_client.hget(cls.SIZES_KEY, file_key) or 0)
+                    try:
+                        storage.delete(file_key)
+                    except Exception:
+                        logger.warning(f'Failed to delete extracted text cache {file_key}')
+                    redis_client.zrem(cls.ENTRIES_KEY, file_key)
+                    redis_client.hdel(cls.SIZES_KEY, file_key)
+                    redis_client.hincrby(cls.STATS_KEY, 'size', -size)
+                    redis_client.hincrby(cls.STATS_KEY, 'evictions', 1)
+                    total_size -= size
+                    evicted += 1
+                    if total_size <= max_size:
+                        break
+        except Exception:
+            logger.exception('Failed to evict the extracted text cache')
+        finally:
+            lock.release()
+
+        if evicted:
+            logger.info(f'Evicted {evicted} entries from the extracted text cache')
+        return evicted
+
+    @classmethod
+    def get_stats(cls) -> dict[str, int]:
+        stats = redis_client.hgetall(cls.STATS_KEY)
+        return {
+            (field.decode() if isinstance(field, bytes) else field): int(value)
+            for field, value in stats.items()
+        }
+
+    def _touch(self) -> None:
+        try:
+            redis_client.zadd(self.ENTRIES_KEY, {self._file_key: time.time()})
+        except Exception:
+            logger.exception(f'Failed to update the last access of extracted text cache {self._file_key}')
+
+    def _incr_stat(self, name: str) -> None:
+        try:
+            redis_client.hincrby(self.STATS_KEY, name, 1)
+        except Exception:
+            logger.exception('Failed to count extracted text cache stats')
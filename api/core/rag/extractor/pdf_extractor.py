@@ -1,16 +1,43 @@
 """Abstract interface for document loader implementations."""
+import multiprocessing
+from collections import deque
 from collections.abc import Iterator
-from typing import Optional
+from concurrent.futures import Future, ProcessPoolExecutor
 
+from configs import dify_config
 from core.rag.extractor.blob.blob import Blob
 from core.rag.extractor.extractor_base import BaseExtractor
 from core.rag.models.document import Document
-from extensions.ext_storage import storage
+
+
+def _extract_page_range(file_path: str, start: int, end: int) -> list[str]:
+    """Extract the text of the pages [start, end) of a pdf file, runs in a worker process."""
+    import pypdfium2
+
+    # pdfium reads the pages it needs from the file, the whole file is never loaded in memory
+    pdf_reader = pypdfium2.PdfDocument(file_path, autoclose=True)
+    try:
+        texts = []
+        for page_number in range(start, end):
+            page = pdf_reader[page_number]
+            text_page = page.get_textpage()
+            texts.append(text_page.get_text_range())
+            text_page.close()
+            page.close()
+        return texts
+    finally:
+        pdf_reader.close()
 
 
 class PdfExtractor(BaseExtractor):
     """Load pdf files.
 
+    Files with more pages than `PDF_EXTRACT_PAGES_PER_TASK` are extracted in page ranges by a pool of
+    `PDF_EXTRACT_MAX_WORKERS` processes when it is set. Pages are yielded in order as soon as their range
+    is extracted, at most two ranges per worker are submitted ahead of the consumer so the pool does not
+    run through the whole file before the first pages are read. This does not bound the memory of an
+    extraction: ExtractProcessor collects every page of the file before it is cleaned and split.
+
 
     Args:
         file_path: Path to the file to load.
@@ -18,39 +45,27 @@ class PdfExtractor(BaseExtractor):
 
     def __init__(
             self,
-            file_path: str,
-            file_cache_key: Optional[str] = None
+            file_path: str
     ):
         """Initialize with file path."""
         self._file_path = file_path
-        self._file_cache_key = file_cache_key
 
-    def extract(self) -> list[Document]:
-        plaintext_file_key = ''
-        plaintext_file_exists = False
-        if self._file_cache_key:
-            try:
-                text = storage.load(self._file_cache_key).decode('utf-8')
-                plaintext_file_exists = True
-                return [Document(page_content=text)]
-            except FileNotFoundError:
-                pass
-        documents = list(self.load())
-        text_list = []
-        for document in documents:
-            text_list.append(document.page_content)
-        text = "\n\n".join(text_list)
-
-        # save plaintext file for caching
-        if not plaintext_file_exists and plaintext_file_key:
-            storage.save(plaintext_file_key, text.encode('utf-8'))
-
-        return documents
+    def extract(self) -> Iterator[Document]:
+        # pages are yielded as they are extracted, ExtractProcessor collects all of them
+        return self.load()
 
     def load(
             self,
     ) -> Iterator[Document]:
         """Lazy load given path as pages."""
+        max_workers = dify_config.PDF_EXTRACT_MAX_WORKERS
+        # daemonic processes, like the workers of a multiprocessing pool, cannot start children
+        if max_workers > 0 and not multiprocessing.current_process().daemon:
+            page_count = self._get_page_count()
+            if page_count > dify_config.PDF_EXTRACT_PAGES_PER_TASK:
+                yield from self._load_in_parallel(page_count, max_workers)
+                return
+
         blob = Blob.from_path(self._file_path)
         yield from self.parse(blob)
 
@@ -70,3 +85,41 @@ class PdfExtractor(BaseExtractor):
                     yield Document(page_content=content, metadata=metadata)
             finally:
                 pdf_reader.close()
+
+    def _get_page_count(self) -> int:
+        import pypdfium2
+
+        pdf_reader = pypdfium2.PdfDocument(self._file_path, autoclose=True)
+        try:
+            return len(pdf_reader)
+        finally:
+            pdf_reader.close()
+
+    def _load_in_parallel(self, page_count: int, max_workers: int) -> Iterator[Document]:
+        pages_per_task = dify_config.PDF_EXTRACT_PAGES_PER_TASK
+        page_ranges = iter([
+            (start, min(start + pages_per_task, page_count))
+            for start in range(0, page_count, pages_per_task)
+        ])
+        # workers are forked on the first submit, when this process has no pdfium document open
+        executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('fork'))
+        pending: deque[tuple[int, Future]] = deque()
+        try:
+            for start, end in page_ranges:
+                pending.append((start, executor.submit(_extract_page_range, self._file_path, start, end)))
+                if len(pending) >= 2 * max_workers:
+                    break
+
+            # ranges are consumed in page order, a finished range waits for the ranges before it
+            while pending:
+                start, future = pending.popleft()
+                texts = future.result()
+                next_range = next(page_ranges, None)
+                if next_range:
+                    pending.append((next_range[0], executor.submit(_extract_page_range, self._file_path,
+                                                                   *next_range)))
+                for offset, content in enumerate(texts):
+                    metadata = {"source": self._file_path, "page": start + offset}
+                    yield Document(page_content=content, metadata=metadata)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
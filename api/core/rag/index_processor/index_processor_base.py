@@ -1,16 +1,23 @@
 """Abstract interface for document loader implementations."""
+import multiprocessing
+import uuid
 from abc import ABC, abstractmethod
+from collections.abc import Callable
 from typing import Optional
 
 from configs import dify_config
+from core.embedding.token_counter import EmbeddingTokenCounter
 from core.model_manager import ModelInstance
+from core.rag.cleaner.clean_processor import CleanProcessor
 from core.rag.extractor.entity.extract_setting import ExtractSetting
+from core.rag.index_processor.parallel_split import split_in_processes
 from core.rag.models.document import Document
 from core.rag.splitter.fixed_text_splitter import (
     EnhanceRecursiveCharacterTextSplitter,
     FixedRecursiveCharacterTextSplitter,
 )
 from core.rag.splitter.text_splitter import TextSplitter
+from libs import helper
 from models.dataset import Dataset, DatasetProcessRule
 
 
@@ -39,7 +46,8 @@ class BaseIndexProcessor(ABC):
         raise NotImplementedError
 
     def _get_splitter(self, processing_rule: dict,
-                      embedding_model_instance: Optional[ModelInstance]) -> TextSplitter:
+                      embedding_model_instance: Optional[ModelInstance],
+                      token_counter: Optional[EmbeddingTokenCounter] = None) -> TextSplitter:
         """
         Get the NodeParser object according to the processing rule.
         """
@@ -60,7 +68,8 @@ class BaseIndexProcessor(ABC):
                 chunk_overlap=segmentation.get('chunk_overlap', 0) or 0,
                 fixed_separator=separator,
                 separators=["\n\n", "。", ". ", " ", ""],
-                embedding_model_instance=embedding_model_instance
+                embedding_model_instance=embedding_model_instance,
+                token_counter=token_counter
             )
         else:
             # Automatic segmentation
@@ -68,7 +77,53 @@ class BaseIndexProcessor(ABC):
                 chunk_size=DatasetProcessRule.AUTOMATIC_RULES['segmentation']['max_tokens'],
                 chunk_overlap=DatasetProcessRule.AUTOMATIC_RULES['segmentation']['chunk_overlap'],
                 separators=["\n\n", "。", ". ", " ", ""],
-                embedding_model_instance=embedding_model_instance
+                embedding_model_instance=embedding_model_instance,
+                token_counter=token_counter
             )
 
         return character_splitter
+
+    @staticmethod
+    def _split_document(document: Document, splitter: TextSplitter, process_rule: dict) -> list[Document]:
+        """
+        Clean one document and split it into chunks, each with a new `doc_id` and its `doc_hash`.
+        """
+        # document clean
+        document_text = CleanProcessor.clean(document.page_content, process_rule)
+        document.page_content = document_text
+        # parse document to nodes
+        document_nodes = splitter.split_documents([document])
+        split_documents = []
+        for document_node in document_nodes:
+
+            if document_node.page_content.strip():
+                doc_id = str(uuid.uuid4())
+                hash = helper.generate_text_hash(document_node.page_content)
+                document_node.metadata['doc_id'] = doc_id
+                document_node.metadata['doc_hash'] = hash
+                # delete Splitter character
+                page_content = document_node.page_content
+                if page_content.startswith(".") or page_content.startswith("。"):
+                    page_content = page_content[1:].strip()
+                if len(page_content) > 0:
+                    document_node.page_content = page_content
+                    split_documents.append(document_node)
+        return split_documents
+
+    @staticmethod
+    def _split_documents(documents: list[Document],
+                         split_document: Callable[[Document], list[Document]],
+                         token_counter: Optional[EmbeddingTokenCounter] = None) -> list[Document]:
+        """
+        Clean and split documents into chunks, in a process pool when `INDEXING_SPLIT_MAX_WORKERS` is set
+        and there are at least `INDEXING_SPLIT_MIN_DOCUMENTS` documents. Chunks keep the order of the documents.
+        """
+        max_workers = dify_config.INDEXING_SPLIT_MAX_WORKERS
+        # daemonic processes, like the workers of a multiprocessing pool, cannot start children
+        if (max_workers > 0 and len(documents) >= dify_config.INDEXING_SPLIT_MIN_DOCUMENTS
+                and not multiprocessing.current_process().daemon):
+            documents_chunks = split_in_processes(split_document, documents, max_workers, token_counter)
+        else:
+            documents_chunks = [split_document(document) for document in documents]
+
+        return [chunk for chunks in documents_chunks for chunk in chunks]
@@ -0,0 +1,58 @@
+import multiprocessing
+import threading
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from core.embedding.token_counter import EmbeddingTokenCounter
+from core.rag.models.document import Document
+
+# the split function and the token counter of the running parallel split, workers inherit them when
+# they are forked, so the splitter and its embedding model instance are never pickled
+_split_document: Optional[Callable[[Document], list[Document]]] = None
+_token_counter: Optional[EmbeddingTokenCounter] = None
+_split_lock = threading.Lock()
+
+
+def _split_in_worker(document: Document) -> tuple[list[Document], Optional[list[int]]]:
+    documents = _split_document(document)
+    # token counts memoized in a worker are lost with it, they travel back next to the chunks
+    counts = None
+    if _token_counter and _token_counter.model_instance:
+        counts = [_token_counter.count(chunk.page_content) for chunk in documents]
+    return documents, counts
+
+
+def split_in_processes(split_document: Callable[[Document], list[Document]],
+                       documents: list[Document],
+                       max_workers: int,
+                       token_counter: Optional[EmbeddingTokenCounter] = None) -> list[list[Document]]:
+    """
+    Clean and split documents in a pool of forked processes.
+    :param split_document: cleans and splits one document into chunks
+    :param documents: documents to split
+    :param max_workers: number of processes
+    :param token_counter: token counter of the indexing job, the counts of the chunks are memoized in it
+
+    :return: chunks of every document, in the order of the documents
+    """
+    global _split_document, _token_counter
+
+    # one parallel split per process at a time, the workers read the state of the module
+    with _split_lock:
+        _split_document = split_document
+        _token_counter = token_counter
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers,
+                                     mp_context=multiprocessing.get_context('fork')) as executor:
+                chunksize = max(1, len(documents) // (max_workers * 4))
+                documents_chunks = []
+                for chunks, counts in executor.map(_split_in_worker, documents, chunksize=chunksize):
+                    if counts is not None:
+                        for chunk, tokens in zip(chunks, counts):
+                            token_counter.set_count(chunk.page_content, tokens)
+                    documents_chunks.append(chunks)
+                return documents_chunks
+        finally:
+            _split_document = None
+            _token_counter = None
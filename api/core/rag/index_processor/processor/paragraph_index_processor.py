@@ -1,8 +1,7 @@
 """Paragraph index processor."""
-import uuid
+import functools
 from typing import Optional
 
-from core.rag.cleaner.clean_processor import CleanProcessor
 from core.rag.datasource.keyword.keyword_factory import Keyword
 from core.rag.datasource.retrieval_service import RetrievalService
 from core.rag.datasource.vdb.vector_factory import Vector
@@ -10,7 +9,6 @@ from core.rag.extractor.entity.extract_setting import ExtractSetting
 from core.rag.extractor.extract_processor import ExtractProcessor
 from core.rag.index_processor.index_processor_base import BaseIndexProcessor
 from core.rag.models.document import Document
-from libs import helper
 from models.dataset import Dataset
 
 
@@ -26,33 +24,11 @@ class ParagraphIndexProcessor(BaseIndexProcessor):
     def transform(self, documents: list[Document], **kwargs) -> list[Document]:
         # Split the text documents into nodes.
         splitter = self._get_splitter(processing_rule=kwargs.get('process_rule'),
-                                      embedding_model_instance=kwargs.get('embedding_model_instance'))
-        all_documents = []
-        for document in documents:
-            # document clean
-            document_text = CleanProcessor.clean(document.page_content, kwargs.get('process_rule'))
-            document.page_content = document_text
-            # parse document to nodes
-            document_nodes = splitter.split_documents([document])
-            split_documents = []
-            for document_node in document_nodes:
-
-                if document_node.page_content.strip():
-                    doc_id = str(uuid.uuid4())
-                    hash = helper.generate_text_hash(document_node.page_content)
-                    document_node.metadata['doc_id'] = doc_id
-                    document_node.metadata['doc_hash'] = hash
-                    # delete Splitter character
-                    page_content = document_node.page_content
-                    if page_content.startswith(".") or page_content.startswith("。"):
-                        page_content = page_content[1:].strip()
-                    else:
-                        page_content = page_content
-                    if len(page_content) > 0:
-                        document_node.page_content = page_content
-                        split_documents.append(document_node)
-            all_documents.extend(split_documents)
-        return all_documents
+                                      embedding_model_instance=kwargs.get('embedding_model_instance'),
+                                      token_counter=kwargs.get('token_counter'))
+        split_document = functools.partial(self._split_document, splitter=splitter,
+                                           process_rule=kwargs.get('process_rule'))
+        return self._split_documents(documents, split_document, token_counter=kwargs.get('token_counter'))
 
     def load(self, dataset: Dataset, documents: list[Document], with_keywords: bool = True):
         if dataset.indexing_technique == 'high_quality':
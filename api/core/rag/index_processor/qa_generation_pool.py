@@ -0,0 +1,86 @@
+import logging
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from flask import Flask
+
+from configs import dify_config
+from core.rag.models.document import Document
+
+logger = logging.getLogger(__name__)
+
+# backoff in seconds before the first retry of a failed chunk, doubled for every further retry
+RETRY_BACKOFF = 1
+
+_tenant_semaphores: dict[str, threading.BoundedSemaphore] = {}
+_tenant_semaphores_lock = threading.Lock()
+
+
+def get_tenant_semaphore(tenant_id: str) -> threading.BoundedSemaphore:
+    """Per-process limit of QA generation calls in flight for one tenant, shared by all indexing jobs."""
+    with _tenant_semaphores_lock:
+        if tenant_id not in _tenant_semaphores:
+            _tenant_semaphores[tenant_id] = threading.BoundedSemaphore(
+                dify_config.QA_GENERATION_MAX_CONCURRENCY_PER_TENANT
+            )
+        return _tenant_semaphores[tenant_id]
+
+
+class QAGenerationPool:
+    """
+    Generates the QA documents of chunks in a bounded thread pool with a sliding window.
+
+    A new chunk starts as soon as a worker is free instead of waiting for a whole group, results are
+    yielded in chunk order, at most two chunks per worker run ahead of the consumer.
+    Failed chunks are retried with backoff, a chunk that still fails yields no QA documents.
+    """
+
+    def __init__(self, flask_app: Flask, tenant_id: str, generate: Callable[[Document], list[Document]]):
+        self._flask_app = flask_app
+        self._tenant_id = tenant_id
+        self._generate = generate
+        self._semaphore = get_tenant_semaphore(tenant_id)
+        self._max_workers = dify_config.QA_GENERATION_MAX_CONCURRENCY_PER_TENANT
+
+    def run(self, documents: list[Document]) -> Iterator[list[Document]]:
+        """
+        :return: QA documents of every chunk, in the order of the chunks
+        """
+        documents = [document for document in documents
+                     if document.page_content is not None and document.page_content.strip()]
+        with ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='qa_generation') as executor:
+            pending: deque[Future] = deque()
+            remaining = iter(documents)
+            try:
+                for document in remaining:
+                    pending.append(executor.submit(self._generate_with_retry, document))
+                    if len(pending) >= 2 * self._max_workers:
+                        break
+
+                while pending:
+                    qa_documents = pending.popleft().result()
+                    document = next(remaining, None)
+                    if document is not None:
+                        pending.append(executor.submit(self._generate_with_retry, document))
+                    yield qa_documents
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _generate_with_retry(self, document: Document) -> list[Document]:
+        with self._flask_app.app_context():
+            retries = 0
+            while True:
+                try:
+                    with self._semaphore:
+                        return self._generate(document)
+                except Exception:
+                    if retries >= dify_config.QA_GENERATION_MAX_RETRIES:
+                        logger.exception(f'Failed to generate QA documents of chunk {document.metadata.get("doc_id")}'
+                                         f' of tenant {self._tenant_id}')
+                        return []
+                    time.sleep(RETRY_BACKOFF * 2 ** retries)
+                    retries += 1
@@ -1,8 +1,7 @@
-import math
-from collections import Counter
 from typing import Optional
 
 import numpy as np
+from scipy.sparse import csr_matrix
 
 from core.embedding.cached_embedding import CacheEmbedding
 from core.model_manager import ModelManager
@@ -10,6 +9,8 @@ from core.model_runtime.entities.model_entities import ModelType
 from core.rag.datasource.keyword.jieba.jieba_keyword_table_handler import JiebaKeywordTableHandler
 from core.rag.models.document import Document
 from core.rag.rerank.entity.weight import VectorSetting, Weights
+from extensions.ext_database import db
+from models.dataset import DocumentSegment
 
 
 class WeightRerankRunner:
@@ -30,25 +31,25 @@ class WeightRerankRunner:
 
         :return:
         """
-        docs = []
-        doc_id = []
-        unique_documents = []
+        unique_documents = {}
         for document in documents:
-            if document.metadata['doc_id'] not in doc_id:
-                doc_id.append(document.metadata['doc_id'])
-                docs.append(document.page_content)
-                unique_documents.append(document)
+            unique_document = unique_documents.setdefault(document.metadata['doc_id'], document)
+            # a chunk found by both searches keeps the BM25 score of its keyword search result
+            if 'keyword_score' in document.metadata and 'keyword_score' not in unique_document.metadata:
+                unique_document.metadata['keyword_score'] = document.metadata['keyword_score']
 
-        documents = unique_documents
+        documents = list(unique_documents.values())
+        if not documents:
+            return []
 
         rerank_documents = []
         query_scores = self._calculate_keyword_score(query, documents)
 
         query_vector_scores = self._calculate_cosine(self.tenant_id, query, documents, self.weights.vector_setting)
-        for document, query_score, query_vector_score in zip(documents, query_scores, query_vector_scores):
+        scores = self.weights.vector_setting.vector_weight * query_vector_scores + \
+            self.weights.keyword_setting.keyword_weight * query_scores
+        for document, score in zip(documents, scores.tolist()):
             # format document
-            score = self.weights.vector_setting.vector_weight * query_vector_score + \
-                    self.weights.keyword_setting.keyword_weight * query_score
             if score_threshold and score < score_threshold:
                 continue
             document.metadata['score'] = score
@@ -56,9 +57,28 @@ class WeightRerankRunner:
         rerank_documents = sorted(rerank_documents, key=lambda x: x.metadata['score'], reverse=True)
         return rerank_documents[:top_n] if top_n else rerank_documents
 
-    def _calculate_keyword_score(self, query: str, documents: list[Document]) -> list[float]:
+    def _calculate_keyword_score(self, query: str, documents: list[Document]) -> np.ndarray:
         """
-        Calculate BM25 scores
+        Calculate keyword scores of the documents against the query, the normalized BM25 `keyword_score` set by
+        the keyword search when present, TF-IDF cosine scores otherwise
+        :param query: search query
+        :param documents: documents for reranking
+
+        :return:
+        """
+        bm25_scores = [document.metadata.get('keyword_score') for document in documents]
+        if all(score is not None for score in bm25_scores):
+            return np.asarray(bm25_scores, dtype=float)
+
+        keyword_scores = self._calculate_tfidf_score(query, documents)
+        for i, score in enumerate(bm25_scores):
+            if score is not None:
+                keyword_scores[i] = score
+        return keyword_scores
+
+    def _calculate_tfidf_score(self, query: str, documents: list[Document]) -> np.ndarray:
+        """
+        Calculate TF-IDF cosine scores of the documents against the query
         :param query: search query
         :param documents: documents for reranking
 
@@ -66,74 +86,62 @@ class WeightRerankRunner:
         """
         keyword_table_handler = JiebaKeywordTableHandler()
         query_keywords = keyword_table_handler.extract_keywords(query, None)
-        documents_keywords = []
-        for document in documents:
-            # get the document keywords
-            document_keywords = keyword_table_handler.extract_keywords(document.page_content, None)
-            document.metadata['keywords'] = document_keywords
-            documents_keywords.append(document_keywords)
+        documents_keywords = self._get_documents_keywords(documents, keyword_table_handler)
+
+        # binary document-keyword matrix over the keywords of all documents
+        vocabulary: dict[str, int] = {}
+        rows = []
+        columns = []
+        for row, document_keywords in enumerate(documents_keywords):
+            for keyword in set(document_keywords):
+                rows.append(row)
+                columns.append(vocabulary.setdefault(keyword, len(vocabulary)))
+        if not vocabulary:
+            return np.zeros(len(documents))
+        keyword_matrix = csr_matrix((np.ones(len(rows)), (rows, columns)), shape=(len(documents), len(vocabulary)))
+
+        # IDF of every keyword, from the number of documents containing it
+        total_documents = len(documents)
+        document_frequencies = np.asarray(keyword_matrix.sum(axis=0)).ravel()
+        keyword_idf = np.log((1 + total_documents) / (1 + document_frequencies)) + 1
 
-        # Counter query keywords(TF)
-        query_keyword_counts = Counter(query_keywords)
+        documents_tfidf = keyword_matrix.multiply(keyword_idf).tocsr()
+        query_tfidf = np.zeros(len(vocabulary))
+        for keyword in query_keywords:
+            if keyword in vocabulary:
+                query_tfidf[vocabulary[keyword]] = keyword_idf[vocabulary[keyword]]
 
-        # total documents
-        total_documents = len(documents)
+        numerators = documents_tfidf @ query_tfidf
+        documents_norm = np.sqrt(np.asarray(documents_tfidf.multiply(documents_tfidf).sum(axis=1)).ravel())
+        denominators = documents_norm * np.linalg.norm(query_tfidf)
 
-        # calculate all documents' keywords IDF
-        all_keywords = set()
-        for document_keywords in documents_keywords:
-            all_keywords.update(document_keywords)
-
-        keyword_idf = {}
-        for keyword in all_keywords:
-            # calculate include query keywords' documents
-            doc_count_containing_keyword = sum(1 for doc_keywords in documents_keywords if keyword in doc_keywords)
-            # IDF
-            keyword_idf[keyword] = math.log((1 + total_documents) / (1 + doc_count_containing_keyword)) + 1
-
-        query_tfidf = {}
-
-        for keyword, count in query_keyword_counts.items():
-            tf = count
-            idf = keyword_idf.get(keyword, 0)
-            query_tfidf[keyword] = tf * idf
-
-        # calculate all documents' TF-IDF
-        documents_tfidf = []
-        for document_keywords in documents_keywords:
-            document_keyword_counts = Counter(document_keywords)
-            document_tfidf = {}
-            for keyword, count in document_keyword_counts.items():
-                tf = count
-                idf = keyword_idf.get(keyword, 0)
-                document_tfidf[keyword] = tf * idf
-            documents_tfidf.append(document_tfidf)
-
-        def cosine_similarity(vec1, vec2):
-            intersection = set(vec1.keys()) & set(vec2.keys())
-            numerator = sum(vec1[x] * vec2[x] for x in intersection)
-
-            sum1 = sum(vec1[x] ** 2 for x in vec1.keys())
-            sum2 = sum(vec2[x] ** 2 for x in vec2.keys())
-            denominator = math.sqrt(sum1) * math.sqrt(sum2)
-
-            if not denominator:
-                return 0.0
-            else:
-                return float(numerator) / denominator
+        return np.divide(numerators, denominators, out=np.zeros(len(documents)), where=denominators != 0)
 
-        similarities = []
-        for document_tfidf in documents_tfidf:
-            similarity = cosine_similarity(query_tfidf, document_tfidf)
-            similarities.append(similarity)
+    def _get_documents_keywords(self, documents: list[Document],
+                                keyword_table_handler: JiebaKeywordTableHandler) -> list[list[str]]:
+        """
+        Get the keywords of the documents, reusing the keywords stored on their segments
+        and only extracting keywords for documents without them.
+        """
+        doc_ids = [document.metadata['doc_id'] for document in documents]
+        segments_keywords = dict(
+            db.session.query(DocumentSegment.index_node_id, DocumentSegment.keywords).filter(
+                DocumentSegment.index_node_id.in_(doc_ids)
+            ).all()
+        )
 
-        # for idx, similarity in enumerate(similarities):
-        #     print(f"Document {idx + 1} similarity: {similarity}")
+        documents_keywords = []
+        for document in documents:
+            document_keywords = segments_keywords.get(document.metadata['doc_id'])
+            if not document_keywords:
+                document_keywords = list(keyword_table_handler.extract_keywords(document.page_content, None))
+            document.metadata['keywords'] = document_keywords
+            documents_keywords.append(document_keywords)
 
-        return similarities
+        return documents_keywords
 
     def _calculate_cosine(self, tenant_id: str, query: str, documents: list[Document],
-                          vector_setting: VectorSetting) -> list[float]:
+                          vector_setting: VectorSetting) -> np.ndarray:
         """
         Calculate Cosine scores
         :param query: search query
@@ -141,7 +149,16 @@ class WeightRerankRunner:
 
         :return:
         """
-        query_vector_scores = []
+        query_vector_scores = np.zeros(len(documents))
+        unscored_indices = []
+        for i, document in enumerate(documents):
+            if 'score' in document.metadata:
+                query_vector_scores[i] = document.metadata['score']
+            else:
+                unscored_indices.append(i)
+
+        if not unscored_indices:
+            return query_vector_scores
 
         model_manager = ModelManager()
 
@@ -153,25 +170,12 @@ class WeightRerankRunner:
 
         )
         cache_embedding = CacheEmbedding(embedding_model)
-        query_vector = cache_embedding.embed_query(query)
-        for document in documents:
-            # calculate cosine similarity
-            if 'score' in document.metadata:
-                query_vector_scores.append(document.metadata['score'])
-            else:
-                # transform to NumPy
-                vec1 = np.array(query_vector)
-                vec2 = np.array(document.vector)
-
-                # calculate dot product
-                dot_product = np.dot(vec1, vec2)
-
-                # calculate norm
-                norm_vec1 = np.linalg.norm(vec1)
-                norm_vec2 = np.linalg.norm(vec2)
+        query_vector = np.asarray(cache_embedding.embed_query(query), dtype=float)
 
-                # calculate cosine similarity
-                cosine_sim = dot_product / (norm_vec1 * norm_vec2)
-                query_vector_scores.append(cosine_sim)
+        # calculate cosine similarity of all documents with one matrix-vector product
+        document_vectors = np.asarray([documents[i].vector for i in unscored_indices], dtype=float)
+        dot_products = document_vectors @ query_vector
+        norms = np.linalg.norm(document_vectors, axis=1) * np.linalg.norm(query_vector)
+        query_vector_scores[unscored_indices] = dot_products / norms
 
         return query_vector_scores
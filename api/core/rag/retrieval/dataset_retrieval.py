@@ -1,13 +1,15 @@
+import logging
 import math
-import threading
 from collections import Counter
+from functools import partial
 from typing import Optional, cast
 
-from flask import Flask, current_app
+from flask import current_app
 
 from core.app.app_config.entities import DatasetEntity, DatasetRetrieveConfigEntity
 from core.app.entities.app_invoke_entities import InvokeFrom, ModelConfigWithCredentialsEntity
 from core.callback_handler.index_tool_callback_handler import DatasetIndexToolCallbackHandler
+from core.embedding.query_embedding_memo import query_embedding_scope
 from core.entities.agent_entities import PlanningStrategy
 from core.memory.token_buffer_memory import TokenBufferMemory
 from core.model_manager import ModelInstance, ModelManager
@@ -21,9 +23,11 @@ from core.rag.data_post_processor.data_post_processor import DataPostProcessor
 from core.rag.datasource.keyword.jieba.jieba_keyword_table_handler import JiebaKeywordTableHandler
 from core.rag.datasource.retrieval_service import RetrievalService
 from core.rag.models.document import Document
+from core.rag.retrieval.retrieval_executor import dataset_retrieval_executor, get_retrieval_timeout
 from core.rag.retrieval.retrieval_methods import RetrievalMethod
 from core.rag.retrieval.router.multi_dataset_function_call_router import FunctionCallMultiDatasetRouter
 from core.rag.retrieval.router.multi_dataset_react_route import ReactMultiDatasetRouter
+from core.rag.retrieval.segment_hit_counter import SegmentHitCounter
 from core.tools.tool.dataset_retriever.dataset_multi_retriever_tool import DatasetMultiRetrieverTool
 from core.tools.tool.dataset_retriever.dataset_retriever_base_tool import DatasetRetrieverBaseTool
 from core.tools.tool.dataset_retriever.dataset_retriever_tool import DatasetRetrieverTool
@@ -31,6 +35,8 @@ from extensions.ext_database import db
 from models.dataset import Dataset, DatasetQuery, DocumentSegment
 from models.dataset import Document as DatasetDocument
 
+logger = logging.getLogger(__name__)
+
 default_retrieval_model = {
     'search_method': RetrievalMethod.SEMANTIC_SEARCH.value,
     'reranking_enable': False,
@@ -118,8 +124,7 @@ class DatasetRetrieval:
                 continue
 
             # pass if dataset is not available
-            if (dataset and dataset.available_document_count == 0
-                    and dataset.available_document_count == 0):
+            if dataset.available_document_count == 0:
                 continue
 
             available_datasets.append(dataset)
@@ -171,6 +176,8 @@ class DatasetRetrieval:
             if show_retrieve_source:
                 context_list = []
                 resource_number = 1
+                hit_counts = SegmentHitCounter.get_live_hit_counts(sorted_segments) \
+                    if invoke_from.to_source() == 'dev' else {}
                 for segment in sorted_segments:
                     dataset = Dataset.query.filter_by(
                         id=segment.dataset_id
@@ -193,7 +200,7 @@ class DatasetRetrieval:
                         }
 
                         if invoke_from.to_source() == 'dev':
-                            source['hit_count'] = segment.hit_count
+                            source['hit_count'] = hit_counts[segment.id]
                             source['word_count'] = segment.word_count
                             source['segment_position'] = segment.position
                             source['index_node_hash'] = segment.index_node_hash
@@ -306,43 +313,48 @@ class DatasetRetrieval:
             reranking_enable: bool = True,
             message_id: Optional[str] = None,
     ):
-        threads = []
-        all_documents = []
         dataset_ids = [dataset.id for dataset in available_datasets]
         index_type = None
+        tasks = []
         for dataset in available_datasets:
             index_type = dataset.indexing_technique
-            retrieval_thread = threading.Thread(target=self._retriever, kwargs={
-                'flask_app': current_app._get_current_object(),
-                'dataset_id': dataset.id,
-                'query': query,
-                'top_k': top_k,
-                'all_documents': all_documents,
-            })
-            threads.append(retrieval_thread)
-            retrieval_thread.start()
-        for thread in threads:
-            thread.join()
-
-        with measure_time() as timer:
-            if reranking_enable:
-                # do rerank for searched documents
-                data_post_processor = DataPostProcessor(
-                    tenant_id, reranking_mode,
-                    reranking_model, weights, False
-                )
+            tasks.append(partial(
+                self._retriever,
+                # the workers must not load attributes through the session of this thread
+                dataset=self._detach_dataset(dataset),
+                query=query,
+                top_k=top_k
+            ))
+        # the query is embedded once for all datasets and the reranker
+        with query_embedding_scope():
+            results, exceptions = dataset_retrieval_executor.run(
+                flask_app=current_app._get_current_object(),
+                tasks=tasks,
+                timeout=get_retrieval_timeout()
+            )
+            for exception in exceptions:
+                logger.warning(f'dataset retrieval failed: {exception}')
+            all_documents = [document for documents in results if documents for document in documents]
+
+            with measure_time() as timer:
+                if reranking_enable:
+                    # do rerank for searched documents
+                    data_post_processor = DataPostProcessor(
+                        tenant_id, reranking_mode,
+                        reranking_model, weights, False
+                    )
 
-                all_documents = data_post_processor.invoke(
-                    query=query,
-                    documents=all_documents,
-                    score_threshold=score_threshold,
-                    top_n=top_k
-                )
-            else:
-                if index_type == "economy":
-                    all_documents = self.calculate_keyword_score(query, all_documents, top_k)
-                elif index_type == "high_quality":
-                    all_documents = self.calculate_vector_score(all_documents, top_k, score_threshold)
+                    all_documents = data_post_processor.invoke(
+                        query=query,
+                        documents=all_documents,
+                        score_threshold=score_threshold,
+                        top_n=top_k
+                    )
+                else:
+                    if index_type == "economy":
+                        all_documents = self.calculate_keyword_score(query, all_documents, top_k)
+                    elif index_type == "high_quality":
+                        all_documents = self.calculate_vector_score(all_documents, top_k, score_threshold)
 
         self._on_query(query, dataset_ids, app_id, user_from, user_id)
 
@@ -355,22 +367,7 @@ class DatasetRetrieval:
         self, documents: list[Document], message_id: Optional[str] = None, timer: Optional[dict] = None
     ) -> None:
         """Handle retrieval end."""
-        for document in documents:
-            query = db.session.query(DocumentSegment).filter(
-                DocumentSegment.index_node_id == document.metadata['doc_id']
-            )
-
-            # if 'dataset_id' in document.metadata:
-            if 'dataset_id' in document.metadata:
-                query = query.filter(DocumentSegment.dataset_id == document.metadata['dataset_id'])
-
-            # add hit count to document segment
-            query.update(
-                {DocumentSegment.hit_count: DocumentSegment.hit_count + 1},
-                synchronize_session=False
-            )
-
-            db.session.commit()
+        SegmentHitCounter.record_hits(documents)
 
         # get tracing instance
         trace_manager: TraceQueueManager = self.application_generate_entity.trace_manager if self.application_generate_entity else None
@@ -405,44 +402,41 @@ class DatasetRetrieval:
             db.session.add_all(dataset_queries)
         db.session.commit()
 
-    def _retriever(self, flask_app: Flask, dataset_id: str, query: str, top_k: int, all_documents: list):
-        with flask_app.app_context():
-            dataset = db.session.query(Dataset).filter(
-                Dataset.id == dataset_id
-            ).first()
-
-            if not dataset:
-                return []
-
-            # get retrieval model , if the model is not setting , using default
-            retrieval_model = dataset.retrieval_model if dataset.retrieval_model else default_retrieval_model
-
-            if dataset.indexing_technique == "economy":
-                # use keyword table query
-                documents = RetrievalService.retrieve(retrieval_method='keyword_search',
-                                                      dataset_id=dataset.id,
-                                                      query=query,
-                                                      top_k=top_k
-                                                      )
-                if documents:
-                    all_documents.extend(documents)
-            else:
-                if top_k > 0:
-                    # retrieval source
-                    documents = RetrievalService.retrieve(retrieval_method=retrieval_model['search_method'],
-                                                          dataset_id=dataset.id,
-                                                          query=query,
-                                                          top_k=top_k,
-                                                          score_threshold=retrieval_model.get('score_threshold', .0)
-                                                          if retrieval_model['score_threshold_enabled'] else None,
-                                                          reranking_model=retrieval_model.get('reranking_model', None)
-                                                          if retrieval_model['reranking_enable'] else None,
-                                                          reranking_mode=retrieval_model.get('reranking_mode')
-                                                          if retrieval_model.get('reranking_mode') else 'reranking_model',
-                                                          weights=retrieval_model.get('weights', None),
-                                                          )
-
-                    all_documents.extend(documents)
+    @staticmethod
+    def _detach_dataset(dataset: Dataset) -> Dataset:
+        """
+        Copy the columns of a loaded dataset into a new dataset that belongs to no session.
+        """
+        return Dataset(**{column.key: getattr(dataset, column.key) for column in Dataset.__table__.columns})
+
+    def _retriever(self, dataset: Dataset, query: str, top_k: int) -> list[Document]:
+        # get retrieval model , if the model is not setting , using default
+        retrieval_model = dataset.retrieval_model if dataset.retrieval_model else default_retrieval_model
+
+        if dataset.indexing_technique == "economy":
+            # use keyword table query
+            return RetrievalService.retrieve(retrieval_method='keyword_search',
+                                             dataset_id=dataset.id,
+                                             query=query,
+                                             top_k=top_k,
+                                             dataset=dataset
+                                             )
+        if top_k > 0:
+            # retrieval source
+            return RetrievalService.retrieve(retrieval_method=retrieval_model['search_method'],
+                                             dataset_id=dataset.id,
+                                             query=query,
+                                             top_k=top_k,
+                                             score_threshold=retrieval_model.get('score_threshold', .0)
+                                             if retrieval_model['score_threshold_enabled'] else None,
+                                             reranking_model=retrieval_model.get('reranking_model', None)
+                                             if retrieval_model['reranking_enable'] else None,
+                                             reranking_mode=retrieval_model.get('reranking_mode')
+                                             if retrieval_model.get('reranking_mode') else 'reranking_model',
+                                             weights=retrieval_model.get('weights', None),
+                                             dataset=dataset
+                                             )
+        return []
 
     def to_dataset_retriever_tool(self, tenant_id: str,
                                   dataset_ids: list[str],
@@ -474,8 +468,7 @@ class DatasetRetrieval:
                 continue
 
             # pass if dataset is not available
-            if (dataset and dataset.available_document_count == 0
-                    and dataset.available_document_count == 0):
+            if dataset.available_document_count == 0:
                 continue
 
             available_datasets.append(dataset)
@@ -0,0 +1,104 @@
+import contextvars
+import logging
+import os
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Optional
+
+from flask import Flask
+
+from configs import dify_config
+
+logger = logging.getLogger(__name__)
+
+
+class RetrievalExecutor:
+    """
+    Bounded, process-wide thread pool used to fan out retrieval branches.
+
+    `run` waits for the branches of one request until an optional deadline, cancels the branches
+    that are still queued or not started when the deadline passes and returns the results of the
+    branches that finished.
+    """
+
+    def __init__(self, max_workers: int, thread_name_prefix: str):
+        self._max_workers = max_workers
+        self._thread_name_prefix = thread_name_prefix
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def run(self, flask_app: Flask,
+            tasks: list[Callable[[], Any]],
+            timeout: Optional[float] = None) -> tuple[list[Any], list[str]]:
+        """
+        Run tasks in the pool, each inside its own app context.
+        :param flask_app: flask app
+        :param tasks: callables without arguments
+        :param timeout: deadline in seconds for all tasks, None waits until every task is finished
+
+        :return: results of the finished tasks in task order, error messages of the failed tasks
+        """
+        if not tasks:
+            return [], []
+
+        cancel_event = threading.Event()
+        executor = self._get_executor()
+        # every task runs in a copy of the caller's context, so request-scoped state such as the
+        # query embedding memo is shared with the branches
+        futures = [
+            executor.submit(contextvars.copy_context().run, self._run_task, flask_app, cancel_event, task)
+            for task in tasks
+        ]
+        done, not_done = wait(futures, timeout=timeout)
+        if not_done:
+            cancel_event.set()
+            for future in not_done:
+                future.cancel()
+            logger.warning(f'{len(not_done)} of {len(futures)} retrieval branches did not finish '
+                           f'within {timeout} seconds, returning partial results')
+
+        results = []
+        exceptions = []
+        for future in futures:
+            if future not in done:
+                continue
+            try:
+                results.append(future.result())
+            except Exception as e:
+                exceptions.append(str(e))
+
+        return results, exceptions
+
+    @staticmethod
+    def _run_task(flask_app: Flask, cancel_event: threading.Event, task: Callable[[], Any]) -> Any:
+        if cancel_event.is_set():
+            return None
+        with flask_app.app_context():
+            return task()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # worker threads do not survive a fork, so forked processes build their own pool
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                    thread_name_prefix=self._thread_name_prefix)
+                self._pid = os.getpid()
+            return self._executor
+
+
+def get_retrieval_timeout() -> Optional[float]:
+    return dify_config.RETRIEVAL_TIMEOUT or None
+
+
+# datasets and the search branches within a dataset use separate pools, so a dataset task waiting
+# for its branches never occupies a worker its own branches need
+dataset_retrieval_executor = RetrievalExecutor(
+    max_workers=dify_config.RETRIEVAL_MAX_WORKERS,
+    thread_name_prefix='dataset_retrieval'
+)
+retrieval_branch_executor = RetrievalExecutor(
+    max_workers=dify_config.RETRIEVAL_MAX_WORKERS,
+    thread_name_prefix='retrieval_branch'
+)
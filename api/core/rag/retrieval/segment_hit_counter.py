@@ -0,0 +1,139 @@
+import logging
+from collections import Counter, defaultdict
+
+from sqlalchemy import tuple_
+
+from configs import dify_config
+from core.rag.models.document import Document
+from extensions.ext_database import db
+from extensions.ext_redis import redis_client
+from models.dataset import DocumentSegment
+
+logger = logging.getLogger(__name__)
+
+# number of segments per bulk update statement
+HIT_COUNT_UPDATE_BATCH_SIZE = 1000
+
+
+class SegmentHitCounter:
+    """
+    Write-behind hit counts of document segments.
+
+    Hits are accumulated with HINCRBY in a Redis hash keyed by `<dataset_id>:<index_node_id>` and
+    applied to `document_segments.hit_count` in bulk by the `flush_segment_hit_count_task` schedule.
+    """
+
+    PENDING_KEY = 'segment_hit_counts'
+    FLUSHING_KEY = 'segment_hit_counts:flushing'
+    FLUSH_LOCK_KEY = 'segment_hit_counts:flush_lock'
+
+    @classmethod
+    def record_hits(cls, documents: list[Document]) -> None:
+        hits = Counter(
+            cls._field(document.metadata.get('dataset_id'), document.metadata['doc_id'])
+            for document in documents
+            if document.metadata and 'doc_id' in document.metadata
+        )
+        if not hits:
+            return
+
+        if dify_config.SEGMENT_HIT_COUNT_WRITE_BEHIND_ENABLED:
+            try:
+                pipeline = redis_client.pipeline(transaction=False)
+                for field, count in hits.items():
+                    pipeline.hincrby(cls.PENDING_KEY, field, count)
+                pipeline.execute()
+                return
+            except Exception:
+                logger.exception('Failed to record segment hit counts in redis, updating the database directly')
+
+        cls._apply_hits(hits)
+
+    @classmethod
+    def flush(cls) -> int:
+        """
+        Apply the pending hit counts to the database.
+        :return: number of segment keys flushed
+        """
+        with redis_client.lock(cls.FLUSH_LOCK_KEY, timeout=600, blocking_timeout=1):
+            # a hash left behind by an interrupted flush is applied before new hits are taken
+            if not redis_client.exists(cls.FLUSHING_KEY):
+                if not redis_client.exists(cls.PENDING_KEY):
+                    return 0
+                redis_client.rename(cls.PENDING_KEY, cls.FLUSHING_KEY)
+
+            hits = {
+                field.decode() if isinstance(field, bytes) else field: int(count)
+                for field, count in redis_client.hgetall(cls.FLUSHING_KEY).items()
+            }
+            cls._apply_hits(hits)
+            redis_client.delete(cls.FLUSHING_KEY)
+            return len(hits)
+
+    @classmethod
+    def get_live_hit_counts(cls, segments: list[DocumentSegment]) -> dict[str, int]:
+        """
+        Get the hit counts of segments including the increments that are not flushed yet.
+        :return: segment id -> hit count
+        """
+        hit_counts = {segment.id: segment.hit_count or 0 for segment in segments}
+        if not segments or not dify_config.SEGMENT_HIT_COUNT_WRITE_BEHIND_ENABLED:
+            return hit_counts
+
+        fields = []
+        for segment in segments:
+            fields.append(cls._field(segment.dataset_id, segment.index_node_id))
+            fields.append(cls._field(None, segment.index_node_id))
+        try:
+            pipeline = redis_client.pipeline(transaction=False)
+            pipeline.hmget(cls.PENDING_KEY, fields)
+            pipeline.hmget(cls.FLUSHING_KEY, fields)
+            pending_counts = [
+                sum(int(count) for count in counts if count is not None)
+                for counts in zip(*pipeline.execute())
+            ]
+        except Exception:
+            logger.exception('Failed to get pending segment hit counts from redis')
+            return hit_counts
+
+        for i, segment in enumerate(segments):
+            hit_counts[segment.id] += pending_counts[2 * i] + pending_counts[2 * i + 1]
+        return hit_counts
+
+    @staticmethod
+    def _field(dataset_id, index_node_id: str) -> str:
+        return '{}:{}'.format(dataset_id or '', index_node_id)
+
+    @staticmethod
+    def _apply_hits(hits: dict[str, int]) -> None:
+        # one statement per distinct increment and batch, most segments share small increments
+        segments_by_increment: dict[int, tuple[list, list]] = defaultdict(lambda: ([], []))
+        for field, count in hits.items():
+            if count <= 0:
+                continue
+            dataset_id, _, index_node_id = field.partition(':')
+            dataset_segments, node_ids = segments_by_increment[count]
+            if dataset_id:
+                dataset_segments.append((dataset_id, index_node_id))
+            else:
+                node_ids.append(index_node_id)
+
+        for count, (dataset_segments, node_ids) in segments_by_increment.items():
+            for i in range(0, len(dataset_segments), HIT_COUNT_UPDATE_BATCH_SIZE):
+                db.session.query(DocumentSegment).filter(
+                    tuple_(DocumentSegment.dataset_id, DocumentSegment.index_node_id).in_(
+                        dataset_segments[i:i + HIT_COUNT_UPDATE_BATCH_SIZE]
+                    )
+                ).update(
+                    {DocumentSegment.hit_count: DocumentSegment.hit_count + count},
+                    synchronize_session=False
+                )
+            for i in range(0, len(node_ids), HIT_COUNT_UPDATE_BATCH_SIZE):
+                db.session.query(DocumentSegment).filter(
+                    DocumentSegment.index_node_id.in_(node_ids[i:i + HIT_COUNT_UPDATE_BATCH_SIZE])
+                ).update(
+                    {DocumentSegment.hit_count: DocumentSegment.hit_count + count},
+                    synchronize_session=False
+                )
+        db.session.commit()
+
@@ -3,8 +3,8 @@ from __future__ import annotations
 
 from typing import Any, Optional
 
+from core.embedding.token_counter import EmbeddingTokenCounter
 from core.model_manager import ModelInstance
-from core.model_runtime.model_providers.__base.tokenizers.gpt2_tokenzier import GPT2Tokenizer
 from core.rag.splitter.text_splitter import (
     TS,
     Collection,
@@ -27,18 +27,13 @@ class EnhanceRecursiveCharacterTextSplitter(RecursiveCharacterTextSplitter):
             embedding_model_instance: Optional[ModelInstance],
             allowed_special: Union[Literal[all], Set[str]] = set(),
             disallowed_special: Union[Literal[all], Collection[str]] = "all",
+            token_counter: Optional[EmbeddingTokenCounter] = None,
             **kwargs: Any,
     ):
-        def _token_encoder(text: str) -> int:
-            if not text:
-                return 0
-
-            if embedding_model_instance:
-                return embedding_model_instance.get_text_embedding_num_tokens(
-                    texts=[text]
-                )
-            else:
-                return GPT2Tokenizer.get_num_tokens(text)
+        # fragments are measured again and again while merging splits, the counter memoizes them
+        if not token_counter:
+            token_counter = EmbeddingTokenCounter(embedding_model_instance)
+        _token_encoder = token_counter.count
 
         if issubclass(cls, TokenTextSplitter):
             extra_kwargs = {
@@ -4,6 +4,7 @@ import copy
 import logging
 import re
 from abc import ABC, abstractmethod
+from collections import deque
 from collections.abc import Callable, Collection, Iterable, Sequence, Set
 from dataclasses import dataclass
 from typing import (
@@ -100,7 +101,7 @@ class TextSplitter(BaseDocumentTransformer, ABC):
             metadatas.append(doc.metadata)
         return self.create_documents(texts, metadatas=metadatas)
 
-    def _join_docs(self, docs: list[str], separator: str) -> Optional[str]:
+    def _join_docs(self, docs: Iterable[str], separator: str) -> Optional[str]:
         text = separator.join(docs)
         text = text.strip()
         if text == "":
@@ -111,14 +112,15 @@ class TextSplitter(BaseDocumentTransformer, ABC):
     def _merge_splits(self, splits: Iterable[str], separator: str, lengths: list[int]) -> list[str]:
         # We now want to combine these smaller pieces into medium size
         # chunks to send to the LLM.
+        # Every split is measured once by the caller, the window of the current chunk is a deque of splits
+        # and their lengths with a running total, so merging is linear in the number of splits.
         separator_len = self._length_function(separator)
 
         docs = []
-        current_doc: list[str] = []
+        current_doc: deque[str] = deque()
+        current_lengths: deque[int] = deque()
         total = 0
-        index = 0
-        for d in splits:
-            _len = lengths[index]
+        for d, _len in zip(splits, lengths):
             if (
                     total + _len + (separator_len if len(current_doc) > 0 else 0)
                     > self._chunk_size
@@ -140,13 +142,14 @@ class TextSplitter(BaseDocumentTransformer, ABC):
                             > self._chunk_size
                             and total > 0
                     ):
-                        total -= self._length_function(current_doc[0]) + (
+                        total -= current_lengths[0] + (
                             separator_len if len(current_doc) > 1 else 0
                         )
-                        current_doc = current_doc[1:]
+                        current_doc.popleft()
+                        current_lengths.popleft()
             current_doc.append(d)
+            current_lengths.append(_len)
             total += _len + (separator_len if len(current_doc) > 1 else 0)
-            index += 1
         doc = self._join_docs(current_doc, separator)
         if doc is not None:
             docs.append(doc)
@@ -198,6 +198,7 @@ class ToolIdentity(BaseModel):
     label: I18nObject = Field(..., description="The label of the tool")
     provider: str = Field(..., description="The provider of the tool")
     icon: Optional[str] = None
+    parallel_safe: bool = Field(default=True, description="Whether the tool can run concurrently with other tool calls")
 
 class ToolCredentialsOption(BaseModel):
     value: str = Field(..., description="The value of the option")
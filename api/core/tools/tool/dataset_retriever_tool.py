@@ -71,6 +71,22 @@ class DatasetRetrieverTool(Tool):
 
         return tools
 
+    def fork_tool_runtime(self, runtime: dict[str, Any]) -> 'DatasetRetrieverTool':
+        """
+            fork a new tool with meta data
+
+            :param meta: the meta data of a tool call processing
+            :return: the new tool
+        """
+        return self.__class__(
+            retrieval_tool=self.retrieval_tool.model_copy(),
+            identity=self.identity.model_copy() if self.identity else None,
+            parameters=self.parameters.copy() if self.parameters else None,
+            description=self.description.model_copy() if self.description else None,
+            is_team_authorization=self.is_team_authorization,
+            runtime=Tool.Runtime(**runtime),
+        )
+
     def get_runtime_parameters(self) -> list[ToolParameter]:
         return [
             ToolParameter(name='query',
@@ -87,6 +87,14 @@ class Tool(BaseModel, ABC):
             :return: the tool provider type
         """
 
+    def is_parallel_safe(self) -> bool:
+        """
+            whether the tool can run concurrently with the other tool calls of an agent turn
+
+            :return: True if the tool can run concurrently
+        """
+        return self.identity.parallel_safe if self.identity else True
+
     def load_variables(self, variables: ToolRuntimeVariablePool):
         """
             load variables from database
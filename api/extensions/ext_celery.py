@@ -53,6 +53,9 @@ def init_app(app: Flask) -> Celery:
     imports = [
         "schedule.clean_embedding_cache_task",
         "schedule.clean_unused_datasets_task",
+        "schedule.flush_segment_hit_count_task",
+        # queued by the pgvector store, which the worker imports only once it indexes a dataset
+        "tasks.create_pgvector_indexes_task",
     ]
     day = app.config.get("CELERY_BEAT_SCHEDULER_TIME")
     beat_schedule = {
@@ -64,6 +67,10 @@ def init_app(app: Flask) -> Celery:
             "task": "schedule.clean_unused_datasets_task.clean_unused_datasets_task",
             "schedule": timedelta(days=day),
         },
+        "flush_segment_hit_count_task": {
+            "task": "schedule.flush_segment_hit_count_task.flush_segment_hit_count_task",
+            "schedule": timedelta(seconds=app.config.get("SEGMENT_HIT_COUNT_FLUSH_INTERVAL")),
+        },
     }
     celery_app.conf.update(beat_schedule=beat_schedule, imports=imports)
 
@@ -7,15 +7,19 @@ import logging
 import os
 import pickle
 import re
+import struct
 import time
 from json import JSONDecodeError
+from typing import Optional
 
+import numpy as np
 from sqlalchemy import func
 from sqlalchemy.dialects.postgresql import JSONB
 
 from configs import dify_config
 from core.rag.retrieval.retrieval_methods import RetrievalMethod
 from extensions.ext_database import db
+from extensions.ext_redis import redis_client
 from extensions.ext_storage import storage
 
 from .account import Account
@@ -37,6 +41,7 @@ class Dataset(db.Model):
     )
 
     INDEXING_TECHNIQUE_LIST = ['high_quality', 'economy', None]
+    AVAILABLE_COUNT_CACHE_KEY = 'dataset_available_{}_count_{}'
 
     id = db.Column(StringUUID, server_default=db.text('uuid_generate_v4()'))
     tenant_id = db.Column(StringUUID, nullable=False)
@@ -93,20 +98,58 @@ class Dataset(db.Model):
 
     @property
     def available_document_count(self):
-        return db.session.query(func.count(Document.id)).filter(
+        return self._get_available_count('document', lambda: db.session.query(func.count(Document.id)).filter(
             Document.dataset_id == self.id,
             Document.indexing_status == 'completed',
             Document.enabled == True,
             Document.archived == False
-        ).scalar()
+        ).scalar())
 
     @property
     def available_segment_count(self):
-        return db.session.query(func.count(DocumentSegment.id)).filter(
+        return self._get_available_count('segment', lambda: db.session.query(func.count(DocumentSegment.id)).filter(
             DocumentSegment.dataset_id == self.id,
             DocumentSegment.status == 'completed',
             DocumentSegment.enabled == True
-        ).scalar()
+        ).scalar())
+
+    def _get_available_count(self, kind: str, count_func) -> int:
+        ttl = dify_config.DATASET_AVAILABLE_COUNT_CACHE_TTL
+        if not ttl:
+            return count_func()
+
+        cache_key = self.AVAILABLE_COUNT_CACHE_KEY.format(kind, self.id)
+        try:
+            cached_count = redis_client.get(cache_key)
+            if cached_count is not None:
+                return int(cached_count)
+        except Exception:
+            logging.exception('Failed to get available count of dataset %s from redis', self.id)
+            return count_func()
+
+        count = count_func()
+        # a dataset without available documents is cheap to count and must see new documents at once,
+        # so only positive counts are cached
+        if count:
+            try:
+                redis_client.setex(cache_key, ttl, count)
+            except Exception:
+                logging.exception('Failed to cache available count of dataset %s', self.id)
+        return count
+
+    @classmethod
+    def invalidate_available_counts(cls, dataset_id: str) -> None:
+        """
+        Drop the cached available document and segment counts after documents or segments
+        of the dataset are indexed, enabled, disabled, archived or deleted.
+        """
+        try:
+            redis_client.delete(
+                cls.AVAILABLE_COUNT_CACHE_KEY.format('document', dataset_id),
+                cls.AVAILABLE_COUNT_CACHE_KEY.format('segment', dataset_id)
+            )
+        except Exception:
+            logging.exception('Failed to invalidate available counts of dataset %s', dataset_id)
 
     @property
     def word_count(self):
@@ -633,6 +676,21 @@ class DatasetKeywordTable(db.Model):
                 return None
 
 
+class DatasetKeywordPosting(db.Model):
+    __tablename__ = 'dataset_keyword_postings'
+    __table_args__ = (
+        db.PrimaryKeyConstraint('id', name='dataset_keyword_posting_pkey'),
+        db.UniqueConstraint('dataset_id', 'keyword', 'index_node_id', name='dataset_keyword_posting_unique_idx'),
+        db.Index('dataset_keyword_posting_node_idx', 'dataset_id', 'index_node_id'),
+    )
+
+    id = db.Column(StringUUID, primary_key=True, server_default=db.text('uuid_generate_v4()'))
+    dataset_id = db.Column(StringUUID, nullable=False)
+    keyword = db.Column(db.String(255), nullable=False)
+    index_node_id = db.Column(db.String(255), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, server_default=db.text('CURRENT_TIMESTAMP(0)'))
+
+
 class Embedding(db.Model):
     __tablename__ = 'embeddings'
     __table_args__ = (
@@ -650,11 +708,51 @@ class Embedding(db.Model):
     provider_name = db.Column(db.String(255), nullable=False,
                               server_default=db.text("''::character varying"))
 
+    # compact format: a header of magic, format version, dtype code and dimension, followed by the raw vector
+    COMPACT_MAGIC = b'DEMB'
+    COMPACT_VERSION = 1
+    COMPACT_HEADER = struct.Struct('<4sBBI')
+    COMPACT_DTYPES = {
+        'float32': (1, np.dtype('<f4')),
+        'float16': (2, np.dtype('<f2')),
+    }
+
+    @classmethod
+    def is_compact_embedding(cls, embedding_bytes: bytes) -> bool:
+        return bytes(embedding_bytes[:len(cls.COMPACT_MAGIC)]) == cls.COMPACT_MAGIC
+
+    @classmethod
+    def encode_embedding(cls, embedding_data: list[float] | np.ndarray, dtype: Optional[str] = None) -> bytes:
+        dtype = dtype or dify_config.EMBEDDING_CACHE_DTYPE
+        if dtype not in cls.COMPACT_DTYPES:
+            raise ValueError(f'Unsupported embedding dtype: {dtype}')
+        dtype_code, np_dtype = cls.COMPACT_DTYPES[dtype]
+        vector = np.asarray(embedding_data, dtype=np_dtype)
+        header = cls.COMPACT_HEADER.pack(cls.COMPACT_MAGIC, cls.COMPACT_VERSION, dtype_code, vector.shape[0])
+        return header + vector.tobytes()
+
+    @classmethod
+    def decode_embedding(cls, embedding_bytes: bytes) -> np.ndarray:
+        """
+        Decode a stored embedding. Compact rows are read zero-copy, so the returned array is read-only;
+        rows written before the compact format are still pickled lists.
+        """
+        if not cls.is_compact_embedding(embedding_bytes):
+            return np.asarray(pickle.loads(embedding_bytes), dtype=float)
+
+        _, version, dtype_code, dimension = cls.COMPACT_HEADER.unpack_from(embedding_bytes)
+        if version != cls.COMPACT_VERSION:
+            raise ValueError(f'Unsupported embedding format version: {version}')
+        np_dtype = next((np_dtype for code, np_dtype in cls.COMPACT_DTYPES.values() if code == dtype_code), None)
+        if np_dtype is None:
+            raise ValueError(f'Unsupported embedding dtype code: {dtype_code}')
+        return np.frombuffer(embedding_bytes, dtype=np_dtype, count=dimension, offset=cls.COMPACT_HEADER.size)
+
     def set_embedding(self, embedding_data: list[float]):
-        self.embedding = pickle.dumps(embedding_data, protocol=pickle.HIGHEST_PROTOCOL)
+        self.embedding = self.encode_embedding(embedding_data)
 
     def get_embedding(self) -> list[float]:
-        return pickle.loads(self.embedding)
+        return self.decode_embedding(self.embedding).tolist()
 
 
 class DatasetCollectionBinding(db.Model):
@@ -1,8 +1,9 @@
+import functools
 import json
 import re
 import uuid
 from enum import Enum
-from typing import Optional
+from typing import Any, Optional
 
 from flask import request
 from flask_login import UserMixin
@@ -19,6 +20,27 @@ from .account import Account, Tenant
 from .types import StringUUID
 
 
+def prefetchable(getter):
+    """
+    Property running its own query, unless its value was prefetched with the values of a whole page of
+    models by `set_prefetched`.
+    """
+    name = getter.__name__
+
+    @functools.wraps(getter)
+    def wrapper(self):
+        prefetched = self.__dict__.get('_prefetched')
+        if prefetched is not None and name in prefetched:
+            return prefetched[name]
+        return getter(self)
+
+    return property(wrapper)
+
+
+def set_prefetched(model: db.Model, name: str, value: Any) -> None:
+    model.__dict__.setdefault('_prefetched', {})[name] = value
+
+
 class DifySetup(db.Model):
     __tablename__ = 'dify_setups'
     __table_args__ = (
@@ -549,16 +571,17 @@ class Conversation(db.Model):
                 else:
                     model_config['configs'] = override_model_configs
             else:
-                app_model_config = db.session.query(AppModelConfig).filter(
-                    AppModelConfig.id == self.app_model_config_id).first()
-
-                model_config = app_model_config.to_dict()
+                model_config = self.app_model_config.to_dict()
 
         model_config['model_id'] = self.model_id
         model_config['provider'] = self.model_provider
 
         return model_config
 
+    @prefetchable
+    def app_model_config(self):
+        return db.session.query(AppModelConfig).filter(AppModelConfig.id == self.app_model_config_id).first()
+
     @property
     def summary_or_query(self):
         if self.summary:
@@ -570,19 +593,19 @@ class Conversation(db.Model):
             else:
                 return ''
 
-    @property
+    @prefetchable
     def annotated(self):
         return db.session.query(MessageAnnotation).filter(MessageAnnotation.conversation_id == self.id).count() > 0
 
-    @property
+    @prefetchable
     def annotation(self):
         return db.session.query(MessageAnnotation).filter(MessageAnnotation.conversation_id == self.id).first()
 
-    @property
+    @prefetchable
     def message_count(self):
         return db.session.query(Message).filter(Message.conversation_id == self.id).count()
 
-    @property
+    @prefetchable
     def user_feedback_stats(self):
         like = db.session.query(MessageFeedback) \
             .filter(MessageFeedback.conversation_id == self.id,
@@ -596,7 +619,7 @@ class Conversation(db.Model):
 
         return {'like': like, 'dislike': dislike}
 
-    @property
+    @prefetchable
     def admin_feedback_stats(self):
         like = db.session.query(MessageFeedback) \
             .filter(MessageFeedback.conversation_id == self.id,
@@ -610,7 +633,7 @@ class Conversation(db.Model):
 
         return {'like': like, 'dislike': dislike}
 
-    @property
+    @prefetchable
     def first_message(self):
         return db.session.query(Message).filter(Message.conversation_id == self.id).first()
 
@@ -618,7 +641,7 @@ class Conversation(db.Model):
     def app(self):
         return db.session.query(App).filter(App.id == self.app_id).first()
 
-    @property
+    @prefetchable
     def from_end_user_session_id(self):
         if self.from_end_user_id:
             end_user = db.session.query(EndUser).filter(EndUser.id == self.from_end_user_id).first()
@@ -627,7 +650,7 @@ class Conversation(db.Model):
 
         return None
 
-    @property
+    @prefetchable
     def from_account_name(self):
         if self.from_account_id:
             account = db.session.query(Account).filter(Account.id == self.from_account_id).first()
@@ -748,29 +771,29 @@ class Message(db.Model):
 
         return re_sign_file_url_answer
 
-    @property
+    @prefetchable
     def user_feedback(self):
         feedback = db.session.query(MessageFeedback).filter(MessageFeedback.message_id == self.id,
                                                             MessageFeedback.from_source == 'user').first()
         return feedback
 
-    @property
+    @prefetchable
     def admin_feedback(self):
         feedback = db.session.query(MessageFeedback).filter(MessageFeedback.message_id == self.id,
                                                             MessageFeedback.from_source == 'admin').first()
         return feedback
 
-    @property
+    @prefetchable
     def feedbacks(self):
         feedbacks = db.session.query(MessageFeedback).filter(MessageFeedback.message_id == self.id).all()
         return feedbacks
 
-    @property
+    @prefetchable
     def annotation(self):
         annotation = db.session.query(MessageAnnotation).filter(MessageAnnotation.message_id == self.id).first()
         return annotation
 
-    @property
+    @prefetchable
     def annotation_hit_history(self):
         annotation_history = (db.session.query(AppAnnotationHitHistory)
                               .filter(AppAnnotationHitHistory.message_id == self.id).first())
@@ -797,17 +820,17 @@ class Message(db.Model):
     def message_metadata_dict(self) -> dict:
         return json.loads(self.message_metadata) if self.message_metadata else {}
 
-    @property
+    @prefetchable
     def agent_thoughts(self):
         return db.session.query(MessageAgentThought).filter(MessageAgentThought.message_id == self.id) \
             .order_by(MessageAgentThought.position.asc()).all()
 
-    @property
+    @prefetchable
     def retriever_resources(self):
         return db.session.query(DatasetRetrieverResource).filter(DatasetRetrieverResource.message_id == self.id) \
             .order_by(DatasetRetrieverResource.position.asc()).all()
 
-    @property
+    @prefetchable
     def message_files(self):
         return db.session.query(MessageFile).filter(MessageFile.message_id == self.id).all()
 
@@ -927,7 +950,7 @@ class MessageFeedback(db.Model):
     created_at = db.Column(db.DateTime, nullable=False, server_default=db.text('CURRENT_TIMESTAMP(0)'))
     updated_at = db.Column(db.DateTime, nullable=False, server_default=db.text('CURRENT_TIMESTAMP(0)'))
 
-    @property
+    @prefetchable
     def from_account(self):
         account = db.session.query(Account).filter(Account.id == self.from_account_id).first()
         return account
@@ -973,12 +996,12 @@ class MessageAnnotation(db.Model):
     created_at = db.Column(db.DateTime, nullable=False, server_default=db.text('CURRENT_TIMESTAMP(0)'))
     updated_at = db.Column(db.DateTime, nullable=False, server_default=db.text('CURRENT_TIMESTAMP(0)'))
 
-    @property
+    @prefetchable
     def account(self):
         account = db.session.query(Account).filter(Account.id == self.account_id).first()
         return account
 
-    @property
+    @prefetchable
     def annotation_create_account(self):
         account = db.session.query(Account).filter(Account.id == self.account_id).first()
         return account
@@ -0,0 +1,22 @@
+import time
+
+import click
+from redis.exceptions import LockError
+
+import app
+from core.rag.retrieval.segment_hit_counter import SegmentHitCounter
+
+
+@app.celery.task(queue="dataset")
+def flush_segment_hit_count_task():
+    start_at = time.perf_counter()
+    try:
+        flushed = SegmentHitCounter.flush()
+    except LockError:
+        click.echo(click.style("Segment hit counts are being flushed by another worker, skip.", fg="cyan"))
+        return
+    end_at = time.perf_counter()
+    if flushed:
+        click.echo(
+            click.style("Flushed hit counts of {} segments latency: {}".format(flushed, end_at - start_at), fg="green")
+        )
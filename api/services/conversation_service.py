@@ -1,14 +1,24 @@
+from collections.abc import Sequence
 from datetime import datetime, timezone
 from typing import Optional, Union
 
-from sqlalchemy import asc, desc, or_
+from sqlalchemy import asc, desc, func, or_
 
 from core.app.entities.app_invoke_entities import InvokeFrom
 from core.llm_generator.llm_generator import LLMGenerator
 from extensions.ext_database import db
 from libs.infinite_scroll_pagination import InfiniteScrollPagination
 from models.account import Account
-from models.model import App, Conversation, EndUser, Message
+from models.model import (
+    App,
+    AppModelConfig,
+    Conversation,
+    EndUser,
+    Message,
+    MessageAnnotation,
+    MessageFeedback,
+    set_prefetched,
+)
 from services.errors.conversation import ConversationNotExistsError, LastConversationNotExistsError
 from services.errors.message import MessageNotExistsError
 
@@ -71,8 +81,113 @@ class ConversationService:
             if rest_count > 0:
                 has_more = True
 
+        cls.load_relations(conversations)
+
         return InfiniteScrollPagination(data=conversations, limit=limit, has_more=has_more)
 
+    @classmethod
+    def load_relations(cls, conversations: Sequence[Conversation]) -> None:
+        """
+        Prefetch the message counts, feedback stats, first messages, annotations, users and model configs of a
+        page of conversations, one query per relation instead of one per conversation and relation.
+        """
+        if not conversations:
+            return
+
+        conversation_ids = [conversation.id for conversation in conversations]
+
+        message_counts = dict(
+            db.session.query(Message.conversation_id, func.count(Message.id))
+            .filter(Message.conversation_id.in_(conversation_ids))
+            .group_by(Message.conversation_id)
+            .all()
+        )
+
+        feedback_stats = {}
+        for conversation_id, from_source, rating, count in (
+            db.session.query(
+                MessageFeedback.conversation_id,
+                MessageFeedback.from_source,
+                MessageFeedback.rating,
+                func.count(MessageFeedback.id),
+            )
+            .filter(MessageFeedback.conversation_id.in_(conversation_ids))
+            .group_by(MessageFeedback.conversation_id, MessageFeedback.from_source, MessageFeedback.rating)
+            .all()
+        ):
+            feedback_stats[(conversation_id, from_source, rating)] = count
+
+        first_messages = {
+            message.conversation_id: message
+            for message in db.session.query(Message)
+            .filter(Message.conversation_id.in_(conversation_ids))
+            .distinct(Message.conversation_id)
+            .order_by(Message.conversation_id, Message.created_at.asc())
+            .all()
+        }
+
+        annotations = {
+            annotation.conversation_id: annotation
+            for annotation in db.session.query(MessageAnnotation)
+            .filter(MessageAnnotation.conversation_id.in_(conversation_ids))
+            .distinct(MessageAnnotation.conversation_id)
+            .order_by(MessageAnnotation.conversation_id, MessageAnnotation.created_at.asc())
+            .all()
+        }
+
+        end_user_ids = {
+            conversation.from_end_user_id for conversation in conversations if conversation.from_end_user_id
+        }
+        end_user_session_ids = {}
+        if end_user_ids:
+            end_user_session_ids = dict(
+                db.session.query(EndUser.id, EndUser.session_id).filter(EndUser.id.in_(end_user_ids)).all()
+            )
+
+        account_ids = {conversation.from_account_id for conversation in conversations if conversation.from_account_id}
+        account_ids.update(annotation.account_id for annotation in annotations.values())
+        accounts = {}
+        if account_ids:
+            accounts = {
+                account.id: account for account in db.session.query(Account).filter(Account.id.in_(account_ids)).all()
+            }
+
+        app_model_config_ids = {
+            conversation.app_model_config_id for conversation in conversations if conversation.app_model_config_id
+        }
+        app_model_configs = {}
+        if app_model_config_ids:
+            app_model_configs = {
+                app_model_config.id: app_model_config
+                for app_model_config in db.session.query(AppModelConfig)
+                .filter(AppModelConfig.id.in_(app_model_config_ids))
+                .all()
+            }
+
+        for conversation in conversations:
+            set_prefetched(conversation, "message_count", message_counts.get(conversation.id, 0))
+            for from_source in ("user", "admin"):
+                set_prefetched(
+                    conversation,
+                    f"{from_source}_feedback_stats",
+                    {
+                        rating: feedback_stats.get((conversation.id, from_source, rating), 0)
+                        for rating in ("like", "dislike")
+                    },
+                )
+            set_prefetched(conversation, "first_message", first_messages.get(conversation.id))
+            annotation = annotations.get(conversation.id)
+            set_prefetched(conversation, "annotation", annotation)
+            set_prefetched(conversation, "annotated", annotation is not None)
+            if annotation:
+                set_prefetched(annotation, "account", accounts.get(annotation.account_id))
+            set_prefetched(
+                conversation, "from_end_user_session_id", end_user_session_ids.get(conversation.from_end_user_id)
+            )
+            from_account = accounts.get(conversation.from_account_id)
+            set_prefetched(conversation, "from_account_name", from_account.name if from_account else None)
+            set_prefetched(conversation, "app_model_config", app_model_configs.get(conversation.app_model_config_id))
+
     @classmethod
     def _get_sort_params(cls, sort_by: str) -> tuple[str, callable]:
         if sort_by.startswith("-"):
@@ -1,4 +1,6 @@
 import json
+from collections import defaultdict
+from collections.abc import Sequence
 from typing import Optional, Union
 
 from core.app.apps.advanced_chat.app_config_manager import AdvancedChatAppConfigManager
@@ -13,7 +15,20 @@ from core.ops.utils import measure_time
 from extensions.ext_database import db
 from libs.infinite_scroll_pagination import InfiniteScrollPagination
 from models.account import Account
-from models.model import App, AppMode, AppModelConfig, EndUser, Message, MessageFeedback
+from models.model import (
+    App,
+    AppAnnotationHitHistory,
+    AppMode,
+    AppModelConfig,
+    DatasetRetrieverResource,
+    EndUser,
+    Message,
+    MessageAgentThought,
+    MessageAnnotation,
+    MessageFeedback,
+    MessageFile,
+    set_prefetched,
+)
 from services.conversation_service import ConversationService
 from services.errors.conversation import ConversationCompletedError, ConversationNotExistsError
 from services.errors.message import (
@@ -92,6 +107,7 @@ class MessageService:
                 has_more = True
 
         history_messages = list(reversed(history_messages))
+        cls.load_relations(history_messages)
 
         return InfiniteScrollPagination(data=history_messages, limit=limit, has_more=has_more)
 
@@ -145,8 +161,102 @@ class MessageService:
             if rest_count > 0:
                 has_more = True
 
+        cls.load_relations(history_messages)
+
         return InfiniteScrollPagination(data=history_messages, limit=limit, has_more=has_more)
 
+    @classmethod
+    def load_relations(cls, messages: Sequence[Message]) -> None:
+        """
+        Prefetch the feedbacks, annotations, agent thoughts, retriever resources and files of a page of messages,
+        one query per relation instead of one per message and relation.
+        """
+        if not messages:
+            return
+
+        message_ids = [message.id for message in messages]
+
+        feedbacks = defaultdict(list)
+        for feedback in db.session.query(MessageFeedback).filter(MessageFeedback.message_id.in_(message_ids)).all():
+            feedbacks[feedback.message_id].append(feedback)
+
+        annotations = {}
+        for annotation in (
+            db.session.query(MessageAnnotation).filter(MessageAnnotation.message_id.in_(message_ids)).all()
+        ):
+            annotations.setdefault(annotation.message_id, annotation)
+
+        hit_annotation_ids = {}
+        for hit_history in (
+            db.session.query(AppAnnotationHitHistory).filter(AppAnnotationHitHistory.message_id.in_(message_ids)).all()
+        ):
+            hit_annotation_ids.setdefault(hit_history.message_id, hit_history.annotation_id)
+        hit_annotations = {}
+        if hit_annotation_ids:
+            hit_annotations = {
+                annotation.id: annotation
+                for annotation in db.session.query(MessageAnnotation)
+                .filter(MessageAnnotation.id.in_(set(hit_annotation_ids.values())))
+                .all()
+            }
+
+        agent_thoughts = defaultdict(list)
+        for agent_thought in (
+            db.session.query(MessageAgentThought)
+            .filter(MessageAgentThought.message_id.in_(message_ids))
+            .order_by(MessageAgentThought.position.asc())
+            .all()
+        ):
+            agent_thoughts[agent_thought.message_id].append(agent_thought)
+
+        retriever_resources = defaultdict(list)
+        for retriever_resource in (
+            db.session.query(DatasetRetrieverResource)
+            .filter(DatasetRetrieverResource.message_id.in_(message_ids))
+            .order_by(DatasetRetrieverResource.position.asc())
+            .all()
+        ):
+            retriever_resources[retriever_resource.message_id].append(retriever_resource)
+
+        message_files = defaultdict(list)
+        for message_file in db.session.query(MessageFile).filter(MessageFile.message_id.in_(message_ids)).all():
+            message_files[message_file.message_id].append(message_file)
+
+        for message in messages:
+            message_feedbacks = feedbacks[message.id]
+            set_prefetched(message, "feedbacks", message_feedbacks)
+            set_prefetched(
+                message,
+                "user_feedback",
+                next((feedback for feedback in message_feedbacks if feedback.from_source == "user"), None),
+            )
+            set_prefetched(
+                message,
+                "admin_feedback",
+                next((feedback for feedback in message_feedbacks if feedback.from_source == "admin"), None),
+            )
+            set_prefetched(message, "annotation", annotations.get(message.id))
+            set_prefetched(message, "annotation_hit_history", hit_annotations.get(hit_annotation_ids.get(message.id)))
+            set_prefetched(message, "agent_thoughts", agent_thoughts[message.id])
+            set_prefetched(message, "retriever_resources", retriever_resources[message.id])
+            set_prefetched(message, "message_files", message_files[message.id])
+
+        feedbacks = [feedback for message_feedbacks in feedbacks.values() for feedback in message_feedbacks]
+        annotations = [*annotations.values(), *hit_annotations.values()]
+        account_ids = {feedback.from_account_id for feedback in feedbacks if feedback.from_account_id}
+        account_ids.update(annotation.account_id for annotation in annotations)
+        accounts = {}
+        if account_ids:
+            accounts = {
+                account.id: account for account in db.session.query(Account).filter(Account.id.in_(account_ids)).all()
+            }
+
+        for feedback in feedbacks:
+            set_prefetched(feedback, "from_account", accounts.get(feedback.from_account_id))
+        for annotation in annotations:
+            set_prefetched(annotation, "account", accounts.get(annotation.account_id))
+            set_prefetched(annotation, "annotation_create_account", accounts.get(annotation.account_id))
+
     @classmethod
     def create_feedback(
         cls, app_model: App, message_id: str, user: Optional[Union[Account, EndUser]], rating: Optional[str]
@@ -10,8 +10,8 @@ from core.rag.index_processor.index_processor_factory import IndexProcessorFacto
 from core.rag.models.document import Document
 from extensions.ext_database import db
 from extensions.ext_redis import redis_client
+from models.dataset import Dataset, DocumentSegment
 from models.dataset import Document as DatasetDocument
-from models.dataset import DocumentSegment
 
 
 @shared_task(queue="dataset")
@@ -80,3 +80,4 @@ def add_document_to_index_task(dataset_document_id: str):
         db.session.commit()
     finally:
         redis_client.delete(indexing_cache_key)
+        Dataset.invalidate_available_counts(dataset_document.dataset_id)
@@ -5,11 +5,10 @@ import uuid
 
 import click
 from celery import shared_task
-from sqlalchemy import func
 
-from core.indexing_runner import IndexingRunner
-from core.model_manager import ModelManager
-from core.model_runtime.entities.model_entities import ModelType
+from core.rag.docstore.dataset_docstore import DatasetDocumentStore
+from core.rag.index_processor.index_processor_factory import IndexProcessorFactory
+from core.rag.models.document import Document as RAGDocument
 from extensions.ext_database import db
 from extensions.ext_redis import redis_client
 from libs import helper
@@ -47,51 +46,42 @@ def batch_create_segment_to_index_task(
 
         if not dataset_document.enabled or dataset_document.archived or dataset_document.indexing_status != "completed":
             raise ValueError("Document is not available.")
-        document_segments = []
-        embedding_model = None
-        if dataset.indexing_technique == "high_quality":
-            model_manager = ModelManager()
-            embedding_model = model_manager.get_model_instance(
-                tenant_id=dataset.tenant_id,
-                provider=dataset.embedding_model_provider,
-                model_type=ModelType.TEXT_EMBEDDING,
-                model=dataset.embedding_model,
-            )
-
+        documents = []
         for segment in content:
-            content = segment["content"]
-            doc_id = str(uuid.uuid4())
-            segment_hash = helper.generate_text_hash(content)
-            # calc embedding use tokens
-            tokens = embedding_model.get_text_embedding_num_tokens(texts=[content]) if embedding_model else 0
-            max_position = (
-                db.session.query(func.max(DocumentSegment.position))
-                .filter(DocumentSegment.document_id == dataset_document.id)
-                .scalar()
-            )
-            segment_document = DocumentSegment(
-                tenant_id=tenant_id,
-                dataset_id=dataset_id,
-                document_id=document_id,
-                index_node_id=doc_id,
-                index_node_hash=segment_hash,
-                position=max_position + 1 if max_position else 1,
-                content=content,
-                word_count=len(content),
-                tokens=tokens,
-                created_by=user_id,
-                indexing_at=datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None),
-                status="completed",
-                completed_at=datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None),
+            documents.append(
+                RAGDocument(
+                    page_content=segment["content"],
+                    metadata={
+                        "doc_id": str(uuid.uuid4()),
+                        "doc_hash": helper.generate_text_hash(segment["content"]),
+                        "document_id": document_id,
+                        "dataset_id": dataset_id,
+                    },
+                )
             )
             if dataset_document.doc_form == "qa_model":
-                segment_document.answer = segment["answer"]
-            db.session.add(segment_document)
-            document_segments.append(segment_document)
-        # add index to db
-        indexing_runner = IndexingRunner()
-        indexing_runner.batch_add_segments(document_segments, dataset)
-        db.session.commit()
+                documents[-1].metadata["answer"] = segment["answer"]
+        # add segments to db
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        doc_store = DatasetDocumentStore(dataset=dataset, user_id=user_id, document_id=document_id)
+        doc_store.add_documents(
+            documents,
+            allow_update=False,
+            segment_attributes={"enabled": True, "status": "completed", "indexing_at": now, "completed_at": now},
+        )
+        # add index, the segments are removed again when they cannot be indexed
+        try:
+            index_processor = IndexProcessorFactory(dataset.doc_form).init_index_processor()
+            index_processor.load(dataset, documents)
+        except Exception:
+            db.session.rollback()
+            db.session.query(DocumentSegment).filter(
+                DocumentSegment.dataset_id == dataset_id,
+                DocumentSegment.index_node_id.in_([document.metadata["doc_id"] for document in documents]),
+            ).delete(synchronize_session=False)
+            db.session.commit()
+            raise
+        Dataset.invalidate_available_counts(dataset_id)
         redis_client.setex(indexing_cache_key, 600, "completed")
         end_at = time.perf_counter()
         logging.info(
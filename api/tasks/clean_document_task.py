@@ -5,6 +5,7 @@ from typing import Optional
 import click
 from celery import shared_task
 
+from core.indexing_checkpoint import IndexingCheckpoint
 from core.rag.index_processor.index_processor_factory import IndexProcessorFactory
 from extensions.ext_database import db
 from extensions.ext_storage import storage
@@ -43,6 +44,7 @@ def clean_document_task(document_id: str, dataset_id: str, doc_form: str, file_i
                 db.session.delete(segment)
 
             db.session.commit()
+        IndexingCheckpoint.delete(dataset_id, document_id)
         if file_id:
             file = db.session.query(UploadFile).filter(UploadFile.id == file_id).first()
             if file:
@@ -62,3 +64,5 @@ def clean_document_task(document_id: str, dataset_id: str, doc_form: str, file_i
         )
     except Exception:
         logging.exception("Cleaned document when document deleted failed")
+    finally:
+        Dataset.invalidate_available_counts(dataset_id)
@@ -0,0 +1,29 @@
+import logging
+import time
+
+import click
+from celery import shared_task
+
+
+@shared_task(queue="dataset")
+def create_pgvector_indexes_task(collection_name: str):
+    """
+    Async create the indexes of a pgvector collection that has grown past PGVECTOR_INDEX_MIN_ROWS,
+    the indexes are built concurrently, so the indexing of the collection goes on meanwhile.
+    :param collection_name: collection name
+
+    Usage: create_pgvector_indexes_task.delay(collection_name)
+    """
+    from core.rag.datasource.vdb.pgvector.pgvector import PGVector, PGVectorFactory
+
+    logging.info(click.style("Start create pgvector indexes: {}".format(collection_name), fg="green"))
+    start_at = time.perf_counter()
+
+    vector = PGVector(collection_name, PGVectorFactory.get_config())
+    if vector.build_indexes():
+        end_at = time.perf_counter()
+        logging.info(
+            click.style(
+                "Pgvector indexes created: {} latency: {}".format(collection_name, end_at - start_at), fg="green"
+            )
+        )
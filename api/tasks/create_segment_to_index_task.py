@@ -11,7 +11,7 @@ from core.rag.index_processor.index_processor_factory import IndexProcessorFacto
 from core.rag.models.document import Document
 from extensions.ext_database import db
 from extensions.ext_redis import redis_client
-from models.dataset import DocumentSegment
+from models.dataset import Dataset, DocumentSegment
 
 
 @shared_task(queue="dataset")
@@ -93,3 +93,4 @@ def create_segment_to_index_task(segment_id: str, keywords: Optional[list[str]]
         db.session.commit()
     finally:
         redis_client.delete(indexing_cache_key)
+        Dataset.invalidate_available_counts(segment.dataset_id)
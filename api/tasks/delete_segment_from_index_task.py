@@ -51,3 +51,4 @@ def delete_segment_from_index_task(segment_id: str, index_node_id: str, dataset_
         logging.exception("delete segment from index failed")
     finally:
         redis_client.delete(indexing_cache_key)
+        Dataset.invalidate_available_counts(dataset_id)
@@ -8,7 +8,7 @@ from werkzeug.exceptions import NotFound
 from core.rag.index_processor.index_processor_factory import IndexProcessorFactory
 from extensions.ext_database import db
 from extensions.ext_redis import redis_client
-from models.dataset import DocumentSegment
+from models.dataset import Dataset, DocumentSegment
 
 
 @shared_task(queue="dataset")
@@ -62,3 +62,4 @@ def disable_segment_from_index_task(segment_id: str):
         db.session.commit()
     finally:
         redis_client.delete(indexing_cache_key)
+        Dataset.invalidate_available_counts(segment.dataset_id)
@@ -6,6 +6,7 @@ import click
 from celery import shared_task
 from werkzeug.exceptions import NotFound
 
+from core.indexing_checkpoint import IndexingCheckpoint
 from core.indexing_runner import DocumentIsPausedException, IndexingRunner
 from core.rag.extractor.notion_extractor import NotionExtractor
 from core.rag.index_processor.index_processor_factory import IndexProcessorFactory
@@ -87,6 +88,9 @@ def document_indexing_sync_task(dataset_id: str, document_id: str):
                 for segment in segments:
                     db.session.delete(segment)
 
+                # the page content changed, its extracted text is stale
+                IndexingCheckpoint.delete(dataset_id, document_id)
+
                 end_at = time.perf_counter()
                 logging.info(
                     click.style(
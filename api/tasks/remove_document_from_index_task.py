@@ -8,7 +8,7 @@ from werkzeug.exceptions import NotFound
 from core.rag.index_processor.index_processor_factory import IndexProcessorFactory
 from extensions.ext_database import db
 from extensions.ext_redis import redis_client
-from models.dataset import Document, DocumentSegment
+from models.dataset import Dataset, Document, DocumentSegment
 
 
 @shared_task(queue="dataset")
@@ -60,3 +60,4 @@ def remove_document_from_index_task(document_id: str):
             db.session.commit()
     finally:
         redis_client.delete(indexing_cache_key)
+        Dataset.invalidate_available_counts(document.dataset_id)
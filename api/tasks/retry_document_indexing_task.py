@@ -5,6 +5,7 @@ import time
 import click
 from celery import shared_task
 
+from core.indexing_checkpoint import IndexingCheckpoint
 from core.indexing_runner import IndexingRunner
 from core.rag.index_processor.index_processor_factory import IndexProcessorFactory
 from extensions.ext_database import db
@@ -57,7 +58,19 @@ def retry_document_indexing_task(dataset_id: str, document_ids: list[str]):
         )
         try:
             if document:
-                # clean old data
+                indexing_runner = IndexingRunner()
+                if IndexingCheckpoint(document).is_split():
+                    # the segments are stored, only the ones not in the vector store yet are indexed
+                    document.indexing_status = "indexing"
+                    document.processing_started_at = datetime.datetime.utcnow()
+                    db.session.add(document)
+                    db.session.commit()
+
+                    indexing_runner.run_in_indexing_status(document)
+                    redis_client.delete(retry_indexing_cache_key)
+                    continue
+
+                # clean old data, an extracted checkpoint of the document is still reused
                 index_processor = IndexProcessorFactory(document.doc_form).init_index_processor()
 
                 segments = db.session.query(DocumentSegment).filter(DocumentSegment.document_id == document_id).all()
@@ -75,7 +88,6 @@ def retry_document_indexing_task(dataset_id: str, document_ids: list[str]):
                 db.session.add(document)
                 db.session.commit()
 
-                indexing_runner = IndexingRunner()
                 indexing_runner.run([document])
                 redis_client.delete(retry_indexing_cache_key)
         except Exception as ex:
@@ -5,6 +5,7 @@ import time
 import click
 from celery import shared_task
 
+from core.indexing_checkpoint import IndexingCheckpoint
 from core.indexing_runner import IndexingRunner
 from core.rag.index_processor.index_processor_factory import IndexProcessorFactory
 from extensions.ext_database import db
@@ -67,6 +68,9 @@ def sync_website_document_indexing_task(dataset_id: str, document_id: str):
                     db.session.delete(segment)
                 db.session.commit()
 
+            # the page is crawled again, its extracted text is stale
+            IndexingCheckpoint.delete(dataset_id, document_id)
+
             document.indexing_status = "parsing"
             document.processing_started_at = datetime.datetime.utcnow()
             db.session.add(document)
@@ -0,0 +1,126 @@
+"""
+Recall and latency of the pgvector ANN indexes against an exact scan.
+
+Loads N random vectors into a collection, takes the top-k of an exact scan as the truth, then builds the HNSW
+and the IVFFlat index in turn and searches with several `ef_search` and `probes` values. Needs the pgvector
+database of the other pgvector tests, run it with the row counts to load:
+
+    PGVECTOR_BENCHMARK_ROWS=100000,1000000 pytest -s tests/integration_tests/vdb/pgvector/test_pgvector_recall_benchmark.py
+
+Random vectors have no cluster structure, so the recall is lower than with real embeddings at the same settings.
+"""
+
+import os
+import time
+import uuid
+
+import numpy as np
+import pytest
+
+from core.rag.datasource.vdb.pgvector.pgvector import PGVector, PGVectorConfig
+from core.rag.models.document import Document
+from models.dataset import Dataset
+from tests.integration_tests.vdb.test_vector_store import setup_mock_redis
+
+BENCHMARK_ROWS = [int(rows) for rows in os.environ.get("PGVECTOR_BENCHMARK_ROWS", "").split(",") if rows]
+DIMENSION = int(os.environ.get("PGVECTOR_BENCHMARK_DIMENSION", 128))
+QUERIES = 100
+TOP_K = 10
+INSERT_BATCH_SIZE = 5000
+HNSW_EF_SEARCH = [10, 40, 100, 200]
+IVFFLAT_PROBES = [1, 10, 40, 100]
+
+
+def _config(index_type: str) -> PGVectorConfig:
+    return PGVectorConfig(
+        host="localhost",
+        port=5433,
+        user="postgres",
+        password="difyai123456",
+        database="dify",
+        index_type=index_type,
+    )
+
+
+def _random_vectors(rng: np.random.Generator, count: int) -> np.ndarray:
+    vectors = rng.standard_normal((count, DIMENSION))
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _load(vector: PGVector, rng: np.random.Generator, rows: int) -> float:
+    start_at = time.perf_counter()
+    vector._create_collection(DIMENSION)
+    for offset in range(0, rows, INSERT_BATCH_SIZE):
+        embeddings = _random_vectors(rng, min(INSERT_BATCH_SIZE, rows - offset))
+        documents = [
+            Document(page_content=f"chunk {offset + i}", metadata={"doc_id": str(uuid.uuid4())})
+            for i in range(len(embeddings))
+        ]
+        vector.add_texts(documents, embeddings.tolist())
+    with vector._get_cursor() as cur:
+        cur.execute(f"ANALYZE {vector.table_name}")
+    return time.perf_counter() - start_at
+
+
+def _search(vector: PGVector, queries: np.ndarray, **kwargs) -> tuple[list[set[str]], list[float]]:
+    results = []
+    latencies = []
+    for query in queries:
+        start_at = time.perf_counter()
+        documents = vector.search_by_vector(query.tolist(), top_k=TOP_K, score_threshold=-1.0, **kwargs)
+        latencies.append(time.perf_counter() - start_at)
+        results.append({document.metadata["doc_id"] for document in documents})
+    return results, latencies
+
+
+def _report(name: str, truth: list[set[str]], results: list[set[str]], latencies: list[float]) -> float:
+    recall = float(np.mean([len(result & expected) / TOP_K for result, expected in zip(results, truth)]))
+    print(
+        f"{name:<24} recall@{TOP_K} {recall:6.3f}   "
+        f"p50 {np.percentile(latencies, 50) * 1000:8.2f} ms   p95 {np.percentile(latencies, 95) * 1000:8.2f} ms"
+    )
+    return recall
+
+
+def _build(vector: PGVector) -> float:
+    start_at = time.perf_counter()
+    vector.create_indexes()
+    return time.perf_counter() - start_at
+
+
+@pytest.mark.skipif(not BENCHMARK_ROWS, reason="set PGVECTOR_BENCHMARK_ROWS to the row counts to benchmark")
+@pytest.mark.parametrize("rows", BENCHMARK_ROWS)
+def test_pgvector_index_recall_and_latency(setup_mock_redis, capsys, rows):
+    rng = np.random.default_rng(rows)
+    collection_name = Dataset.gen_collection_name_by_id(str(uuid.uuid4())) + "_benchmark"
+    exact = PGVector(collection_name, _config("none"))
+    hnsw = PGVector(collection_name, _config("hnsw"))
+    ivfflat = PGVector(collection_name, _config("ivfflat"))
+    queries = _random_vectors(rng, QUERIES)
+
+    try:
+        with capsys.disabled():
+            print(f"\npgvector, {rows} rows of {DIMENSION} dimensions, {QUERIES} queries")
+            print(f"load {_load(exact, rng, rows):.1f} s")
+
+            truth, latencies = _search(exact, queries)
+            assert _report("exact scan", truth, truth, latencies) == 1.0
+
+            print(f"hnsw build, with the full text index {_build(hnsw):.1f} s")
+            recalls = []
+            for ef_search in HNSW_EF_SEARCH:
+                results, latencies = _search(hnsw, queries, ef_search=ef_search)
+                recalls.append(_report(f"hnsw ef_search={ef_search}", truth, results, latencies))
+            assert recalls[-1] >= recalls[0]
+            with hnsw._get_autocommit_cursor() as cur:
+                cur.execute(f"DROP INDEX IF EXISTS {hnsw._index_name('hnsw')}")
+
+            print(f"ivfflat build {_build(ivfflat):.1f} s")
+            recalls = []
+            for probes in IVFFLAT_PROBES:
+                results, latencies = _search(ivfflat, queries, probes=probes)
+                recalls.append(_report(f"ivfflat probes={probes}", truth, results, latencies))
+            assert recalls[-1] >= recalls[0]
+    finally:
+        with exact._get_cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {exact.table_name}")
@@ -0,0 +1,170 @@
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+from flask import Flask
+from sqlalchemy.orm import configure_mappers
+
+from core.agent import fc_agent_runner
+from core.agent.fc_agent_runner import FunctionCallAgentRunner
+from core.tools.entities.tool_entities import ToolInvokeMeta
+from core.tools.tool.tool import Tool
+
+
+class FakeTool:
+    def __init__(self, name, delay=0.0, parallel_safe=True, message_files=None, forked_from=None):
+        self.name = name
+        self.delay = delay
+        self.parallel_safe = parallel_safe
+        self.message_files = message_files or []
+        self.forked_from = forked_from
+        self.runtime = Tool.Runtime(tenant_id="tenant-1")
+        self.variables = None
+
+    def is_parallel_safe(self):
+        return self.parallel_safe
+
+    def fork_tool_runtime(self, runtime):
+        tool = FakeTool(self.name, self.delay, self.parallel_safe, self.message_files, forked_from=self)
+        tool.runtime = Tool.Runtime(**runtime)
+        return tool
+
+    def load_variables(self, variables):
+        self.variables = variables
+
+
+def _agent_invoke(tool, tool_parameters, message, **kwargs):
+    time.sleep(tool.delay)
+    return f"{tool.name}: {tool_parameters['query']}", tool.message_files, ToolInvokeMeta.empty()
+
+
+@pytest.fixture
+def runner():
+    config = SimpleNamespace(
+        AGENT_PARALLEL_TOOL_CALLS_ENABLED=True, AGENT_PARALLEL_TOOL_CALLS_MAX_WORKERS=5, AGENT_TOOL_CALL_TIMEOUT=0
+    )
+    runner = FunctionCallAgentRunner.__new__(FunctionCallAgentRunner)
+    runner.message = SimpleNamespace(id="message-1", conversation_id="conversation-1")
+    runner.user_id = "user-1"
+    runner.tenant_id = "tenant-1"
+    runner.application_generate_entity = SimpleNamespace(invoke_from=None)
+    runner.agent_callback = MagicMock()
+    # the first model instance of the process configures the mappers, keep it out of the measured time
+    configure_mappers()
+    with (
+        Flask(__name__).app_context(),
+        patch.object(fc_agent_runner, "dify_config", config),
+        patch.object(fc_agent_runner.ToolEngine, "agent_invoke", side_effect=_agent_invoke),
+    ):
+        yield runner, config
+
+
+def _results(runner, tool_instances, tool_calls):
+    return [result[0] if result else None for result in runner._invoke_tools(tool_instances, tool_calls)]
+
+
+def _calls(*names):
+    return [(f"call-{i}", name, {"query": str(i)}) for i, name in enumerate(names)]
+
+
+def test_tool_calls_of_a_turn_run_concurrently_in_order(runner):
+    runner, _ = runner
+    tools = {"search": FakeTool("search", delay=0.3), "http": FakeTool("http", delay=0.1)}
+
+    started_at = time.monotonic()
+    results = _results(runner, tools, _calls("search", "http", "unknown", "search"))
+
+    assert time.monotonic() - started_at < 0.6
+    assert results == ["search: 0", "http: 1", None, "search: 3"]
+
+
+def test_unsafe_tools_run_in_caller_thread_after_earlier_results(runner):
+    runner, _ = runner
+    threads = []
+
+    def agent_invoke(tool, **kwargs):
+        threads.append((tool.name, threading.current_thread() is threading.main_thread()))
+        return _agent_invoke(tool, **kwargs)
+
+    tools = {"search": FakeTool("search", delay=0.1), "image": FakeTool("image", parallel_safe=False)}
+    with patch.object(fc_agent_runner.ToolEngine, "agent_invoke", side_effect=agent_invoke):
+        results = runner._invoke_tools(tools, _calls("search", "image", "search"))
+        assert next(results)[0] == "search: 0"
+        assert ("image", True) not in threads
+        assert next(results)[0] == "image: 1"
+        assert next(results)[0] == "search: 2"
+
+    assert sorted(threads) == [("image", True), ("search", False), ("search", False)]
+
+
+def test_tool_call_exceeding_timeout_is_answered_with_error(runner):
+    runner, config = runner
+    config.AGENT_TOOL_CALL_TIMEOUT = 0.2
+    tools = {"slow": FakeTool("slow", delay=1), "fast": FakeTool("fast")}
+
+    results = list(runner._invoke_tools(tools, _calls("slow", "fast")))
+
+    response, message_files, meta = results[0]
+    assert response == "tool invoke error: tool call did not finish within 0.2 seconds"
+    assert message_files == []
+    assert meta.error == response
+    assert results[1][0] == "fast: 1"
+
+
+def test_parallel_calls_of_the_same_tool_run_on_their_own_forks(runner):
+    runner, _ = runner
+    variables = object()
+    search = FakeTool("search", delay=0.1)
+    search.load_variables(variables)
+    invoked = []
+
+    def agent_invoke(tool, **kwargs):
+        invoked.append(tool)
+        return _agent_invoke(tool, **kwargs)
+
+    with patch.object(fc_agent_runner.ToolEngine, "agent_invoke", side_effect=agent_invoke):
+        results = _results(runner, {"search": search}, _calls("search", "search"))
+
+    assert results == ["search: 0", "search: 1"]
+    assert len({id(tool) for tool in invoked}) == 2
+    assert all(tool.forked_from is search for tool in invoked)
+    assert all(tool.runtime.tenant_id == "tenant-1" and tool.variables is variables for tool in invoked)
+
+
+def test_message_files_of_a_timed_out_call_are_deleted(runner):
+    runner, config = runner
+    config.AGENT_TOOL_CALL_TIMEOUT = 0.1
+    db = MagicMock()
+    tools = {
+        "slow": FakeTool("slow", delay=0.3, message_files=[("file-1", "image")]),
+        "fast": FakeTool("fast", message_files=[("file-2", "image")]),
+    }
+
+    with patch.object(fc_agent_runner, "db", db):
+        results = list(runner._invoke_tools(tools, _calls("slow", "fast")))
+        assert results[0][1] == []
+        assert results[1][1] == [("file-2", "image")]
+        db.session.query.assert_not_called()
+
+        # the slow call finishes after the turn went on without it
+        time.sleep(0.4)
+
+    db.session.query.assert_called_once_with(fc_agent_runner.MessageFile)
+    criterion = db.session.query.return_value.filter.call_args.args[0]
+    assert criterion.right.value == ["file-1"]
+    db.session.query.return_value.filter.return_value.delete.assert_called_once()
+    db.session.commit.assert_called_once()
+
+
+def test_tool_calls_run_one_by_one_when_disabled(runner):
+    runner, config = runner
+    config.AGENT_PARALLEL_TOOL_CALLS_ENABLED = False
+    tools = {"search": FakeTool("search", delay=0.2)}
+
+    started_at = time.monotonic()
+    results = _results(runner, tools, _calls("search", "search"))
+
+    assert time.monotonic() - started_at >= 0.4
+    assert results == ["search: 0", "search: 1"]
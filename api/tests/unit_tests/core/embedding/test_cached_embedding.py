@@ -0,0 +1,221 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+from core.embedding.cached_embedding import EMBEDDING_CACHE_QUERY_BATCH_SIZE, CacheEmbedding, RedisTTLRefresher
+from core.helper.lru_cache import LRUCache
+from core.model_runtime.entities.model_entities import ModelPropertyKey
+from libs import helper
+from models.dataset import Embedding
+
+DIMENSION = 8
+
+
+class CountingSession:
+    """
+    In-memory stand-in for `db.session` that counts database round trips.
+    """
+
+    def __init__(self, cache: dict[str, bytes]):
+        self.cache = cache
+        self.round_trips = 0
+
+    def query(self, *entities):
+        return CountingQuery(self)
+
+    def execute(self, stmt):
+        self.round_trips += 1
+
+    def add(self, instance):
+        # flushed with the commit
+        pass
+
+    def commit(self):
+        self.round_trips += 1
+
+    def rollback(self):
+        pass
+
+
+class CountingQuery:
+    def __init__(self, session: CountingSession):
+        self._session = session
+        self._hashes = []
+
+    def filter(self, *criteria):
+        for criterion in criteria:
+            value = getattr(criterion.right, "value", None)
+            if isinstance(value, list):
+                self._hashes = value
+        return self
+
+    def filter_by(self, **kwargs):
+        self._hashes = [kwargs["hash"]]
+        return self
+
+    def all(self):
+        self._session.round_trips += 1
+        return [(h, self._session.cache[h]) for h in self._hashes if h in self._session.cache]
+
+    def first(self):
+        rows = self.all()
+        return Embedding(hash=rows[0][0], embedding=rows[0][1]) if rows else None
+
+
+def _model_instance():
+    model_instance = MagicMock()
+    model_instance.model = "text-embedding-test"
+    model_instance.provider = "test"
+    model_schema = MagicMock()
+    model_schema.model_properties = {ModelPropertyKey.MAX_CHUNKS: 32}
+    model_instance.model_type_instance.get_model_schema.return_value = model_schema
+    model_instance.invoke_text_embedding.side_effect = lambda texts, user=None: SimpleNamespace(
+        embeddings=np.random.rand(len(texts), DIMENSION).tolist()
+    )
+    return model_instance
+
+
+def _warm_cache(texts: list[str]) -> dict[str, bytes]:
+    vector = (np.ones(DIMENSION) / np.sqrt(DIMENSION)).tolist()
+    return {helper.generate_text_hash(text): Embedding.encode_embedding(vector) for text in texts}
+
+
+def test_embed_documents_keeps_input_order_and_dedupes():
+    texts = ["cached", "new", "new", "cached"]
+    session = CountingSession(_warm_cache(["cached"]))
+    model_instance = _model_instance()
+
+    with patch("core.embedding.cached_embedding.db", SimpleNamespace(session=session)):
+        embeddings = CacheEmbedding(model_instance).embed_documents(texts)
+
+    assert len(embeddings) == 4
+    assert embeddings[0] == embeddings[3]
+    assert embeddings[1] == embeddings[2]
+    assert np.isclose(np.linalg.norm(embeddings[1]), 1.0)
+    # the duplicated miss is only sent to the model once
+    model_instance.invoke_text_embedding.assert_called_once_with(texts=["new"], user=None)
+    # one lookup, one upsert, one commit
+    assert session.round_trips == 3
+
+
+def test_embed_documents_does_not_cache_embeddings_without_norm():
+    session = CountingSession({})
+    model_instance = _model_instance()
+    model_instance.invoke_text_embedding.side_effect = lambda texts, user=None: SimpleNamespace(
+        embeddings=[[0.0] * DIMENSION, [3.0, 4.0] + [0.0] * (DIMENSION - 2)]
+    )
+
+    with (
+        patch("core.embedding.cached_embedding.db", SimpleNamespace(session=session)),
+        patch.object(CacheEmbedding, "_store_embeddings") as store_embeddings,
+    ):
+        embeddings = CacheEmbedding(model_instance).embed_documents(["empty", "text"])
+
+    assert embeddings[0] == [0.0] * DIMENSION
+    assert embeddings[1][:2] == [0.6, 0.8]
+    assert list(store_embeddings.call_args.args[0]) == [helper.generate_text_hash("text")]
+
+
+def _per_row_embed_documents(session: CountingSession, model_instance, texts: list[str]) -> list[list[float]]:
+    """
+    The cache lookup of embed_documents before it was batched: one query per text, new rows committed together.
+    """
+    text_embeddings = [None] * len(texts)
+    embedding_queue_indices = []
+    for i, text in enumerate(texts):
+        embedding = (
+            session.query(Embedding)
+            .filter_by(
+                model_name=model_instance.model,
+                hash=helper.generate_text_hash(text),
+                provider_name=model_instance.provider,
+            )
+            .first()
+        )
+        if embedding:
+            text_embeddings[i] = embedding.get_embedding()
+        else:
+            embedding_queue_indices.append(i)
+
+    max_chunks = 32
+    for i in range(0, len(embedding_queue_indices), max_chunks):
+        batch_indices = embedding_queue_indices[i : i + max_chunks]
+        embedding_result = model_instance.invoke_text_embedding(texts=[texts[index] for index in batch_indices])
+        for index, vector in zip(batch_indices, embedding_result.embeddings):
+            normalized_embedding = (vector / np.linalg.norm(vector)).tolist()
+            text_embeddings[index] = normalized_embedding
+            embedding_cache = Embedding(
+                model_name=model_instance.model,
+                hash=helper.generate_text_hash(texts[index]),
+                provider_name=model_instance.provider,
+            )
+            embedding_cache.set_embedding(normalized_embedding)
+            session.add(embedding_cache)
+    session.commit()
+    return text_embeddings
+
+
+@pytest.mark.parametrize("implementation", ["batched", "per_row"])
+@pytest.mark.parametrize("num_chunks", [1_000, 10_000])
+def test_embed_documents_lookup_benchmark(benchmark, num_chunks, implementation):
+    texts = [f"chunk {i}" for i in range(num_chunks)]
+    cache = _warm_cache(texts[: num_chunks // 2])
+    model_instance = _model_instance()
+    sessions = []
+
+    def setup():
+        session = CountingSession(dict(cache))
+        sessions.append(session)
+        return (session,), {}
+
+    def embed_documents(session):
+        if implementation == "per_row":
+            return _per_row_embed_documents(session, model_instance, texts)
+        with patch("core.embedding.cached_embedding.db", SimpleNamespace(session=session)):
+            return CacheEmbedding(model_instance).embed_documents(texts)
+
+    # both implementations of a size are reported side by side
+    benchmark.group = f"embed_documents {num_chunks} chunks"
+    embeddings = benchmark.pedantic(embed_documents, setup=setup, rounds=3)
+    benchmark.extra_info["round_trips"] = sessions[-1].round_trips
+
+    assert len(embeddings) == num_chunks
+    if implementation == "per_row":
+        # one lookup per chunk and one commit
+        assert sessions[-1].round_trips == num_chunks + 1
+    else:
+        batches = -(-num_chunks // EMBEDDING_CACHE_QUERY_BATCH_SIZE)
+        misses = num_chunks - num_chunks // 2
+        # one lookup per batch of hashes, one insert per batch of misses and one commit
+        assert sessions[-1].round_trips == batches + -(-misses // EMBEDDING_CACHE_QUERY_BATCH_SIZE) + 1
+
+
+def test_embed_query_served_from_local_cache():
+    redis = MagicMock()
+    redis.get.return_value = None
+    model_instance = _model_instance()
+
+    with (
+        patch("core.embedding.cached_embedding.redis_client", redis),
+        patch(
+            "core.embedding.cached_embedding.dify_config",
+            SimpleNamespace(QUERY_EMBEDDING_LOCAL_CACHE_ENABLED=True),
+        ),
+        patch("core.embedding.cached_embedding.query_embedding_cache", LRUCache(capacity=10)),
+        patch(
+            "core.embedding.cached_embedding.query_embedding_ttl_refresher",
+            RedisTTLRefresher(ttl=600, batch_size=2),
+        ),
+    ):
+        cache_embedding = CacheEmbedding(model_instance)
+        first = [cache_embedding.embed_query(query) for query in ("what is dify", "how to deploy")]
+        second = [cache_embedding.embed_query(query) for query in ("what is dify", "how to deploy")]
+
+    assert first == second
+    assert model_instance.invoke_text_embedding.call_count == 2
+    assert redis.get.call_count == 2
+    # the two local hits refresh the redis ttl together in one pipeline
+    redis.pipeline.return_value.execute.assert_called_once()
+    assert redis.pipeline.return_value.expire.call_count == 2
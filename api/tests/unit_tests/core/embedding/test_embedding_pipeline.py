@@ -0,0 +1,119 @@
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+from flask import Flask
+
+from core.embedding import embedding_pipeline
+from core.embedding.embedding_pipeline import EmbeddingPipeline, ProviderThrottle
+from core.model_runtime.entities.model_entities import ModelPropertyKey
+from core.model_runtime.errors.invoke import InvokeRateLimitError
+from core.rag.models.document import Document
+
+
+@pytest.fixture(autouse=True)
+def pipeline_config():
+    config = SimpleNamespace(INDEXING_EMBEDDING_MAX_IN_FLIGHT=4, INDEXING_EMBEDDING_RATE_LIMIT_MAX_RETRIES=2)
+    with (
+        patch.object(embedding_pipeline, "dify_config", config),
+        patch.object(embedding_pipeline, "_provider_throttles", {}),
+    ):
+        yield config
+
+
+def _model_instance(max_chunks=4, context_size=100):
+    model_instance = MagicMock()
+    model_instance.provider = "openai"
+    model_instance.model_type_instance.get_model_schema.return_value = SimpleNamespace(
+        model_properties={ModelPropertyKey.MAX_CHUNKS: max_chunks, ModelPropertyKey.CONTEXT_SIZE: context_size}
+    )
+    return model_instance
+
+
+def _documents(count, length=10):
+    return [Document(page_content=str(i).rjust(length, "x"), metadata={"doc_id": str(i)}) for i in range(count)]
+
+
+def _pipeline(model_instance, embed, write):
+    return EmbeddingPipeline(Flask(__name__), model_instance, embed=embed, write=write)
+
+
+def test_batches_follow_max_chunks_and_context_size():
+    pipeline = _pipeline(_model_instance(max_chunks=4, context_size=10), embed=None, write=None)
+
+    assert [len(batch) for batch in pipeline.split_batches(_documents(10, length=5))] == [4, 4, 2]
+    # four texts of 15 characters exceed the 40 characters of four full contexts
+    assert [len(batch) for batch in pipeline.split_batches(_documents(5, length=15))] == [2, 2, 1]
+
+
+def test_run_writes_every_batch_while_embedding_ahead():
+    written = []
+    embedding_threads = set()
+
+    def embed(batch):
+        embedding_threads.add(threading.current_thread().name)
+        time.sleep(0.01)
+        return [[float(document.metadata["doc_id"])] for document in batch]
+
+    def write(batch, embeddings):
+        assert threading.current_thread() is threading.main_thread()
+        written.extend(zip((document.metadata["doc_id"] for document in batch), embeddings))
+
+    _pipeline(_model_instance(), embed, write).run(_documents(50))
+
+    assert sorted(written, key=lambda item: int(item[0])) == [(str(i), [float(i)]) for i in range(50)]
+    assert len(embedding_threads) > 1
+
+
+def test_rate_limited_batches_back_off_and_retry():
+    calls = []
+
+    def embed(batch):
+        calls.append(len(batch))
+        if len(calls) == 1:
+            raise InvokeRateLimitError("429")
+        return [[0.0]] * len(batch)
+
+    written = []
+    with patch.object(embedding_pipeline, "RATE_LIMIT_BACKOFF", 0.01):
+        _pipeline(_model_instance(), embed, lambda batch, embeddings: written.extend(batch)).run(_documents(3))
+
+    assert calls == [3, 3]
+    assert len(written) == 3
+
+
+def test_rate_limit_is_raised_after_max_retries():
+    def embed(batch):
+        raise InvokeRateLimitError("429")
+
+    with patch.object(embedding_pipeline, "RATE_LIMIT_BACKOFF", 0.001), pytest.raises(InvokeRateLimitError):
+        _pipeline(_model_instance(), embed, lambda batch, embeddings: None).run(_documents(3))
+
+
+def test_provider_throttle_bounds_requests_in_flight():
+    throttle = ProviderThrottle(max_in_flight=2)
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+
+    def request():
+        throttle.acquire()
+        try:
+            with lock:
+                in_flight.append(1)
+                peak.append(len(in_flight))
+            time.sleep(0.01)
+            with lock:
+                in_flight.pop()
+        finally:
+            throttle.release()
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(peak) <= 2
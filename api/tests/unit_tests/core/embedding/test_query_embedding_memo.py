@@ -0,0 +1,56 @@
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+from core.embedding.query_embedding_memo import QueryEmbeddingMemo, get_query_embedding_memo, query_embedding_scope
+from core.rag.retrieval.retrieval_executor import RetrievalExecutor
+
+
+def test_concurrent_lookups_embed_once():
+    memo = QueryEmbeddingMemo()
+    calls = []
+
+    def embed():
+        calls.append(1)
+        time.sleep(0.05)
+        return [0.6, 0.8]
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(memo.get_or_embed("openai_model_hash", embed))) for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [[0.6, 0.8]] * 8
+
+
+def test_failures_are_not_memoized():
+    memo = QueryEmbeddingMemo()
+
+    def fail():
+        raise ValueError("provider unavailable")
+
+    with pytest.raises(ValueError):
+        memo.get_or_embed("key", fail)
+
+    assert memo.get_or_embed("key", lambda: [1.0]) == [1.0]
+
+
+def test_scope_is_shared_with_nested_scopes_and_executor_tasks():
+    assert get_query_embedding_memo() is None
+
+    with query_embedding_scope() as memo:
+        with query_embedding_scope() as nested:
+            assert nested is memo
+
+        executor = RetrievalExecutor(max_workers=2, thread_name_prefix="test_memo")
+        results, _ = executor.run(Flask(__name__), [get_query_embedding_memo, get_query_embedding_memo])
+        assert results == [memo, memo]
+
+    assert get_query_embedding_memo() is None
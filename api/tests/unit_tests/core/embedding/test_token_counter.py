@@ -0,0 +1,58 @@
+from unittest.mock import MagicMock
+
+from core.embedding.token_counter import EmbeddingTokenCounter
+from core.rag.models.document import Document
+from core.rag.splitter.fixed_text_splitter import FixedRecursiveCharacterTextSplitter
+
+
+def _model_instance():
+    model_instance = MagicMock()
+    model_instance.model = "text-embedding-3-small"
+    model_instance.get_text_embedding_num_tokens.side_effect = lambda texts: sum(len(text.split()) for text in texts)
+    return model_instance
+
+
+def test_counts_are_memoized_by_text():
+    model_instance = _model_instance()
+    counter = EmbeddingTokenCounter(model_instance)
+
+    assert counter.count("one two three") == 3
+    assert counter.count("one two three") == 3
+    assert counter.count("") == 0
+    assert model_instance.get_text_embedding_num_tokens.call_count == 1
+
+
+def test_count_documents_uses_memoized_counts_without_touching_metadata():
+    model_instance = _model_instance()
+    counter = EmbeddingTokenCounter(model_instance)
+    counter.set_count("one two", 5)
+    documents = [
+        Document(page_content="one two", metadata={"doc_id": "node-1"}),
+        Document(page_content="one two three", metadata={"doc_id": "node-2"}),
+    ]
+
+    assert counter.count_documents(documents) == 8
+    # the counts are not persisted with the vectors
+    assert [document.metadata for document in documents] == [{"doc_id": "node-1"}, {"doc_id": "node-2"}]
+    model_instance.get_text_embedding_num_tokens.assert_called_once_with(texts=["one two three"])
+
+
+def test_splitter_and_chunks_share_the_counter():
+    model_instance = _model_instance()
+    counter = EmbeddingTokenCounter(model_instance)
+    splitter = FixedRecursiveCharacterTextSplitter.from_encoder(
+        embedding_model_instance=model_instance,
+        token_counter=counter,
+        chunk_size=50,
+        chunk_overlap=0,
+        fixed_separator="\n\n",
+        separators=["\n\n", "\n", " ", ""],
+    )
+    text = "\n\n".join(" ".join(f"word{i}" for i in range(j, j + 30)) for j in range(0, 300, 30))
+
+    documents = splitter.split_documents([Document(page_content=text, metadata={})])
+    calls = model_instance.get_text_embedding_num_tokens.call_count
+
+    # every chunk was measured while splitting, indexing does not tokenize it again
+    assert counter.count_documents(documents) == 30 * len(documents)
+    assert model_instance.get_text_embedding_num_tokens.call_count == calls
@@ -0,0 +1,44 @@
+from unittest.mock import patch
+
+from core.helper.lru_cache import LRUCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(capacity=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats() == {"size": 2, "bytes": 0, "hits": 3, "misses": 1}
+
+
+def test_lru_cache_bounded_by_bytes():
+    cache = LRUCache(capacity=100, max_bytes=10, sizeof=len)
+    cache.put("a", "xxxx")
+    cache.put("b", "xxxx")
+    cache.put("c", "xxxx")
+
+    assert cache.get("a") is None
+    assert len(cache) == 2
+    assert cache.current_bytes == 8
+
+    # values larger than the whole cache are not stored
+    cache.put("d", "x" * 11)
+    assert cache.get("d") is None
+    assert len(cache) == 2
+
+
+def test_lru_cache_ttl():
+    cache = LRUCache(capacity=10, ttl=5)
+    with patch("core.helper.lru_cache.time.monotonic", return_value=100):
+        cache.put("a", 1)
+    with patch("core.helper.lru_cache.time.monotonic", return_value=104):
+        assert cache.get("a") == 1
+    with patch("core.helper.lru_cache.time.monotonic", return_value=106):
+        assert cache.get("a") is None
+    assert len(cache) == 0
@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from core.rag.datasource.keyword.jieba.jieba import Jieba
+from core.rag.datasource.keyword.keyword_scorer import bm25_idf, bm25_keyword_weights
+
+KEYWORD_TABLE = {
+    "dify": {"node-1", "node-2", "node-3", "node-4"},
+    "workflow": {"node-1"},
+    "agent": {"node-1", "node-2"},
+    "knowledge": {"node-4"},
+}
+
+
+def test_bm25_idf_prefers_rare_keywords():
+    assert bm25_idf(100, 1) > bm25_idf(100, 50) > bm25_idf(100, 100) > 0
+
+
+def test_bm25_keyword_weights_are_normalized():
+    weights = bm25_keyword_weights({"dify", "workflow", "unknown"}, {"dify": 4, "workflow": 1}, 4)
+
+    assert set(weights) == {"dify", "workflow"}
+    assert sum(weights.values()) == pytest.approx(1.0)
+    assert weights["workflow"] > weights["dify"]
+
+
+@patch(
+    "core.rag.datasource.keyword.jieba.jieba.JiebaKeywordTableHandler.extract_keywords",
+    return_value={"dify", "workflow", "agent"},
+)
+def test_retrieve_ids_by_bm25(mock_extract_keywords):
+    jieba = Jieba(dataset=SimpleNamespace(id="dataset-1", available_segment_count=4))
+
+    chunk_scores = jieba._retrieve_ids_by_bm25(KEYWORD_TABLE, "dify workflow agent", k=3)
+
+    assert [chunk_index for chunk_index, _ in chunk_scores[:2]] == ["node-1", "node-2"]
+    # node-3 and node-4 only match the most common keyword
+    assert chunk_scores[2][0] in {"node-3", "node-4"}
+    assert chunk_scores[0][1] == pytest.approx(1.0)
+    assert chunk_scores[0][1] > chunk_scores[1][1] > chunk_scores[2][1] > 0
+
+
+def test_get_documents_by_chunk_indices_keeps_rank_order():
+    segments = [
+        SimpleNamespace(
+            index_node_id=node_id,
+            index_node_hash=f"hash-{node_id}",
+            document_id="document-1",
+            dataset_id="dataset-1",
+            content=f"content of {node_id}",
+        )
+        for node_id in ("node-1", "node-2", "node-3")
+    ]
+    session = MagicMock()
+    session.query.return_value.filter.return_value.all.return_value = segments
+    jieba = Jieba(dataset=SimpleNamespace(id="dataset-1"))
+
+    with patch("core.rag.datasource.keyword.keyword_base.db", SimpleNamespace(session=session)):
+        documents = jieba._get_documents_by_chunk_indices([("node-3", 0.9), ("node-missing", 0.5), ("node-1", 0.2)])
+
+    session.query.assert_called_once()
+    assert [document.metadata["doc_id"] for document in documents] == ["node-3", "node-1"]
+    assert [document.metadata["keyword_score"] for document in documents] == [0.9, 0.2]
+    # rerankers take "score" as the vector similarity of a document
+    assert all("score" not in document.metadata for document in documents)
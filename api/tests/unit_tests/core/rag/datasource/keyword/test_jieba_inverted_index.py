@@ -0,0 +1,247 @@
+import logging
+from collections import Counter, namedtuple
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql import operators
+
+import commands
+from core.rag.datasource.keyword.jieba import jieba_inverted_index
+from core.rag.datasource.keyword.jieba.jieba_inverted_index import MAX_KEYWORD_LENGTH, JiebaInvertedIndex
+from core.rag.models.document import Document
+from models.dataset import Dataset, DatasetKeywordPosting, DatasetKeywordTable, DocumentSegment
+
+
+def _matches(row, criterion):
+    value = getattr(row, criterion.left.key)
+    if criterion.operator is operators.eq:
+        return value == criterion.right.value
+    if criterion.operator is operators.in_op:
+        return value in criterion.right.value
+    if criterion.operator is operators.gt:
+        return value > criterion.right.value
+    raise NotImplementedError(criterion.operator)
+
+
+class FakeQuery:
+    """Evaluates the equality and IN filters of a query against the rows of a FakeSession."""
+
+    def __init__(self, session, entities):
+        self.session = session
+        self.entities = entities
+        self.model = entities[0] if isinstance(entities[0], type) else entities[0].class_
+        self.criteria = []
+        self.max_rows = None
+
+    def filter(self, *criteria):
+        self.criteria.extend(criteria)
+        return self
+
+    def group_by(self, *args):
+        return self
+
+    def order_by(self, *args):
+        return self
+
+    def limit(self, max_rows):
+        self.max_rows = max_rows
+        return self
+
+    def _rows(self):
+        rows = self.session.tables.setdefault(self.model, [])
+        return [row for row in rows if all(_matches(row, criterion) for criterion in self.criteria)]
+
+    def all(self):
+        rows = self._rows()
+        if isinstance(self.entities[0], type):
+            result = rows
+        elif len(self.entities) == 2:
+            # a column and the count of its rows, most frequent first
+            key = self.entities[0].key
+            row_type = namedtuple("Row", [key, "count"])
+            counts = Counter(getattr(row, key) for row in rows)
+            result = [row_type(*item) for item in sorted(counts.items(), key=lambda item: (-item[1], item[0]))]
+        else:
+            result = [
+                SimpleNamespace(**{entity.key: getattr(row, entity.key)}) for row in rows for entity in self.entities
+            ]
+        return result[: self.max_rows] if self.max_rows else result
+
+    def first(self):
+        rows = self.all()
+        return rows[0] if rows else None
+
+    def delete(self, synchronize_session=None):
+        rows = self._rows()
+        self.session.tables[self.model] = [row for row in self.session.tables[self.model] if row not in rows]
+        return len(rows)
+
+
+class FakeSession:
+    def __init__(self):
+        self.tables = {}
+        self.inserts = 0
+
+    def query(self, *entities):
+        return FakeQuery(self, entities)
+
+    def execute(self, stmt):
+        # multi-row ON CONFLICT DO NOTHING insert of postings
+        self.inserts += 1
+        params = stmt.compile(dialect=postgresql.dialect()).params
+        postings = self.tables.setdefault(DatasetKeywordPosting, [])
+        existing = {(posting.dataset_id, posting.keyword, posting.index_node_id) for posting in postings}
+        i = 0
+        while f"keyword_m{i}" in params:
+            key = (params[f"dataset_id_m{i}"], params[f"keyword_m{i}"], params[f"index_node_id_m{i}"])
+            if key not in existing:
+                existing.add(key)
+                postings.append(
+                    SimpleNamespace(
+                        id=f"posting-{len(postings)}", dataset_id=key[0], keyword=key[1], index_node_id=key[2]
+                    )
+                )
+            i += 1
+
+    def delete(self, row):
+        for rows in self.tables.values():
+            if row in rows:
+                rows.remove(row)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+@pytest.fixture
+def session():
+    session = FakeSession()
+    session.tables[DocumentSegment] = [
+        SimpleNamespace(
+            dataset_id="dataset-1",
+            index_node_id=f"node-{i}",
+            index_node_hash=f"hash-{i}",
+            document_id="document-1",
+            content=content,
+            keywords=None,
+        )
+        for i, content in enumerate(["dify workflow agent", "dify agent", "dify knowledge"], start=1)
+    ]
+    db = SimpleNamespace(session=session)
+    with (
+        patch.object(jieba_inverted_index, "db", db),
+        patch("core.rag.datasource.keyword.keyword_base.db", db),
+        patch.object(jieba_inverted_index, "redis_client", MagicMock()),
+        patch.object(jieba_inverted_index, "storage", MagicMock()),
+        patch.object(jieba_inverted_index, "dify_config", SimpleNamespace(KEYWORD_SEARCH_SCORE_METHOD="keyword_count")),
+        patch(
+            "core.rag.datasource.keyword.jieba.jieba_inverted_index.JiebaKeywordTableHandler.extract_keywords",
+            side_effect=lambda text, max_keywords_per_chunk=None: set(text.split()),
+        ),
+        patch.object(jieba_inverted_index, "_migrated_dataset_ids", set()),
+    ):
+        yield session
+
+
+def _dataset(keyword_table=None):
+    return SimpleNamespace(id="dataset-1", tenant_id="tenant-1", dataset_keyword_table=keyword_table)
+
+
+def _documents(session):
+    return [
+        Document(page_content=segment.content, metadata={"doc_id": segment.index_node_id})
+        for segment in session.tables[DocumentSegment]
+    ]
+
+
+def _postings(session):
+    return sorted((posting.keyword, posting.index_node_id) for posting in session.tables[DatasetKeywordPosting])
+
+
+def test_create_writes_postings_and_segment_keywords(session):
+    keyword = JiebaInvertedIndex(_dataset())
+
+    keyword.create(_documents(session))
+
+    assert ("workflow", "node-1") in _postings(session)
+    assert len(_postings(session)) == 7
+    assert sorted(session.tables[DocumentSegment][1].keywords) == ["agent", "dify"]
+    assert keyword.text_exists("node-3")
+    assert not keyword.text_exists("node-4")
+
+
+def test_search_ranks_segments_by_matching_keywords(session):
+    keyword = JiebaInvertedIndex(_dataset())
+    keyword.create(_documents(session))
+
+    documents = keyword.search("workflow agent", top_k=2)
+
+    assert [document.metadata["doc_id"] for document in documents] == ["node-1", "node-2"]
+
+
+def test_delete_removes_postings(session):
+    keyword = JiebaInvertedIndex(_dataset())
+    keyword.create(_documents(session))
+
+    keyword.delete_by_ids(["node-1", "node-3"])
+
+    assert _postings(session) == [("agent", "node-2"), ("dify", "node-2")]
+
+    keyword.delete()
+
+    assert _postings(session) == []
+
+
+def test_long_keywords_are_skipped_with_warning(session, caplog):
+    keyword = JiebaInvertedIndex(_dataset())
+
+    with caplog.at_level(logging.WARNING):
+        keyword.create_segment_keywords("node-1", ["dify", "x" * (MAX_KEYWORD_LENGTH + 1)])
+
+    assert _postings(session) == [("dify", "node-1")]
+    assert "Skipped 1 keywords" in caplog.text
+
+
+def test_migration_copies_legacy_table_and_keeps_it(session):
+    legacy_table = SimpleNamespace(
+        dataset_id="dataset-1",
+        data_source_type="database",
+        keyword_table_dict={"__data__": {"table": {"dify": ["node-1", "node-2"], "agent": ["node-2"]}}},
+    )
+    session.tables[DatasetKeywordTable] = [legacy_table]
+    dataset = _dataset(legacy_table)
+
+    JiebaInvertedIndex(dataset).migrate_keyword_table()
+
+    assert _postings(session) == [("agent", "node-2"), ("dify", "node-1"), ("dify", "node-2")]
+    # the legacy table still serves the jieba keyword store until it is cleaned up
+    assert session.tables[DatasetKeywordTable] == [legacy_table]
+
+    # another process does not copy the legacy table again once the dataset has postings
+    jieba_inverted_index._migrated_dataset_ids.clear()
+    inserts = session.inserts
+    JiebaInvertedIndex(dataset).migrate_keyword_table()
+    assert session.inserts == inserts
+
+    JiebaInvertedIndex(dataset).delete_legacy_keyword_table()
+
+    assert session.tables[DatasetKeywordTable] == []
+    assert len(_postings(session)) == 3
+
+
+def test_keyword_store_commands_page_through_kept_legacy_tables(session):
+    dataset_ids = [f"dataset-{i:03}" for i in range(150)]
+    session.tables[DatasetKeywordTable] = [SimpleNamespace(dataset_id=dataset_id) for dataset_id in dataset_ids]
+    session.tables[Dataset] = [SimpleNamespace(id=dataset_id) for dataset_id in dataset_ids[1:]]
+    handled = []
+
+    with patch.object(commands, "db", SimpleNamespace(session=session)):
+        handled_count = commands._for_each_legacy_keyword_table(lambda dataset: handled.append(dataset.id), "Migrate")
+
+    # the legacy tables stay in place, every dataset is visited once and the missing one is skipped
+    assert handled_count == 149
+    assert handled == dataset_ids[1:]
@@ -0,0 +1,47 @@
+import threading
+from unittest.mock import MagicMock, patch
+
+from core.rag.datasource.vdb.pgvector.pgvector import BlockingConnectionPool
+
+
+def _pool(maxconn):
+    connect = MagicMock(side_effect=lambda *args, **kwargs: MagicMock(closed=False))
+    with patch("psycopg2.connect", connect):
+        pool = BlockingConnectionPool(1, maxconn, host="localhost")
+    return pool, connect
+
+
+def test_getconn_waits_for_a_connection_when_the_pool_is_exhausted():
+    pool, connect = _pool(maxconn=1)
+    with patch("psycopg2.connect", connect):
+        conn = pool.getconn()
+        acquired = threading.Event()
+        results = []
+
+        def get_second():
+            results.append(pool.getconn())
+            acquired.set()
+
+        thread = threading.Thread(target=get_second)
+        thread.start()
+
+        # ThreadedConnectionPool would raise PoolError here
+        assert not acquired.wait(0.1)
+
+        pool.putconn(conn)
+        assert acquired.wait(1)
+        thread.join()
+
+    # the connection put back is handed to the waiting thread
+    assert results == [conn]
+    assert connect.call_count == 1
+
+
+def test_closed_connections_free_their_slot():
+    pool, connect = _pool(maxconn=1)
+    with patch("psycopg2.connect", connect):
+        conn = pool.getconn()
+        pool.putconn(conn, close=True)
+
+        assert pool.getconn() is not conn
+    assert connect.call_count == 2
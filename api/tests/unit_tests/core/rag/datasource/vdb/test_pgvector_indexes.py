@@ -0,0 +1,147 @@
+from contextlib import contextmanager
+from unittest.mock import MagicMock, patch
+
+import pytest
+from redis.exceptions import LockNotOwnedError
+
+from core.rag.datasource.vdb.pgvector import pgvector
+from core.rag.datasource.vdb.pgvector.pgvector import PGVector, PGVectorConfig
+
+
+class FakeCursor:
+    """Records the statements, answers queries from a list of (statement prefix, record) pairs."""
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.statements = []
+        self.params = []
+        self.record = None
+
+    def execute(self, statement, params=None):
+        self.statements.append(statement)
+        self.params.append(params)
+        self.record = next((record for prefix, record in self.answers if statement.startswith(prefix)), None)
+
+    def fetchone(self):
+        return self.record
+
+    def __iter__(self):
+        return iter([])
+
+
+def _vector(answers, **config):
+    config = PGVectorConfig(host="localhost", port=5432, user="user", password="password", database="db", **config)
+    with patch.object(PGVector, "_create_connection_pool", return_value=MagicMock()):
+        vector = PGVector("Vector_index_test_Node", config)
+    cursor = FakeCursor(answers)
+
+    @contextmanager
+    def get_cursor():
+        yield cursor
+
+    vector._get_cursor = get_cursor
+    vector._get_autocommit_cursor = get_cursor
+    return vector, cursor
+
+
+@pytest.fixture(autouse=True)
+def redis():
+    redis = MagicMock()
+    redis.get.return_value = None
+    with patch.object(pgvector, "redis_client", redis), patch.dict(pgvector._text_search_column_tables, clear=True):
+        yield redis
+
+
+def test_indexes_are_not_created_below_threshold(redis):
+    vector, cursor = _vector([("SELECT count(*)", (10,))], index_min_rows=100)
+
+    vector._create_indexes_if_needed()
+
+    assert not any("CREATE INDEX" in statement for statement in cursor.statements)
+    redis.set.assert_not_called()
+
+
+def test_index_build_is_queued_once_past_threshold(redis):
+    vector, cursor = _vector([("SELECT count(*)", (100,))], index_min_rows=100)
+    redis.set.side_effect = [True, None]
+
+    with patch.object(pgvector, "create_pgvector_indexes_task") as task:
+        vector._create_indexes_if_needed()
+        vector._create_indexes_if_needed()
+
+    # the indexing does not wait for the build, and the next batches do not queue another one
+    task.delay.assert_called_once_with("Vector_index_test_Node")
+    assert not any("CREATE INDEX" in statement for statement in cursor.statements)
+
+
+def test_hnsw_and_full_text_indexes_are_created_concurrently(redis):
+    vector, cursor = _vector(
+        [("SELECT atttypmod", (1536,)), ("SELECT EXISTS", (True,))],
+        hnsw_m=24,
+    )
+
+    assert vector.build_indexes()
+
+    created = [statement for statement in cursor.statements if statement.startswith("CREATE INDEX")]
+    assert len(created) == 2
+    assert "CONCURRENTLY" in created[0]
+    assert "USING hnsw (embedding vector_cosine_ops) WITH (m = 24, ef_construction = 64)" in created[0]
+    assert "USING gin (text_tsv)" in created[1]
+    redis.set.assert_called_once()
+    redis.delete.assert_called_once_with("vector_index_Vector_index_test_Node_queued")
+
+
+def test_index_build_skips_when_another_worker_builds(redis):
+    vector, cursor = _vector([])
+    redis.lock.return_value.acquire.return_value = False
+
+    assert not vector.build_indexes()
+    assert cursor.statements == []
+
+
+def test_expired_build_lock_does_not_fail_the_build(redis):
+    vector, cursor = _vector([("SELECT atttypmod", (1536,)), ("SELECT EXISTS", (True,))])
+    redis.lock.return_value.release.side_effect = LockNotOwnedError("lock expired")
+
+    assert vector.build_indexes()
+    redis.set.assert_called_once()
+    redis.delete.assert_called_once_with("vector_index_Vector_index_test_Node_queued")
+
+
+def test_collections_without_tsvector_column_index_the_expression():
+    vector, cursor = _vector(
+        [("SELECT atttypmod", (1536,)), ("SELECT EXISTS", (False,))],
+        index_type="ivfflat",
+        ivfflat_lists=50,
+    )
+
+    vector.create_indexes()
+
+    created = [statement for statement in cursor.statements if statement.startswith("CREATE INDEX")]
+    assert "USING ivfflat (embedding vector_cosine_ops) WITH (lists = 50)" in created[0]
+    assert f"USING gin ({pgvector.TEXT_SEARCH_EXPRESSION})" in created[1]
+
+
+def test_embeddings_above_index_dimension_limit_are_not_indexed():
+    vector, cursor = _vector([("SELECT atttypmod", (3072,)), ("SELECT EXISTS", (True,))])
+
+    vector.create_indexes()
+
+    created = [statement for statement in cursor.statements if statement.startswith("CREATE INDEX")]
+    assert len(created) == 1
+    assert "USING gin" in created[0]
+
+
+def test_search_sets_ef_search_per_query():
+    vector, cursor = _vector([])
+
+    vector.search_by_vector([0.1, 0.2], top_k=5, ef_search=200)
+    vector.search_by_vector([0.1, 0.2], top_k=80)
+
+    settings = [
+        (statement, params)
+        for statement, params in zip(cursor.statements, cursor.params)
+        if statement.startswith("SET LOCAL")
+    ]
+    # ef_search is raised to top_k, the index returns at most ef_search neighbors
+    assert settings == [("SET LOCAL hnsw.ef_search = %s", (200,)), ("SET LOCAL hnsw.ef_search = %s", (80,))]
@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from core.rag.datasource.vdb import vector_client_registry
+from core.rag.datasource.vdb.vector_client_registry import VectorClientRegistry
+
+
+class FakeClient:
+    def __init__(self, healthy=True):
+        self.healthy = healthy
+        self.closed = False
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    clock = FakeClock()
+    config = SimpleNamespace(VECTOR_CLIENT_IDLE_TIMEOUT=600, VECTOR_CLIENT_HEALTH_CHECK_INTERVAL=60)
+    with (
+        patch.object(vector_client_registry, "dify_config", config),
+        patch.object(vector_client_registry, "time", clock),
+    ):
+        yield clock
+
+
+def _close(client):
+    client.closed = True
+
+
+def _health_check(client):
+    if not client.healthy:
+        raise ConnectionError("connection lost")
+
+
+def _get(registry, key=("pgvector", "config")):
+    return registry.get(key, create=FakeClient, close=_close, health_check=_health_check)
+
+
+def test_clients_are_reused_per_key(clock):
+    registry = VectorClientRegistry()
+
+    client = _get(registry)
+
+    assert _get(registry) is client
+    assert _get(registry, key=("pgvector", "other config")) is not client
+
+
+def test_unhealthy_client_is_replaced(clock):
+    registry = VectorClientRegistry()
+    client = _get(registry)
+    client.healthy = False
+
+    # not checked again before the health check interval
+    clock.now += 30
+    assert _get(registry) is client
+
+    clock.now += 30
+    replacement = _get(registry)
+
+    assert replacement is not client
+    # other adapters may still use the unhealthy client, it is left to the garbage collector
+    assert not client.closed
+
+
+def test_idle_clients_are_evicted(clock):
+    registry = VectorClientRegistry()
+    client = _get(registry)
+
+    clock.now += 600
+
+    assert _get(registry) is not client
+    # an adapter may still hold the evicted client, it is left open
+    assert not client.closed
+
+
+def test_forked_child_does_not_reuse_or_close_clients_of_parent(clock):
+    registry = VectorClientRegistry()
+    client = _get(registry)
+
+    registry._after_fork_in_child()
+    registry.clear()
+
+    assert _get(registry) is not client
+    assert not client.closed
@@ -0,0 +1,222 @@
+import datetime
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from core.rag.datasource.vdb import vector_migration
+from core.rag.datasource.vdb.vector_migration import DatasetVectorMigration
+from core.rag.models.document import Document
+
+
+class FakeTarget:
+    def __init__(self):
+        self.rows = {}
+        self.embedded = []
+        self.deleted = False
+        self.deleted_ids = []
+
+    def embed_documents(self, documents):
+        self.embedded.extend(document.metadata["doc_id"] for document in documents)
+        return [[0.0] for _ in documents]
+
+    def upsert(self, documents, embeddings):
+        for document, embedding in zip(documents, embeddings):
+            self.rows[document.metadata["doc_id"]] = embedding
+
+    def delete(self):
+        self.deleted = True
+
+    def delete_by_ids(self, ids):
+        self.deleted_ids.extend(ids)
+        for id in ids:
+            self.rows.pop(id, None)
+
+
+class FakeSource:
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def get_embeddings_by_ids(self, ids):
+        return {id: self.vectors[id] for id in ids if id in self.vectors}
+
+
+class FakeRedis:
+    def __init__(self):
+        self.hashes = {}
+        self.sets = {}
+
+    def hget(self, key, field):
+        value = self.hashes.get(key, {}).get(field)
+        return value.encode() if value is not None else None
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    def hdel(self, key, field):
+        self.hashes.get(key, {}).pop(field, None)
+
+    def sadd(self, key, *values):
+        self.sets.setdefault(key, set()).update(values)
+
+    def sscan_iter(self, key, count=None):
+        return iter(sorted(value.encode() for value in self.sets.get(key, set())))
+
+    def delete(self, key):
+        self.sets.pop(key, None)
+
+
+def _segment(i):
+    return SimpleNamespace(
+        id=f"segment-{i}",
+        content=f"text {i}",
+        index_node_id=f"doc-{i}",
+        index_node_hash=f"hash-{i}",
+        document_id="document-1",
+        dataset_id="dataset-1",
+    )
+
+
+def _documents(*numbers):
+    return [Document(page_content=f"text {i}", metadata={"doc_id": f"doc-{i}"}) for i in numbers]
+
+
+def test_vectors_are_copied_from_the_source_and_missing_ones_embedded():
+    target = FakeTarget()
+    migration = DatasetVectorMigration("dataset-1", batch_size=10)
+
+    copied = migration._copy(FakeSource({"doc-1": [1.0], "doc-3": [3.0]}), target, _documents(1, 2, 3))
+
+    assert copied == 2
+    assert target.embedded == ["doc-2"]
+    assert target.rows == {"doc-1": [1.0], "doc-2": [0.0], "doc-3": [3.0]}
+
+
+def test_unreadable_source_falls_back_to_embedding():
+    source = MagicMock()
+    source.get_embeddings_by_ids.side_effect = ConnectionError("unreachable")
+    target = FakeTarget()
+
+    copied = DatasetVectorMigration("dataset-1", batch_size=10)._copy(source, target, _documents(1, 2))
+
+    assert copied == 0
+    assert target.embedded == ["doc-1", "doc-2"]
+
+
+@pytest.fixture
+def migration_env():
+    redis = FakeRedis()
+    target = FakeTarget()
+    dataset = SimpleNamespace(id="dataset-1", index_struct='{"type": "weaviate"}')
+    db = MagicMock()
+    db.session.query.return_value.filter.return_value.first.return_value = dataset
+    with (
+        patch.object(vector_migration, "redis_client", redis),
+        patch.object(vector_migration, "db", db),
+        patch.object(vector_migration, "Vector", return_value=target),
+        patch.object(DatasetVectorMigration, "_init_source", return_value=FakeSource({})),
+        patch.object(DatasetVectorMigration, "_get_indexed_ids", side_effect=set),
+    ):
+        yield redis, target
+
+
+def test_migration_resumes_after_the_last_written_segment(migration_env):
+    redis, target = migration_env
+    redis.hset(DatasetVectorMigration.STARTED_AT_KEY, "dataset-1", "2024-08-01T10:00:00")
+    redis.hset(DatasetVectorMigration.PROGRESS_KEY, "dataset-1", "segment-2")
+    migration = DatasetVectorMigration("dataset-1", batch_size=2)
+
+    def iter_segments(last_segment_id, changed_since=None):
+        return iter([] if changed_since else [[_segment(3), _segment(4)]])
+
+    with patch.object(DatasetVectorMigration, "_iter_segments", side_effect=iter_segments) as mock_iter_segments:
+        result = migration.run()
+
+    assert mock_iter_segments.call_args_list[0].args == ("segment-2",)
+    # the segments changed since the migration started are looked up with the start time of the first run
+    assert mock_iter_segments.call_args_list[1].kwargs == {
+        "changed_since": datetime.datetime(2024, 8, 1, 10, 0) - DatasetVectorMigration.CATCH_UP_MARGIN
+    }
+    assert not target.deleted
+    assert result.chunks == 2
+    assert result.embedded == 2
+    # progress is cleared once the dataset is switched to the new vector store
+    assert redis.hashes[DatasetVectorMigration.PROGRESS_KEY] == {}
+    assert redis.hashes[DatasetVectorMigration.STARTED_AT_KEY] == {}
+
+
+def test_segments_indexed_during_the_migration_are_written_before_the_switch(migration_env):
+    redis, target = migration_env
+    migration = DatasetVectorMigration("dataset-1", batch_size=2)
+    # segment-0 is created while the migration runs, its id sorts below the cursor
+    rounds = iter([[[_segment(0)]], []])
+
+    def iter_segments(last_segment_id, changed_since=None):
+        if changed_since:
+            return iter(next(rounds))
+        return iter([[_segment(1), _segment(2)]])
+
+    with patch.object(DatasetVectorMigration, "_iter_segments", side_effect=iter_segments):
+        result = migration.run()
+
+    assert sorted(target.rows) == ["doc-0", "doc-1", "doc-2"]
+    assert result.chunks == 3
+    assert result.caught_up == 1
+
+
+def test_new_migration_clears_the_target_and_records_progress(migration_env):
+    redis, target = migration_env
+    progress = []
+    migration = DatasetVectorMigration("dataset-1", batch_size=2)
+    original_copy = migration._copy
+
+    def copy(source, target, documents):
+        progress.append(redis.hget(DatasetVectorMigration.PROGRESS_KEY, "dataset-1"))
+        return original_copy(source, target, documents)
+
+    batches = iter([[_segment(1), _segment(2)], [_segment(3)]])
+    with (
+        patch.object(
+            DatasetVectorMigration,
+            "_iter_segments",
+            side_effect=lambda last_segment_id, changed_since=None: iter([]) if changed_since else batches,
+        ),
+        patch.object(migration, "_copy", side_effect=copy),
+    ):
+        result = migration.run()
+
+    assert target.deleted
+    assert progress == [b"", b"segment-2"]
+    assert result.chunks == 3
+    assert sorted(target.rows) == ["doc-1", "doc-2", "doc-3"]
+
+
+def test_chunks_of_segments_disabled_during_the_migration_are_deleted_before_the_switch(migration_env):
+    redis, target = migration_env
+    migration = DatasetVectorMigration("dataset-1", batch_size=2)
+    written_ids_key = DatasetVectorMigration.WRITTEN_IDS_KEY.format("dataset-1")
+    batches = iter([[_segment(1), _segment(2)], [_segment(3)]])
+    written_before_the_switch = []
+
+    def get_indexed_ids(index_node_ids):
+        # segment-1 is disabled after the cursor passed it, the disable went to the old vector store only
+        written_before_the_switch.extend(sorted(redis.sets[written_ids_key]))
+        return {index_node_id for index_node_id in index_node_ids if index_node_id != "doc-1"}
+
+    with (
+        patch.object(
+            DatasetVectorMigration,
+            "_iter_segments",
+            side_effect=lambda last_segment_id, changed_since=None: iter([]) if changed_since else batches,
+        ),
+        patch.object(DatasetVectorMigration, "_get_indexed_ids", side_effect=get_indexed_ids),
+    ):
+        result = migration.run()
+
+    assert written_before_the_switch[:3] == ["doc-1", "doc-2", "doc-3"]
+    assert target.deleted_ids == ["doc-1"]
+    assert sorted(target.rows) == ["doc-2", "doc-3"]
+    assert result.chunks == 3
+    assert result.deleted == 1
+    # the written ids are dropped with the progress once the dataset is switched
+    assert written_ids_key not in redis.sets
@@ -0,0 +1,150 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from core.rag.datasource.vdb import vector_base
+from core.rag.datasource.vdb.vector_base import BaseVector
+from core.rag.models.document import Document
+
+
+class FakeVector(BaseVector):
+    """In-memory store without native upsert, counts its round trips."""
+
+    def __init__(self):
+        super().__init__("collection")
+        self.rows = {}
+        self.calls = []
+
+    def get_type(self) -> str:
+        return "fake"
+
+    def create(self, texts, embeddings, **kwargs):
+        self.add_texts(texts, embeddings)
+
+    def add_texts(self, documents, embeddings, **kwargs):
+        self.calls.append(("add_texts", len(documents)))
+        for document, embedding in zip(documents, embeddings):
+            self.rows.setdefault(document.metadata["doc_id"], []).append((document.page_content, embedding))
+
+    def text_exists(self, id):
+        self.calls.append(("text_exists", 1))
+        return id in self.rows
+
+    def delete_by_ids(self, ids):
+        self.calls.append(("delete_by_ids", len(ids)))
+        for id in ids:
+            self.rows.pop(id, None)
+
+    def delete_by_metadata_field(self, key, value):
+        pass
+
+    def search_by_vector(self, query_vector, **kwargs):
+        return []
+
+    def search_by_full_text(self, query, **kwargs):
+        return []
+
+
+class BulkFakeVector(FakeVector):
+    def ids_exist(self, ids):
+        self.calls.append(("ids_exist", len(ids)))
+        return {id for id in ids if id in self.rows}
+
+
+class StrictFakeVector(FakeVector):
+    """Store whose table is created by create(), lookups and deletes fail before it exists."""
+
+    def __init__(self):
+        super().__init__()
+        self.rows = None
+
+    def create(self, texts, embeddings, **kwargs):
+        if self.rows is None:
+            self.rows = {}
+        self.add_texts(texts, embeddings)
+
+    def text_exists(self, id):
+        if self.rows is None:
+            raise RuntimeError('relation "embedding_collection" does not exist')
+        return super().text_exists(id)
+
+    def delete_by_ids(self, ids):
+        if self.rows is None:
+            raise RuntimeError('relation "embedding_collection" does not exist')
+        super().delete_by_ids(ids)
+
+
+def _documents(count, content="text"):
+    return [Document(page_content=f"{content} {i}", metadata={"doc_id": f"doc-{i}"}) for i in range(count)]
+
+
+def _upsert(vector, documents, batch_size=4):
+    config = SimpleNamespace(VECTOR_STORE_UPSERT_BATCH_SIZE=batch_size)
+    with patch.object(vector_base, "dify_config", config):
+        vector.upsert(documents, [[float(i)] for i in range(len(documents))])
+
+
+def test_upsert_writes_in_batches():
+    vector = BulkFakeVector()
+
+    _upsert(vector, _documents(10))
+
+    assert [call for call in vector.calls if call[0] == "add_texts"] == [
+        ("add_texts", 4),
+        ("add_texts", 4),
+        ("add_texts", 2),
+    ]
+    assert len(vector.rows) == 10
+
+
+def test_upsert_twice_stores_documents_once():
+    vector = BulkFakeVector()
+
+    _upsert(vector, _documents(10))
+    _upsert(vector, _documents(10, content="updated"))
+
+    assert all(len(rows) == 1 for rows in vector.rows.values())
+    assert vector.rows["doc-3"] == [("updated 3", [3.0])]
+
+
+def test_bulk_ids_exist_checks_a_batch_in_one_round_trip():
+    vector = BulkFakeVector()
+    _upsert(vector, _documents(8))
+    vector.calls.clear()
+
+    _upsert(vector, _documents(8))
+
+    assert vector.calls == [
+        ("ids_exist", 4),
+        ("delete_by_ids", 4),
+        ("add_texts", 4),
+        ("ids_exist", 4),
+        ("delete_by_ids", 4),
+        ("add_texts", 4),
+    ]
+
+
+def test_ids_exist_falls_back_to_text_exists():
+    vector = FakeVector()
+    _upsert(vector, _documents(3))
+
+    assert vector.ids_exist(["doc-0", "doc-2", "doc-9"]) == {"doc-0", "doc-2"}
+
+
+def test_filter_duplicate_texts_keeps_new_documents():
+    vector = BulkFakeVector()
+    _upsert(vector, _documents(3))
+
+    documents = vector._filter_duplicate_texts(_documents(5))
+
+    assert [document.metadata["doc_id"] for document in documents] == ["doc-3", "doc-4"]
+
+
+def test_upsert_creates_a_missing_collection():
+    vector = StrictFakeVector()
+
+    _upsert(vector, _documents(6))
+    _upsert(vector, _documents(6, content="updated"))
+
+    assert len(vector.rows) == 6
+    assert all(len(rows) == 1 for rows in vector.rows.values())
+    assert vector.rows["doc-5"] == [("updated 5", [5.0])]
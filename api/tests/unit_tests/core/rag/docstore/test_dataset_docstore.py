@@ -0,0 +1,112 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from core.embedding.token_counter import EmbeddingTokenCounter
+from core.rag.docstore import dataset_docstore
+from core.rag.docstore.dataset_docstore import DatasetDocumentStore
+from core.rag.models.document import Document
+
+
+class FakeSession:
+    def __init__(self, max_position=None, existing=None):
+        self.max_position = max_position
+        self.existing = existing or {}
+        self.inserted = []
+        self.updated = []
+        self.commits = 0
+        self.lookups = 0
+
+    def query(self, *entities):
+        query = MagicMock()
+        if len(entities) == 1:
+            query.filter.return_value.scalar.return_value = self.max_position
+        else:
+
+            def rows(*args, **kwargs):
+                self.lookups += 1
+                return list(self.existing.items())
+
+            query.filter.return_value.all.side_effect = rows
+        return query
+
+    def bulk_insert_mappings(self, mapper, mappings):
+        self.inserted.extend(mappings)
+
+    def bulk_update_mappings(self, mapper, mappings):
+        self.updated.extend(mappings)
+
+    def commit(self):
+        self.commits += 1
+
+
+def _store(session):
+    dataset = SimpleNamespace(id="dataset-1", tenant_id="tenant-1", indexing_technique="economy")
+    return patch.object(dataset_docstore, "db", SimpleNamespace(session=session)), DatasetDocumentStore(
+        dataset=dataset, user_id="user-1", document_id="document-1"
+    )
+
+
+def _documents(count):
+    return [
+        Document(page_content=f"content {i}", metadata={"doc_id": f"node-{i}", "doc_hash": f"hash-{i}"})
+        for i in range(count)
+    ]
+
+
+def test_add_documents_inserts_in_batches_with_one_commit_per_batch():
+    session = FakeSession(max_position=3)
+    patcher, store = _store(session)
+    with patcher, patch.object(dataset_docstore, "SEGMENT_BATCH_SIZE", 4):
+        store.add_documents(_documents(10))
+
+    assert session.commits == 3
+    assert session.lookups == 3
+    assert [segment["position"] for segment in session.inserted] == list(range(4, 14))
+    assert [segment["index_node_id"] for segment in session.inserted] == [f"node-{i}" for i in range(10)]
+    assert all(segment["tokens"] == 0 and segment["enabled"] is False for segment in session.inserted)
+    assert len({segment["id"] for segment in session.inserted}) == 10
+
+
+def test_add_documents_updates_existing_segments_and_applies_attributes():
+    session = FakeSession(existing={"node-1": "segment-1"})
+    patcher, store = _store(session)
+    documents = _documents(3)
+    documents[2].metadata["answer"] = "answer 2"
+    with patcher:
+        store.add_documents(documents, segment_attributes={"status": "completed"})
+
+    assert session.updated == [
+        {"id": "segment-1", "content": "content 1", "index_node_hash": "hash-1", "word_count": 9, "tokens": 0}
+    ]
+    assert [segment["position"] for segment in session.inserted] == [1, 2]
+    assert all(segment["status"] == "completed" for segment in session.inserted)
+    assert session.inserted[1]["answer"] == "answer 2"
+    assert "answer" not in documents[2].metadata
+    assert session.commits == 1
+
+
+def test_add_documents_rejects_existing_segments_without_update():
+    session = FakeSession(existing={"node-0": "segment-0"})
+    patcher, store = _store(session)
+    with patcher, pytest.raises(ValueError):
+        store.add_documents(_documents(2), allow_update=False)
+
+    assert session.inserted == []
+    assert session.commits == 0
+
+
+def test_add_documents_uses_token_counts_of_the_indexing_job():
+    session = FakeSession()
+    patcher, store = _store(session)
+    store._dataset.indexing_technique = "high_quality"
+    documents = _documents(2)
+    token_counter = EmbeddingTokenCounter(None)
+    for document in documents:
+        token_counter.set_count(document.page_content, 7)
+    with patcher, patch.object(dataset_docstore, "ModelManager") as model_manager:
+        store.add_documents(documents, token_counter=token_counter)
+
+    model_manager.assert_not_called()
+    assert [segment["tokens"] for segment in session.inserted] == [7, 7]
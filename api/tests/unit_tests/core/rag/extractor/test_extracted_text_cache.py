@@ -0,0 +1,137 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from core.rag.extractor import extracted_text_cache
+from core.rag.extractor.extracted_text_cache import ExtractedTextCache
+from core.rag.models.document import Document
+
+
+class FakeStorage:
+    def __init__(self):
+        self.files = {}
+
+    def save(self, filename, data):
+        self.files[filename] = data
+
+    def load_once(self, filename):
+        return self.files[filename]
+
+    def exists(self, filename):
+        return filename in self.files
+
+    def delete(self, filename):
+        del self.files[filename]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.hashes = {}
+        self.sorted_sets = {}
+        self.clock = 0
+
+    def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = str(value).encode()
+
+    def hdel(self, key, field):
+        self.hashes.get(key, {}).pop(field, None)
+
+    def hincrby(self, key, field, amount):
+        values = self.hashes.setdefault(key, {})
+        values[field] = str(int(values.get(field, 0)) + amount).encode()
+
+    def hgetall(self, key):
+        return {field.encode(): value for field, value in self.hashes.get(key, {}).items()}
+
+    def zadd(self, key, mapping):
+        # a logical clock keeps the access order deterministic
+        for member in mapping:
+            self.clock += 1
+            self.sorted_sets.setdefault(key, {})[member] = self.clock
+
+    def zrange(self, key, start, end):
+        members = sorted(self.sorted_sets.get(key, {}).items(), key=lambda item: item[1])
+        return [member.encode() for member, _ in members[start : end + 1]]
+
+    def zrem(self, key, member):
+        self.sorted_sets.get(key, {}).pop(member, None)
+
+    def lock(self, name, timeout=None):
+        lock = MagicMock()
+        lock.acquire.return_value = True
+        return lock
+
+
+@pytest.fixture
+def cache_env():
+    storage = FakeStorage()
+    redis = FakeRedis()
+    config = SimpleNamespace(EXTRACTED_TEXT_CACHE_ENABLED=True, EXTRACTED_TEXT_CACHE_MAX_SIZE=10_000)
+    with (
+        patch.object(extracted_text_cache, "storage", storage),
+        patch.object(extracted_text_cache, "redis_client", redis),
+        patch.object(extracted_text_cache, "dify_config", config),
+    ):
+        yield storage, redis, config
+
+
+def _upload_file(file_hash="hash-1", tenant_id="tenant-1"):
+    return SimpleNamespace(hash=file_hash, tenant_id=tenant_id)
+
+
+def test_cache_round_trip(cache_env):
+    cache = ExtractedTextCache(_upload_file(), extractor="dify-pdf")
+    assert cache.get() is None
+
+    cache.set([Document(page_content="page one", metadata={"page": 0})])
+    documents = ExtractedTextCache(_upload_file(), extractor="dify-pdf").get()
+
+    assert [(document.page_content, document.metadata) for document in documents] == [("page one", {"page": 0})]
+    stats = ExtractedTextCache.get_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["stores"] == 1
+
+
+def test_entries_are_keyed_by_tenant_extractor_and_content(cache_env):
+    ExtractedTextCache(_upload_file(), extractor="dify-pdf").set([Document(page_content="text", metadata={})])
+
+    assert ExtractedTextCache(_upload_file(file_hash="hash-2"), extractor="dify-pdf").get() is None
+    assert ExtractedTextCache(_upload_file(tenant_id="tenant-2"), extractor="dify-pdf").get() is None
+    assert ExtractedTextCache(_upload_file(), extractor="unstructured-pdf").get() is None
+
+
+def test_files_without_hash_are_not_cached(cache_env):
+    storage, _, _ = cache_env
+    cache = ExtractedTextCache(_upload_file(file_hash=None), extractor="dify-pdf")
+
+    cache.set([Document(page_content="text", metadata={})])
+
+    assert cache.get() is None
+    assert storage.files == {}
+
+
+def test_least_recently_used_entries_are_evicted(cache_env):
+    storage, _, config = cache_env
+    text = "x" * 3000
+    for file_hash in ["hash-1", "hash-2", "hash-3"]:
+        ExtractedTextCache(_upload_file(file_hash=file_hash), extractor="dify-pdf").set(
+            [Document(page_content=text, metadata={})]
+        )
+    # reading the first entry makes the second one the least recently used
+    assert ExtractedTextCache(_upload_file(file_hash="hash-1"), extractor="dify-pdf").get() is not None
+
+    ExtractedTextCache(_upload_file(file_hash="hash-4"), extractor="dify-pdf").set(
+        [Document(page_content=text, metadata={})]
+    )
+
+    assert ExtractedTextCache(_upload_file(file_hash="hash-2"), extractor="dify-pdf").get() is None
+    assert ExtractedTextCache(_upload_file(file_hash="hash-1"), extractor="dify-pdf").get() is not None
+    stats = ExtractedTextCache.get_stats()
+    assert stats["evictions"] == 1
+    assert stats["size"] == sum(len(data) for data in storage.files.values())
+    assert stats["size"] <= config.EXTRACTED_TEXT_CACHE_MAX_SIZE
@@ -0,0 +1,60 @@
+import ctypes
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pypdfium2
+import pypdfium2.raw as pdfium_raw
+import pytest
+
+from core.rag.extractor import pdf_extractor
+from core.rag.extractor.pdf_extractor import PdfExtractor
+
+
+@pytest.fixture
+def pdf_file(tmp_path):
+    pdf = pypdfium2.PdfDocument.new()
+    for page_number in range(7):
+        page = pdf.new_page(200, 200)
+        text_object = pdfium_raw.FPDFPageObj_NewTextObj(pdf, b"Helvetica", ctypes.c_float(12))
+        text = ctypes.create_string_buffer(f"page {page_number}\x00".encode("utf-16-le"))
+        pdfium_raw.FPDFText_SetText(text_object, ctypes.cast(text, ctypes.POINTER(pdfium_raw.FPDF_WCHAR)))
+        pdfium_raw.FPDFPageObj_Transform(text_object, 1, 0, 0, 1, 20, 100)
+        pdfium_raw.FPDFPage_InsertObject(page, text_object)
+        page.gen_content()
+    file_path = str(tmp_path / "sample.pdf")
+    pdf.save(file_path)
+    pdf.close()
+    return file_path
+
+
+def _extract(file_path, max_workers, pages_per_task):
+    config = SimpleNamespace(PDF_EXTRACT_MAX_WORKERS=max_workers, PDF_EXTRACT_PAGES_PER_TASK=pages_per_task)
+    with patch.object(pdf_extractor, "dify_config", config):
+        return [(document.page_content, document.metadata) for document in PdfExtractor(file_path).extract()]
+
+
+def test_extract_in_calling_process(pdf_file):
+    documents = _extract(pdf_file, max_workers=0, pages_per_task=2)
+
+    assert documents == [(f"page {i}", {"source": pdf_file, "page": i}) for i in range(7)]
+
+
+def test_parallel_extraction_keeps_page_order(pdf_file):
+    assert _extract(pdf_file, max_workers=2, pages_per_task=2) == _extract(pdf_file, max_workers=0, pages_per_task=2)
+
+
+def test_small_files_are_extracted_in_calling_process(pdf_file):
+    with patch.object(PdfExtractor, "_load_in_parallel") as load_in_parallel:
+        documents = _extract(pdf_file, max_workers=2, pages_per_task=50)
+
+    load_in_parallel.assert_not_called()
+    assert len(documents) == 7
+
+
+def test_extract_yields_pages_lazily(pdf_file):
+    config = SimpleNamespace(PDF_EXTRACT_MAX_WORKERS=0, PDF_EXTRACT_PAGES_PER_TASK=2)
+    with patch.object(pdf_extractor, "dify_config", config):
+        documents = PdfExtractor(pdf_file).extract()
+
+        assert next(documents).page_content == "page 0"
+        assert [document.metadata["page"] for document in documents] == list(range(1, 7))
@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from core.embedding.token_counter import EmbeddingTokenCounter
+from core.rag.index_processor import index_processor_base
+from core.rag.index_processor.processor.paragraph_index_processor import ParagraphIndexProcessor
+from core.rag.models.document import Document
+
+PROCESS_RULE = {
+    "mode": "custom",
+    "rules": {
+        "pre_processing_rules": [
+            {"id": "remove_extra_spaces", "enabled": True},
+            {"id": "remove_urls_emails", "enabled": True},
+        ],
+        "segmentation": {"separator": "\\n\\n", "max_tokens": 60, "chunk_overlap": 10},
+    },
+}
+
+
+def _documents():
+    return [
+        Document(
+            page_content="\n\n".join(
+                f"Page {page} paragraph {paragraph}: see https://example.com/{page} or mail team@example.com. "
+                + "word " * (paragraph * 20)
+                for paragraph in range(1, 5)
+            ),
+            metadata={"page": page},
+        )
+        for page in range(20)
+    ]
+
+
+def _transform(max_workers, embedding_model_instance=None, token_counter=None):
+    config = SimpleNamespace(
+        INDEXING_MAX_SEGMENTATION_TOKENS_LENGTH=1000,
+        INDEXING_SPLIT_MAX_WORKERS=max_workers,
+        INDEXING_SPLIT_MIN_DOCUMENTS=4,
+    )
+    with patch.object(index_processor_base, "dify_config", config):
+        return ParagraphIndexProcessor().transform(
+            _documents(),
+            process_rule=PROCESS_RULE,
+            embedding_model_instance=embedding_model_instance,
+            token_counter=token_counter,
+        )
+
+
+@pytest.fixture
+def serial_chunks():
+    return _transform(max_workers=0)
+
+
+def test_parallel_split_matches_serial_split(serial_chunks):
+    with patch.object(
+        index_processor_base, "split_in_processes", wraps=index_processor_base.split_in_processes
+    ) as split_in_processes:
+        parallel_chunks = _transform(max_workers=2)
+
+    split_in_processes.assert_called_once()
+
+    def without_ids(chunks):
+        return [
+            (chunk.page_content, {key: value for key, value in chunk.metadata.items() if key != "doc_id"})
+            for chunk in chunks
+        ]
+
+    assert without_ids(parallel_chunks) == without_ids(serial_chunks)
+    assert len({chunk.metadata["doc_id"] for chunk in parallel_chunks}) == len(parallel_chunks)
+
+
+def test_split_honours_process_rule(serial_chunks):
+    assert [chunk.metadata["page"] for chunk in serial_chunks] == sorted(
+        chunk.metadata["page"] for chunk in serial_chunks
+    )
+    assert all("example.com" not in chunk.page_content for chunk in serial_chunks)
+
+
+def test_parallel_split_memoizes_chunk_counts_in_the_job_counter():
+    model_instance = MagicMock()
+    model_instance.get_text_embedding_num_tokens.side_effect = lambda texts: sum(len(text.split()) for text in texts)
+    token_counter = EmbeddingTokenCounter(model_instance)
+
+    chunks = _transform(max_workers=2, embedding_model_instance=model_instance, token_counter=token_counter)
+    # the chunks were measured in the workers, only the parent's own calls are made from here on
+    calls = model_instance.get_text_embedding_num_tokens.call_count
+
+    assert token_counter.count_documents(chunks) == sum(len(chunk.page_content.split()) for chunk in chunks)
+    assert model_instance.get_text_embedding_num_tokens.call_count == calls
+    assert all("tokens" not in chunk.metadata for chunk in chunks)
@@ -0,0 +1,95 @@
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from flask import Flask
+
+from core.rag.index_processor import qa_generation_pool
+from core.rag.index_processor.qa_generation_pool import QAGenerationPool
+from core.rag.models.document import Document
+
+
+@pytest.fixture(autouse=True)
+def qa_config():
+    config = SimpleNamespace(QA_GENERATION_MAX_CONCURRENCY_PER_TENANT=3, QA_GENERATION_MAX_RETRIES=2)
+    with (
+        patch.object(qa_generation_pool, "dify_config", config),
+        patch.object(qa_generation_pool, "_tenant_semaphores", {}),
+        patch.object(qa_generation_pool, "RETRY_BACKOFF", 0),
+    ):
+        yield config
+
+
+def _chunks(count):
+    return [Document(page_content=f"chunk {i}", metadata={"doc_id": str(i)}) for i in range(count)]
+
+
+def _qa(document):
+    return [Document(page_content=f"question of {document.page_content}", metadata={})]
+
+
+def test_results_are_yielded_in_chunk_order():
+    def generate(document):
+        # later chunks finish first
+        time.sleep(0.02 * (10 - int(document.metadata["doc_id"])))
+        return _qa(document)
+
+    results = list(QAGenerationPool(Flask(__name__), "tenant-1", generate).run(_chunks(10)))
+
+    assert [qa_documents[0].page_content for qa_documents in results] == [f"question of chunk {i}" for i in range(10)]
+
+
+def test_concurrency_is_limited_per_tenant():
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+
+    def generate(document):
+        nonlocal in_flight, max_in_flight
+        with lock:
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+        time.sleep(0.01)
+        with lock:
+            in_flight -= 1
+        return _qa(document)
+
+    app = Flask(__name__)
+    threads = [
+        threading.Thread(target=lambda: list(QAGenerationPool(app, "tenant-1", generate).run(_chunks(12))))
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max_in_flight == 3
+
+
+def test_failed_chunks_are_retried():
+    attempts = {}
+
+    def generate(document):
+        doc_id = document.metadata["doc_id"]
+        attempts[doc_id] = attempts.get(doc_id, 0) + 1
+        if doc_id == "1" and attempts[doc_id] < 3:
+            raise RuntimeError("provider unavailable")
+        if doc_id == "2":
+            raise RuntimeError("invalid response")
+        return _qa(document)
+
+    results = list(QAGenerationPool(Flask(__name__), "tenant-1", generate).run(_chunks(3)))
+
+    assert [len(qa_documents) for qa_documents in results] == [1, 1, 0]
+    assert attempts == {"0": 1, "1": 3, "2": 3}
+
+
+def test_blank_chunks_are_skipped():
+    chunks = [Document(page_content="  ", metadata={}), *_chunks(1)]
+
+    results = list(QAGenerationPool(Flask(__name__), "tenant-1", _qa).run(chunks))
+
+    assert len(results) == 1
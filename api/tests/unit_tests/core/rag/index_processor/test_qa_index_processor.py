@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from flask import Flask
+
+from core.embedding.token_counter import EmbeddingTokenCounter
+from core.rag.index_processor import index_processor_base, qa_generation_pool
+from core.rag.index_processor.processor import qa_index_processor
+from core.rag.index_processor.processor.qa_index_processor import QAIndexProcessor
+from core.rag.models.document import Document
+
+PROCESS_RULE = {
+    "mode": "custom",
+    "rules": {
+        "pre_processing_rules": [],
+        "segmentation": {"separator": "\\n\\n", "max_tokens": 60, "chunk_overlap": 0},
+    },
+}
+
+
+def _generate_qa_document(tenant_id, query, document_language):
+    return f"Q1: What is {query.split()[0]}?\nA1: {query}"
+
+
+def test_qa_documents_are_counted_by_their_question():
+    model_instance = MagicMock()
+    model_instance.get_text_embedding_num_tokens.side_effect = lambda texts: sum(len(text.split()) for text in texts)
+    token_counter = EmbeddingTokenCounter(model_instance)
+    documents = [Document(page_content="alpha " * 40 + "\n\n" + "beta " * 40, metadata={"source": "a.txt"})]
+
+    with (
+        Flask(__name__).app_context(),
+        patch.object(
+            index_processor_base,
+            "dify_config",
+            SimpleNamespace(
+                INDEXING_MAX_SEGMENTATION_TOKENS_LENGTH=1000,
+                INDEXING_SPLIT_MAX_WORKERS=0,
+                INDEXING_SPLIT_MIN_DOCUMENTS=4,
+            ),
+        ),
+        patch.object(
+            qa_generation_pool,
+            "dify_config",
+            SimpleNamespace(QA_GENERATION_MAX_CONCURRENCY_PER_TENANT=1, QA_GENERATION_MAX_RETRIES=0),
+        ),
+        patch.object(qa_generation_pool, "_tenant_semaphores", {}),
+        patch.object(qa_index_processor.LLMGenerator, "generate_qa_document", side_effect=_generate_qa_document),
+    ):
+        qa_documents = QAIndexProcessor().transform(
+            documents,
+            process_rule=PROCESS_RULE,
+            embedding_model_instance=model_instance,
+            token_counter=token_counter,
+            tenant_id="tenant-1",
+        )
+
+    assert [document.page_content for document in qa_documents] == ["What is alpha?", "What is beta?"]
+    assert [document.metadata["answer"].split()[0] for document in qa_documents] == ["alpha", "beta"]
+    # the segments of a QA document count the tokens of the question, not those of the source chunk
+    assert token_counter.count_documents(qa_documents) == 6
+    assert all("tokens" not in document.metadata for document in qa_documents)
+    assert qa_documents[0].metadata["source"] == "a.txt"
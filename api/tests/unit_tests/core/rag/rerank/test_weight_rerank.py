@@ -0,0 +1,156 @@
+import math
+import random
+from collections import Counter
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+from core.rag.models.document import Document
+from core.rag.rerank.entity.weight import KeywordSetting, VectorSetting, Weights
+from core.rag.rerank.weight_rerank import WeightRerankRunner
+
+DIMENSION = 256
+VOCABULARY = [f"keyword{i}" for i in range(500)]
+
+
+def _runner() -> WeightRerankRunner:
+    return WeightRerankRunner(
+        "tenant-1",
+        Weights(
+            vector_setting=VectorSetting(
+                vector_weight=0.7, embedding_provider_name="openai", embedding_model_name="text-embedding-3-small"
+            ),
+            keyword_setting=KeywordSetting(keyword_weight=0.3),
+        ),
+    )
+
+
+def _candidates(count: int) -> tuple[list[Document], dict[str, list[str]]]:
+    rng = random.Random(count)
+    documents = []
+    segments_keywords = {}
+    for i in range(count):
+        documents.append(
+            Document(
+                page_content=f"content {i}",
+                vector=np.random.rand(DIMENSION).tolist(),
+                metadata={"doc_id": f"node-{i}"},
+            )
+        )
+        segments_keywords[f"node-{i}"] = rng.sample(VOCABULARY, 10)
+    return documents, segments_keywords
+
+
+def _legacy_scores(query_keywords: set[str], documents: list[Document], query_vector: list[float]) -> list[float]:
+    """Per-document TF-IDF and cosine scoring the way the runner computed them before vectorization."""
+    documents_keywords = [document.metadata["keywords"] for document in documents]
+    total_documents = len(documents)
+    all_keywords = set()
+    for document_keywords in documents_keywords:
+        all_keywords.update(document_keywords)
+    keyword_idf = {}
+    for keyword in all_keywords:
+        doc_count_containing_keyword = sum(1 for doc_keywords in documents_keywords if keyword in doc_keywords)
+        keyword_idf[keyword] = math.log((1 + total_documents) / (1 + doc_count_containing_keyword)) + 1
+    query_tfidf = {keyword: count * keyword_idf.get(keyword, 0) for keyword, count in Counter(query_keywords).items()}
+
+    scores = []
+    for document, document_keywords in zip(documents, documents_keywords):
+        document_tfidf = {k: c * keyword_idf.get(k, 0) for k, c in Counter(document_keywords).items()}
+        numerator = sum(query_tfidf[x] * document_tfidf[x] for x in set(query_tfidf) & set(document_tfidf))
+        denominator = math.sqrt(sum(v**2 for v in query_tfidf.values())) * math.sqrt(
+            sum(v**2 for v in document_tfidf.values())
+        )
+        keyword_score = numerator / denominator if denominator else 0.0
+
+        vec1 = np.array(query_vector)
+        vec2 = np.array(document.vector)
+        vector_score = np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
+        scores.append(0.7 * vector_score + 0.3 * keyword_score)
+    return scores
+
+
+def _run(documents: list[Document], segments_keywords: dict[str, list[str]], query_keywords: set[str], query_vector):
+    session = MagicMock()
+    session.query.return_value.filter.return_value.all.return_value = list(segments_keywords.items())
+    cache_embedding = MagicMock()
+    cache_embedding.embed_query.return_value = query_vector
+    with (
+        patch("core.rag.rerank.weight_rerank.db", SimpleNamespace(session=session)),
+        patch("core.rag.rerank.weight_rerank.ModelManager"),
+        patch("core.rag.rerank.weight_rerank.CacheEmbedding", return_value=cache_embedding),
+        patch(
+            "core.rag.rerank.weight_rerank.JiebaKeywordTableHandler.extract_keywords",
+            return_value=query_keywords,
+        ),
+    ):
+        return _runner().run("query", documents)
+
+
+def test_weight_rerank_matches_per_document_scores():
+    documents, segments_keywords = _candidates(50)
+    query_keywords = set(VOCABULARY[:5]) | set(segments_keywords["node-0"][:3])
+    query_vector = np.random.rand(DIMENSION).tolist()
+    # the duplicate candidate is dropped
+    documents.append(documents[0].model_copy(deep=True))
+
+    reranked = _run(documents, segments_keywords, query_keywords, query_vector)
+
+    expected = _legacy_scores(query_keywords, documents[:50], query_vector)
+    assert len(reranked) == 50
+    assert sorted(document.metadata["score"] for document in reranked) == pytest.approx(sorted(expected))
+    assert reranked[0].metadata["score"] == pytest.approx(max(expected))
+
+
+@pytest.mark.parametrize("num_candidates", [50, 200, 1000])
+def test_weight_rerank_benchmark(benchmark, num_candidates):
+    documents, segments_keywords = _candidates(num_candidates)
+    query_keywords = set(VOCABULARY[:5])
+    query_vector = np.random.rand(DIMENSION).tolist()
+
+    def setup():
+        return ([document.model_copy(deep=True) for document in documents],), {}
+
+    reranked = benchmark.pedantic(
+        lambda candidates: _run(candidates, segments_keywords, query_keywords, query_vector), setup=setup, rounds=5
+    )
+
+    assert len(reranked) == num_candidates
+
+
+def test_hybrid_weighting_uses_the_bm25_keyword_score():
+    query_vector = [1.0, 0.0]
+    vector_results = [
+        Document(page_content="a", metadata={"doc_id": "node-a", "score": 0.5}),
+        Document(page_content="b", metadata={"doc_id": "node-b", "score": 0.5}),
+    ]
+    keyword_results = [
+        Document(page_content="b", metadata={"doc_id": "node-b", "keyword_score": 0.8}),
+        Document(page_content="c", vector=[2.0, 0.0], metadata={"doc_id": "node-c", "keyword_score": 0.4}),
+    ]
+
+    reranked = _run(vector_results + keyword_results, {"node-a": ["keyword1"]}, set(), query_vector)
+
+    # node-a was not found by the keyword search and falls back to its TF-IDF score against the query
+    assert {document.metadata["doc_id"]: document.metadata["score"] for document in reranked} == pytest.approx(
+        {"node-c": 0.7 * 1.0 + 0.3 * 0.4, "node-b": 0.7 * 0.5 + 0.3 * 0.8, "node-a": 0.7 * 0.5}
+    )
+    assert [document.metadata["doc_id"] for document in reranked] == ["node-c", "node-b", "node-a"]
+
+
+def test_keyword_extraction_is_skipped_when_every_result_has_a_bm25_score():
+    documents = [
+        Document(page_content="a", metadata={"doc_id": "node-a", "score": 0.2, "keyword_score": 1.0}),
+        Document(page_content="b", metadata={"doc_id": "node-b", "score": 0.6, "keyword_score": 0.1}),
+    ]
+
+    with patch("core.rag.rerank.weight_rerank.JiebaKeywordTableHandler") as keyword_table_handler:
+        reranked = _runner().run("query", documents)
+
+    keyword_table_handler.assert_not_called()
+    assert [document.metadata["doc_id"] for document in reranked] == ["node-b", "node-a"]
+    assert [document.metadata["score"] for document in reranked] == pytest.approx(
+        [0.7 * 0.6 + 0.3 * 0.1, 0.7 * 0.2 + 0.3 * 1.0]
+    )
@@ -0,0 +1,65 @@
+from unittest.mock import MagicMock, patch
+
+from flask import Flask
+from sqlalchemy import inspect
+
+from core.rag.models.document import Document
+from core.rag.retrieval import dataset_retrieval
+from core.rag.retrieval.dataset_retrieval import DatasetRetrieval
+from models.dataset import Dataset
+
+
+def _dataset(i):
+    return Dataset(
+        id=f"dataset-{i}",
+        tenant_id="tenant-1",
+        name=f"dataset {i}",
+        indexing_technique="high_quality",
+        index_struct='{"type": "weaviate"}',
+        retrieval_model={
+            "search_method": "semantic_search",
+            "reranking_enable": False,
+            "top_k": 2,
+            "score_threshold_enabled": False,
+        },
+    )
+
+
+def test_multiple_retrieve_passes_detached_datasets_to_the_workers():
+    datasets = [_dataset(1), _dataset(2)]
+    retrieved = []
+
+    def retrieve(retrieval_method, dataset_id, query, top_k, dataset, **kwargs):
+        retrieved.append((retrieval_method, dataset_id, dataset))
+        return [Document(page_content=query, metadata={"doc_id": f"{dataset_id}-node", "score": 0.5})]
+
+    db = MagicMock()
+    with (
+        Flask(__name__).app_context(),
+        patch.object(dataset_retrieval, "db", db),
+        patch.object(dataset_retrieval.RetrievalService, "retrieve", side_effect=retrieve),
+        patch.object(dataset_retrieval.SegmentHitCounter, "record_hits"),
+    ):
+        documents = DatasetRetrieval().multiple_retrieve(
+            app_id="app-1",
+            tenant_id="tenant-1",
+            user_id="user-1",
+            user_from="account",
+            available_datasets=datasets,
+            query="query",
+            top_k=4,
+            score_threshold=None,
+            reranking_mode="reranking_model",
+            reranking_enable=False,
+        )
+
+    # the workers do not load the datasets again
+    db.session.query.assert_not_called()
+    assert sorted(dataset_id for _, dataset_id, _ in retrieved) == ["dataset-1", "dataset-2"]
+    for retrieval_method, dataset_id, dataset in retrieved:
+        assert retrieval_method == "semantic_search"
+        assert dataset.id == dataset_id
+        assert dataset not in datasets
+        assert inspect(dataset).transient
+        assert dataset.index_struct == '{"type": "weaviate"}'
+    assert len(documents) == 2
@@ -0,0 +1,76 @@
+import threading
+import time
+
+from flask import Flask, current_app
+
+from core.rag.retrieval.retrieval_executor import RetrievalExecutor
+
+
+def _executor(max_workers: int = 4) -> RetrievalExecutor:
+    return RetrievalExecutor(max_workers=max_workers, thread_name_prefix="test_retrieval")
+
+
+def test_run_returns_results_in_task_order_within_app_context():
+    app = Flask(__name__)
+
+    def task(i):
+        time.sleep(0.01 * (3 - i))
+        return current_app.name, i
+
+    results, exceptions = _executor().run(app, [lambda i=i: task(i) for i in range(3)])
+
+    assert results == [(app.name, 0), (app.name, 1), (app.name, 2)]
+    assert exceptions == []
+
+
+def test_run_collects_exceptions():
+    def fail():
+        raise ValueError("branch failed")
+
+    results, exceptions = _executor().run(Flask(__name__), [lambda: 1, fail])
+
+    assert results == [1]
+    assert exceptions == ["branch failed"]
+
+
+def test_run_returns_partial_results_and_cancels_queued_tasks_after_timeout():
+    release = threading.Event()
+    started = []
+
+    def slow():
+        started.append("slow")
+        release.wait(1)
+        return "slow"
+
+    def queued():
+        started.append("queued")
+        return "queued"
+
+    executor = _executor(max_workers=1)
+    try:
+        begin = time.perf_counter()
+        results, exceptions = executor.run(Flask(__name__), [slow, queued], timeout=0.05)
+        elapsed = time.perf_counter() - begin
+    finally:
+        release.set()
+
+    assert elapsed < 0.5
+    assert results == []
+    assert exceptions == []
+    # the queued branch is cancelled before it starts
+    time.sleep(0.05)
+    assert started == ["slow"]
+
+
+def test_run_reuses_bounded_pool():
+    executor = _executor(max_workers=2)
+    thread_names = set()
+
+    def task():
+        thread_names.add(threading.current_thread().name)
+        time.sleep(0.01)
+
+    for _ in range(5):
+        executor.run(Flask(__name__), [task, task, task])
+
+    assert len(thread_names) <= 2
@@ -0,0 +1,113 @@
+from contextlib import nullcontext
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from core.rag.models.document import Document
+from core.rag.retrieval.segment_hit_counter import SegmentHitCounter
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self._redis = redis
+        self._commands = []
+
+    def hincrby(self, key, field, amount):
+        self._commands.append(lambda: self._redis.hincrby(key, field, amount))
+
+    def hmget(self, key, fields):
+        self._commands.append(lambda: [self._redis.hashes.get(key, {}).get(field) for field in fields])
+
+    def execute(self):
+        return [command() for command in self._commands]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.hashes = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def hincrby(self, key, field, amount):
+        values = self.hashes.setdefault(key, {})
+        values[field] = str(int(values.get(field, 0)) + amount).encode()
+
+    def exists(self, key):
+        return int(key in self.hashes)
+
+    def rename(self, src, dst):
+        self.hashes[dst] = self.hashes.pop(src)
+
+    def hgetall(self, key):
+        return {field.encode(): value for field, value in self.hashes.get(key, {}).items()}
+
+    def delete(self, key):
+        self.hashes.pop(key, None)
+
+    def lock(self, name, timeout=None, blocking_timeout=None):
+        return nullcontext()
+
+
+@pytest.fixture
+def fake_redis():
+    redis = FakeRedis()
+    with (
+        patch("core.rag.retrieval.segment_hit_counter.redis_client", redis),
+        patch(
+            "core.rag.retrieval.segment_hit_counter.dify_config",
+            SimpleNamespace(SEGMENT_HIT_COUNT_WRITE_BEHIND_ENABLED=True),
+        ),
+    ):
+        yield redis
+
+
+def _document(doc_id, dataset_id="dataset-1"):
+    return Document(page_content="content", metadata={"doc_id": doc_id, "dataset_id": dataset_id})
+
+
+def test_hits_are_accumulated_and_flushed_in_bulk(fake_redis):
+    with patch.object(SegmentHitCounter, "_apply_hits") as apply_hits:
+        SegmentHitCounter.record_hits([_document("node-1"), _document("node-2")])
+        SegmentHitCounter.record_hits([_document("node-1")])
+        apply_hits.assert_not_called()
+
+        assert SegmentHitCounter.flush() == 2
+
+    apply_hits.assert_called_once_with({"dataset-1:node-1": 2, "dataset-1:node-2": 1})
+    assert fake_redis.hashes == {}
+
+
+def test_live_hit_counts_include_pending_increments(fake_redis):
+    SegmentHitCounter.record_hits([_document("node-1"), _document("node-1"), _document("node-2", dataset_id=None)])
+    segments = [
+        SimpleNamespace(id="segment-1", dataset_id="dataset-1", index_node_id="node-1", hit_count=5),
+        SimpleNamespace(id="segment-2", dataset_id="dataset-1", index_node_id="node-2", hit_count=None),
+        SimpleNamespace(id="segment-3", dataset_id="dataset-1", index_node_id="node-3", hit_count=1),
+    ]
+
+    assert SegmentHitCounter.get_live_hit_counts(segments) == {"segment-1": 7, "segment-2": 1, "segment-3": 1}
+
+
+def test_interrupted_flush_is_applied_first(fake_redis):
+    fake_redis.hashes[SegmentHitCounter.FLUSHING_KEY] = {"dataset-1:node-1": b"3"}
+    SegmentHitCounter.record_hits([_document("node-2")])
+
+    with patch.object(SegmentHitCounter, "_apply_hits") as apply_hits:
+        SegmentHitCounter.flush()
+        SegmentHitCounter.flush()
+
+    assert [call.args[0] for call in apply_hits.call_args_list] == [{"dataset-1:node-1": 3}, {"dataset-1:node-2": 1}]
+
+
+def test_apply_hits_issues_one_update_per_increment():
+    session = MagicMock()
+    with patch("core.rag.retrieval.segment_hit_counter.db", SimpleNamespace(session=session)):
+        SegmentHitCounter._apply_hits(
+            {"dataset-1:node-1": 1, "dataset-1:node-2": 1, "dataset-1:node-3": 4, ":node-4": 1}
+        )
+
+    # increment 1 updates dataset scoped and unscoped segments, increment 4 only dataset scoped ones
+    assert session.query.return_value.filter.return_value.update.call_count == 3
+    session.commit.assert_called_once()
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import random
+import re
+
+import pytest
+
+from core.rag.splitter.fixed_text_splitter import FixedRecursiveCharacterTextSplitter
+from core.rag.splitter.text_splitter import RecursiveCharacterTextSplitter
+
+WORDS = [
+    "alpha",
+    "beta",
+    "gamma",
+    "delta",
+    "epsilon",
+    "zeta",
+    "eta",
+    "theta",
+    "iota",
+    "kappa",
+    "lambda",
+    "mu",
+    "Überstraße",
+    "数据集",
+    "検索",
+    "x" * 40,
+]
+
+# chunk count and sha256 of the chunks produced by the splitters before merging was made linear,
+# any change of the chunking shows up here
+GOLDEN_CHUNKS = {
+    "chars_small": (405, "89bdf2031c60b55fba4c3ccce9a67d2d530caf25da8d38d8fc09d2e33ffd1349"),
+    "chars_no_overlap": (159, "18a2840adc1d2312946c59a7290cce38b6fc4af4f6b4cb3488f2c2751c584c49"),
+    "chars_large_overlap": (234, "50aebd3c98b591cda0691e5de010d5cdf05ccd93569eefaa8958f2fba48a7e96"),
+    "chars_no_fixed_separator": (260, "936e184177bfa588853ca56e341df2a34ed6a374bfa0f138c26428e61e208758"),
+    "tokens_small": (211, "3435dc2435dc215e6033442e44fb82efc187aa224856a9d7436b38579a78439f"),
+    "tokens_medium": (85, "e598401f38e0d7e9bd6e1f0eb24ea8a56f7eaafca5a672f20d50c84c072ccaee"),
+    "tokens_custom_separator": (265, "f3172cfc71a11b5b808d7b3ee1922cd04aef2ed46007f15d059edb6850af5608"),
+    "tokens_tiny_chunks": (1048, "1ac37436b4d9dbfc9fca3cbdf4a0e6defc873c79b875a6cc10c6614f6db5b6a9"),
+    "recursive_chars": (261, "06b81605714164eb10adcc8047a4d5b7169fc2900599195f5d058bb5b48fa253"),
+    "recursive_tokens": (91, "7ea969a7935771f82d8daa7fc86406fa12f8b0a3c35b7ceb0dbadd1d0dafc409"),
+}
+
+
+def _make_text(seed: int, paragraphs: int) -> str:
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(paragraphs):
+        lines = []
+        for _ in range(rng.randint(1, 6)):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(1, 60))]
+            if rng.random() < 0.1:
+                # a long run without any separator forces the character level split
+                words.append("y" * rng.randint(50, 400))
+            lines.append(" ".join(words))
+        parts.append("\n".join(lines))
+    separators = ["\n\n", "\n\n\n", "\n \n"]
+    return "".join(part + rng.choice(separators) for part in parts)
+
+
+def _token_length(text: str) -> int:
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+
+def _digest(chunks: list[str]) -> tuple[int, str]:
+    return len(chunks), hashlib.sha256(json.dumps(chunks, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+@pytest.mark.parametrize(
+    ("name", "seed", "paragraphs", "chunk_size", "chunk_overlap", "length_function", "fixed_separator"),
+    [
+        ("chars_small", 1, 30, 100, 20, len, "\n\n"),
+        ("chars_no_overlap", 2, 30, 250, 0, len, "\n\n"),
+        ("chars_large_overlap", 3, 40, 300, 250, len, "\n\n"),
+        ("chars_no_fixed_separator", 4, 40, 200, 50, len, ""),
+        ("tokens_small", 5, 40, 30, 5, _token_length, "\n\n"),
+        ("tokens_medium", 6, 60, 120, 30, _token_length, "\n\n"),
+        ("tokens_custom_separator", 7, 60, 80, 10, _token_length, "\n"),
+        ("tokens_tiny_chunks", 8, 20, 3, 1, _token_length, "\n\n"),
+    ],
+)
+def test_fixed_splitter_golden_chunks(
+    name, seed, paragraphs, chunk_size, chunk_overlap, length_function, fixed_separator
+):
+    splitter = FixedRecursiveCharacterTextSplitter(
+        fixed_separator=fixed_separator,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=length_function,
+    )
+
+    assert _digest(splitter.split_text(_make_text(seed, paragraphs))) == GOLDEN_CHUNKS[name]
+
+
+@pytest.mark.parametrize(
+    ("name", "seed", "chunk_size", "chunk_overlap", "length_function", "keep_separator"),
+    [
+        ("recursive_chars", 11, 200, 40, len, True),
+        ("recursive_tokens", 12, 60, 15, _token_length, False),
+    ],
+)
+def test_recursive_splitter_golden_chunks(name, seed, chunk_size, chunk_overlap, length_function, keep_separator):
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=length_function,
+        keep_separator=keep_separator,
+    )
+
+    assert _digest(splitter.split_text(_make_text(seed, 40))) == GOLDEN_CHUNKS[name]
+
+
+def test_every_fragment_is_measured_once():
+    calls = 0
+
+    def counting_length(text: str) -> int:
+        nonlocal calls
+        calls += 1
+        return len(text)
+
+    words = 20_000
+    splitter = FixedRecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=250, length_function=counting_length)
+    chunks = splitter.split_text(" ".join(["word"] * words))
+
+    # the fixed chunk, every word and the separator of the single merge
+    assert calls == words + 2
+    assert all(len(chunk) <= 500 for chunk in chunks)
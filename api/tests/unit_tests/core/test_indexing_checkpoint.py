@@ -0,0 +1,132 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from core import indexing_checkpoint
+from core.indexing_checkpoint import IndexingCheckpoint
+from core.rag.extractor import extracted_text_cache
+from core.rag.extractor.extracted_text_cache import ExtractedTextCache
+from core.rag.models.document import Document
+
+
+class FakeStorage:
+    def __init__(self):
+        self.files = {}
+
+    def save(self, filename, data):
+        self.files[filename] = data
+
+    def load_once(self, filename):
+        return self.files[filename]
+
+    def exists(self, filename):
+        return filename in self.files
+
+    def delete(self, filename):
+        self.files.pop(filename, None)
+
+
+def _document(**kwargs):
+    fields = {
+        "id": "document-1",
+        "dataset_id": "dataset-1",
+        "data_source_type": "upload_file",
+        "data_source_info": '{"upload_file_id": "file-1"}',
+        "dataset_process_rule_id": "rule-1",
+        "doc_form": "text_model",
+    }
+    fields.update(kwargs)
+    return SimpleNamespace(**fields)
+
+
+@pytest.fixture
+def fake_storage():
+    fake = FakeStorage()
+    with (
+        patch.object(indexing_checkpoint, "storage", fake),
+        patch.object(extracted_text_cache, "storage", fake),
+        patch.object(extracted_text_cache, "redis_client", MagicMock()),
+    ):
+        yield fake
+
+
+def _segments(count):
+    segment_model = MagicMock()
+    segment_model.query.filter_by.return_value.count.return_value = count
+    return patch.object(indexing_checkpoint, "DocumentSegment", segment_model)
+
+
+def test_extracted_round_trip(fake_storage):
+    checkpoint = IndexingCheckpoint(_document())
+    assert checkpoint.load_extracted() is None
+
+    checkpoint.save_extracted([Document(page_content="page one", metadata={"page": 1})])
+
+    text_docs = IndexingCheckpoint(_document()).load_extracted()
+    assert [(doc.page_content, doc.metadata) for doc in text_docs] == [("page one", {"page": 1})]
+
+
+def test_extracted_checkpoint_references_the_extracted_text_cache(fake_storage):
+    cache = ExtractedTextCache.from_file_key("extracted_text_cache/tenant-1/hash-1/default-pdf-v1.json")
+    text_docs = [Document(page_content="page one " * 100, metadata={"page": 1})]
+    with patch.object(extracted_text_cache, "dify_config", SimpleNamespace(EXTRACTED_TEXT_CACHE_MAX_SIZE=100_000)):
+        cache.set(text_docs)
+
+    IndexingCheckpoint(_document()).save_extracted(text_docs, cache)
+
+    # the checkpoint does not hold a second copy of the text
+    checkpoint_file = fake_storage.files["indexing_checkpoints/dataset-1/document-1/extracted.json"]
+    assert b"page one" not in checkpoint_file
+    loaded = IndexingCheckpoint(_document()).load_extracted()
+    assert [(doc.page_content, doc.metadata) for doc in loaded] == [("page one " * 100, {"page": 1})]
+
+    # an evicted entry is parsed again
+    fake_storage.delete(cache.file_key)
+    assert IndexingCheckpoint(_document()).load_extracted() is None
+
+
+def test_text_missing_from_the_cache_is_checkpointed(fake_storage):
+    cache = ExtractedTextCache.from_file_key("extracted_text_cache/tenant-1/hash-1/default-pdf-v1.json")
+
+    IndexingCheckpoint(_document()).save_extracted([Document(page_content="page one", metadata={})], cache)
+
+    assert [doc.page_content for doc in IndexingCheckpoint(_document()).load_extracted()] == ["page one"]
+
+
+def test_checkpoint_of_another_source_or_rule_is_ignored(fake_storage):
+    IndexingCheckpoint(_document()).save_extracted([Document(page_content="page one", metadata={})])
+
+    assert IndexingCheckpoint(_document(data_source_info='{"upload_file_id": "file-2"}')).load_extracted() is None
+    assert IndexingCheckpoint(_document(dataset_process_rule_id="rule-2")).load_extracted() is None
+
+
+def test_is_split_requires_all_segments_stored(fake_storage):
+    checkpoint = IndexingCheckpoint(_document())
+    with _segments(3):
+        assert not checkpoint.is_split()
+
+    checkpoint.save_split(3)
+    with _segments(3):
+        assert checkpoint.is_split()
+    with _segments(2):
+        assert not checkpoint.is_split()
+
+
+def test_clear_removes_every_stage(fake_storage):
+    checkpoint = IndexingCheckpoint(_document())
+    checkpoint.save_extracted([Document(page_content="page one", metadata={})])
+    checkpoint.save_split(1)
+
+    checkpoint.clear()
+
+    assert fake_storage.files == {}
+
+
+def test_storage_errors_do_not_fail_indexing(fake_storage):
+    fake_storage.save = MagicMock(side_effect=OSError("storage unavailable"))
+    checkpoint = IndexingCheckpoint(_document())
+
+    checkpoint.save_extracted([Document(page_content="page one", metadata={})])
+
+    assert checkpoint.load_extracted() is None
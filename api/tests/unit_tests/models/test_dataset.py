@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from models.dataset import Dataset
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def setex(self, key, ttl, value):
+        self.data[key] = str(value).encode()
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+
+@pytest.fixture
+def fake_redis():
+    redis = FakeRedis()
+    with (
+        patch("models.dataset.redis_client", redis),
+        patch("models.dataset.dify_config", SimpleNamespace(DATASET_AVAILABLE_COUNT_CACHE_TTL=300)),
+    ):
+        yield redis
+
+
+def _count(value):
+    calls = []
+
+    def count_func():
+        calls.append(1)
+        return value
+
+    return count_func, calls
+
+
+def test_available_count_is_cached_until_invalidated(fake_redis):
+    dataset = Dataset(id="dataset-1")
+    count_func, calls = _count(42)
+
+    assert dataset._get_available_count("segment", count_func) == 42
+    assert dataset._get_available_count("segment", count_func) == 42
+    assert len(calls) == 1
+
+    Dataset.invalidate_available_counts("dataset-1")
+
+    assert dataset._get_available_count("segment", count_func) == 42
+    assert len(calls) == 2
+
+
+def test_zero_available_count_is_not_cached(fake_redis):
+    dataset = Dataset(id="dataset-1")
+    count_func, calls = _count(0)
+
+    assert dataset._get_available_count("document", count_func) == 0
+    assert dataset._get_available_count("document", count_func) == 0
+    assert len(calls) == 2
+    assert fake_redis.data == {}
+
+
+def test_available_count_cache_can_be_disabled(fake_redis):
+    dataset = Dataset(id="dataset-1")
+    count_func, calls = _count(7)
+
+    with patch("models.dataset.dify_config", SimpleNamespace(DATASET_AVAILABLE_COUNT_CACHE_TTL=0)):
+        dataset._get_available_count("document", count_func)
+        dataset._get_available_count("document", count_func)
+
+    assert len(calls) == 2
+    assert fake_redis.data == {}
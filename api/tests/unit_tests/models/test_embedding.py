@@ -0,0 +1,40 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from models.dataset import Embedding
+
+
+def test_compact_embedding_round_trip():
+    vector = np.random.rand(1536).tolist()
+
+    encoded = Embedding.encode_embedding(vector, "float32")
+    decoded = Embedding.decode_embedding(encoded)
+
+    assert Embedding.is_compact_embedding(encoded)
+    assert len(encoded) == Embedding.COMPACT_HEADER.size + 1536 * 4
+    assert decoded.dtype == np.float32
+    assert np.allclose(decoded, vector, atol=1e-6)
+
+
+def test_compact_embedding_float16():
+    vector = np.random.rand(768).tolist()
+
+    encoded = Embedding.encode_embedding(vector, "float16")
+
+    assert len(encoded) == Embedding.COMPACT_HEADER.size + 768 * 2
+    assert np.allclose(Embedding.decode_embedding(encoded), vector, atol=1e-3)
+
+
+def test_pickled_embedding_is_still_readable():
+    vector = [0.1, 0.2, 0.3]
+    embedding = Embedding(embedding=pickle.dumps(vector, protocol=pickle.HIGHEST_PROTOCOL))
+
+    assert not Embedding.is_compact_embedding(embedding.embedding)
+    assert embedding.get_embedding() == vector
+
+
+def test_unsupported_embedding_dtype():
+    with pytest.raises(ValueError):
+        Embedding.encode_embedding([0.1, 0.2], "float64")
@@ -0,0 +1,81 @@
+from unittest.mock import MagicMock, patch
+
+from models.account import Account
+from models.model import AppModelConfig, Conversation, EndUser, Message, MessageAnnotation, MessageFeedback
+from services import conversation_service
+from services.conversation_service import ConversationService
+
+
+class FakeQuery:
+    """Returns the rows given for the first entity queried, whatever the filters."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def filter(self, *args):
+        return self
+
+    def group_by(self, *args):
+        return self
+
+    def distinct(self, *args):
+        return self
+
+    def order_by(self, *args):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+def _fake_db(rows):
+    db = MagicMock()
+    queried = []
+
+    def query(entity, *args):
+        queried.append(entity)
+        return FakeQuery(next((entity_rows for key, entity_rows in rows if key is entity), []))
+
+    db.session.query.side_effect = query
+    return db, queried
+
+
+def test_relations_of_a_page_are_loaded_in_one_query_each():
+    first = Conversation(id="conversation-1", from_end_user_id="end-user-1", app_model_config_id="config-1")
+    second = Conversation(id="conversation-2", from_account_id="account-1", app_model_config_id="config-1")
+    account = Account(id="account-1", name="admin")
+    app_model_config = AppModelConfig(id="config-1")
+    first_message = Message(id="message-1", conversation_id="conversation-1")
+    annotation = MessageAnnotation(id="annotation-1", conversation_id="conversation-2", account_id="account-1")
+    rows = [
+        (Message.conversation_id, [("conversation-1", 3)]),
+        (
+            MessageFeedback.conversation_id,
+            [("conversation-1", "user", "like", 2), ("conversation-1", "admin", "dislike", 1)],
+        ),
+        (Message, [first_message]),
+        (MessageAnnotation, [annotation]),
+        (EndUser.id, [("end-user-1", "session-1")]),
+        (Account, [account]),
+        (AppModelConfig, [app_model_config]),
+    ]
+    db, queried = _fake_db(rows)
+
+    with patch.object(conversation_service, "db", db):
+        ConversationService.load_relations([first, second])
+
+        assert first.message_count == 3
+        assert second.message_count == 0
+        assert first.user_feedback_stats == {"like": 2, "dislike": 0}
+        assert first.admin_feedback_stats == {"like": 0, "dislike": 1}
+        assert second.user_feedback_stats == {"like": 0, "dislike": 0}
+        assert first.first_message is first_message
+        assert second.first_message is None
+        assert not first.annotated
+        assert second.annotated
+        assert second.annotation.account is account
+        assert first.from_end_user_session_id == "session-1"
+        assert second.from_account_name == "admin"
+        assert first.app_model_config is second.app_model_config is app_model_config
+
+    assert len(queried) == len(rows)
@@ -0,0 +1,161 @@
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy.sql import operators
+
+from models import model
+from models.account import Account
+from models.model import (
+    AppAnnotationHitHistory,
+    DatasetRetrieverResource,
+    Message,
+    MessageAgentThought,
+    MessageAnnotation,
+    MessageFeedback,
+    MessageFile,
+)
+from services import message_service
+from services.message_service import MessageService
+
+PREFETCHED_PROPERTIES = [
+    "feedbacks",
+    "user_feedback",
+    "admin_feedback",
+    "annotation",
+    "annotation_hit_history",
+    "agent_thoughts",
+    "retriever_resources",
+    "message_files",
+]
+
+
+class FakeQuery:
+    """Evaluates the equality and IN filters and the ordering of a query against the rows of a FakeSession."""
+
+    def __init__(self, session, model):
+        self.session = session
+        self.model = model
+        self.criteria = []
+        self.order_keys = []
+
+    def filter(self, *criteria):
+        self.criteria.extend(criteria)
+        return self
+
+    def order_by(self, *clauses):
+        self.order_keys.extend(clause.element.key for clause in clauses)
+        return self
+
+    def _matches(self, row, criterion):
+        value = getattr(row, criterion.left.key)
+        if criterion.operator is operators.eq:
+            return value == criterion.right.value
+        if criterion.operator is operators.in_op:
+            return value in criterion.right.value
+        if criterion.operator is operators.is_:
+            # comparing with None, e.g. the account of a feedback left by an end user
+            return value is None
+        raise NotImplementedError(criterion.operator)
+
+    def all(self):
+        self.session.queries += 1
+        rows = [
+            row
+            for row in self.session.rows.get(self.model, [])
+            if all(self._matches(row, criterion) for criterion in self.criteria)
+        ]
+        return sorted(rows, key=lambda row: [getattr(row, key) for key in self.order_keys])
+
+    def first(self):
+        rows = self.all()
+        return rows[0] if rows else None
+
+
+class FakeSession:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = 0
+
+    def query(self, model):
+        return FakeQuery(self, model)
+
+
+@pytest.fixture
+def session():
+    accounts = [Account(id="account-1", name="admin"), Account(id="account-2", name="editor")]
+    annotations = [
+        MessageAnnotation(id="annotation-1", message_id="message-1", account_id="account-1"),
+        MessageAnnotation(id="annotation-2", message_id=None, account_id="account-2"),
+    ]
+    rows = {
+        Account: accounts,
+        MessageFeedback: [
+            MessageFeedback(id="feedback-1", message_id="message-1", from_source="user", rating="like"),
+            MessageFeedback(
+                id="feedback-2",
+                message_id="message-1",
+                from_source="admin",
+                rating="dislike",
+                from_account_id="account-2",
+            ),
+            MessageFeedback(id="feedback-3", message_id="message-3", from_source="user", rating="dislike"),
+        ],
+        MessageAnnotation: annotations,
+        AppAnnotationHitHistory: [
+            AppAnnotationHitHistory(id="hit-1", message_id="message-2", annotation_id="annotation-2"),
+        ],
+        MessageAgentThought: [
+            MessageAgentThought(id="thought-2", message_id="message-1", position=2),
+            MessageAgentThought(id="thought-1", message_id="message-1", position=1),
+            MessageAgentThought(id="thought-3", message_id="message-2", position=1),
+        ],
+        DatasetRetrieverResource: [
+            DatasetRetrieverResource(id="resource-1", message_id="message-2", position=1),
+        ],
+        MessageFile: [
+            MessageFile(id="file-1", message_id="message-3", type="image"),
+            MessageFile(id="file-2", message_id="message-3", type="image"),
+        ],
+    }
+    session = FakeSession(rows)
+    db = type("FakeDb", (), {"session": session})
+    with patch.object(message_service, "db", db), patch.object(model, "db", db):
+        yield session
+
+
+def _messages():
+    return [Message(id=f"message-{i}", conversation_id="conversation-1") for i in range(1, 5)]
+
+
+def test_prefetched_relations_match_the_queries_of_the_properties(session):
+    expected = {}
+    for message in _messages():
+        expected[message.id] = {name: getattr(message, name) for name in PREFETCHED_PROPERTIES}
+        expected[message.id]["feedback_accounts"] = [feedback.from_account for feedback in message.feedbacks]
+        annotation = message.annotation or message.annotation_hit_history
+        expected[message.id]["annotation_account"] = annotation.account if annotation else None
+
+    messages = _messages()
+    session.queries = 0
+    MessageService.load_relations(messages)
+
+    # one query per relation for the whole page, the hit annotations and the accounts
+    assert session.queries == 8
+
+    queries = session.queries
+    for message in messages:
+        actual = {name: getattr(message, name) for name in PREFETCHED_PROPERTIES}
+        actual["feedback_accounts"] = [feedback.from_account for feedback in message.feedbacks]
+        annotation = message.annotation or message.annotation_hit_history
+        actual["annotation_account"] = annotation.account if annotation else None
+        assert actual == expected[message.id], message.id
+    # the properties read the prefetched values
+    assert session.queries == queries
+
+    first, second, third, fourth = messages
+    assert [thought.id for thought in first.agent_thoughts] == ["thought-1", "thought-2"]
+    assert first.admin_feedback.from_account.name == "editor"
+    assert second.annotation_hit_history.account.name == "editor"
+    assert [file.id for file in third.message_files] == ["file-1", "file-2"]
+    assert fourth.feedbacks == []
+    assert fourth.annotation is None